@@ -0,0 +1,380 @@
+#-------------------------------------------------------------------------------
+# Name:        AGOL Stub Server
+# Purpose:  Stands in for an ArcGIS Online org so the capture can be run and
+#           timed without touching a live org. Serves the sharing/rest
+#           endpoints the scripts call against a synthetic org, with adjustable
+#           latency, throttling & error injection.
+#
+#           Run on its own:  python agolStub.py --items 10000 --latency 50
+#           then point portal_URL in captureData.py at http://127.0.0.1:8470/
+#
+# Author:      John Spence
+#
+#
+#
+# Created:  10/19/2026
+# Modified:
+# Modification Purpose:
+#
+#
+#-------------------------------------------------------------------------------
+
+# 888888888888888888888888888888888888888888888888888888888888888888888888888888
+# ------------------------------- Configuration --------------------------------
+
+stubHost = '127.0.0.1'
+stubPort = 8470
+stubItems = 1000 #Size of the synthetic org. Try 1000, 10000 or 50000.
+stubSeed = 1 #Same seed, same org.
+stubLatencyMS = 50 #Average delay added to every response.
+stubJitterMS = 20 #Random spread around the average delay.
+stubRequestsPerSecond = None #Requests over this rate get a 429. None for no limit.
+stubErrorRate = 0.0 #Share of requests that fail with a 500, e.g. 0.01.
+stubDormantShare = 0.4 #Share of items that never see any usage.
+
+# ------------------------------------------------------------------------------
+# DO NOT UPDATE BELOW THIS LINE OR RISK DOOM AND DISPAIR!  Have a nice day!
+# ------------------------------------------------------------------------------
+
+import hashlib
+import http.server
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+
+itemTypes = ['Web Map', 'Feature Service', 'Map Service', 'Web Mapping Application', 'Dashboard',
+             'Web Experience', 'Hub Site Application', 'Shapefile', 'CSV', 'PDF', 'Image', 'Form']
+itemOwners = ['gis_admin', 'jsmith', 'mjones', 'planning_gis', 'utilities_gis', 'parks_gis',
+              'transport_gis', 'public_works', 'police_gis', 'fire_gis']
+stubPortalID = 'StubOrg0000000001'
+searchLimit = 10000 #Like the real portal, paging stops at this many results per search.
+createdRange = re.compile(r'created:\s*\[(\d+) TO (\d+)\]', re.IGNORECASE)
+
+#-------------------------------------------------------------------------------
+#
+#
+#                                 Functions
+#
+#
+#-------------------------------------------------------------------------------
+
+def buildOrg(itemCount, seed):
+#-------------------------------------------------------------------------------
+# Name:        Function - buildOrg
+# Purpose:  Makes a repeatable synthetic org of itemCount items.
+#-------------------------------------------------------------------------------
+
+    orgRandom = random.Random(seed)
+    orgNow = int(time.time() * 1000)
+    dayMS = 86400000
+
+    orgItems = []
+    for itemNumber in range(itemCount):
+        itemID = hashlib.md5('{}:{}'.format(seed, itemNumber).encode('utf-8')).hexdigest()
+        created = orgNow - orgRandom.randint(30, 2000) * dayMS
+        modified = min(orgNow, created + orgRandom.randint(0, 1500) * dayMS)
+        if orgRandom.random() < stubDormantShare:
+            dailyUsage = 0
+        else:
+            dailyUsage = int(orgRandom.paretovariate(1.2) * 5)
+
+        orgItems.append({'id': itemID,
+                         'owner': orgRandom.choice(itemOwners),
+                         'created': created,
+                         'modified': modified,
+                         'title': 'Stub Item {}'.format(itemNumber),
+                         'type': orgRandom.choice(itemTypes),
+                         'typeKeywords': ['Stub'],
+                         'description': '<p>Synthetic item {} for benchmarking.</p>'.format(itemNumber),
+                         'tags': ['stub', 'benchmark'],
+                         'snippet': 'Synthetic item {}'.format(itemNumber),
+                         'licenseInfo': None,
+                         'accessInformation': None,
+                         'access': orgRandom.choice(['public', 'org', 'private', 'shared']),
+                         'size': orgRandom.randint(1000, 50000000),
+                         'numViews': dailyUsage * orgRandom.randint(100, 700),
+                         'numRatings': 0,
+                         'avgRating': 0,
+                         'protected': False,
+                         'contentStatus': None,
+                         'scoreCompleteness': orgRandom.randint(10, 100),
+                         'url': None,
+                         'dailyUsage': dailyUsage})
+
+    return (orgItems)
+
+def getUsage(item, startTime):
+#-------------------------------------------------------------------------------
+# Name:        Function - getUsage
+# Purpose:  Usage for an item on a given day. Varies by day but never changes
+#           between calls, so reruns see the same numbers.
+#-------------------------------------------------------------------------------
+
+    if item['dailyUsage'] == 0:
+        return (0)
+
+    dayHash = hashlib.md5('{}:{}'.format(item['id'], int(startTime) // 86400000).encode('utf-8')).digest()
+
+    return (item['dailyUsage'] * (dayHash[0] % 20) // 10)
+
+class StubState():
+#-------------------------------------------------------------------------------
+# Name:        Class - StubState
+# Purpose:  The org plus the fault settings & request counters, shared by every
+#           handler thread.
+#-------------------------------------------------------------------------------
+
+    def __init__(self, itemCount, seed, latencyMS, jitterMS, requestsPerSecond, errorRate):
+        self.items = buildOrg(itemCount, seed)
+        self.itemIndex = {item['id']: item for item in self.items}
+        self.latencyMS = latencyMS
+        self.jitterMS = jitterMS
+        self.requestsPerSecond = requestsPerSecond
+        self.errorRate = errorRate
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.windowStart = time.time()
+        self.windowCount = 0
+        self.stats = {}
+
+    def admit(self):
+        # Fixed one second window, like the per-second caps AGOL hands out.
+        with self.lock:
+            if self.requestsPerSecond == None:
+                return (True)
+            now = time.time()
+            if now - self.windowStart >= 1:
+                self.windowStart = now
+                self.windowCount = 0
+            self.windowCount += 1
+            return (self.windowCount <= self.requestsPerSecond)
+
+    def failNow(self):
+        with self.lock:
+            return (self.random.random() < self.errorRate)
+
+    def delay(self):
+        with self.lock:
+            delayMS = max(0, self.latencyMS + self.random.uniform(-self.jitterMS, self.jitterMS))
+        if delayMS > 0:
+            time.sleep (delayMS / 1000.0)
+
+    def count(self, endpoint, status, elapsed):
+        with self.lock:
+            endpointStats = self.stats.setdefault(endpoint, {'requests': 0, 'throttled': 0, 'errors': 0, 'seconds': 0.0})
+            endpointStats['requests'] += 1
+            endpointStats['seconds'] += elapsed
+            if status == 429:
+                endpointStats['throttled'] += 1
+            elif status >= 500:
+                endpointStats['errors'] += 1
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+#-------------------------------------------------------------------------------
+# Name:        Class - StubHandler
+# Purpose:  Routes sharing/rest requests to the synthetic org.
+#-------------------------------------------------------------------------------
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        return
+
+    def do_GET(self):
+        self.answer(urllib.parse.urlsplit(self.path).query)
+
+    def do_POST(self):
+        bodyLength = int(self.headers.get('Content-Length', 0))
+        self.answer(self.rfile.read(bodyLength).decode('utf-8'))
+
+    def answer(self, bodyQuery):
+        requestStart = time.time()
+        state = self.server.state
+        path = urllib.parse.urlsplit(self.path).path
+        params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+        params.update(urllib.parse.parse_qsl(bodyQuery))
+
+        endpoint, payload = routeRequest(state, path, params)
+
+        if endpoint == 'stub/stats':
+            status = 200
+        elif state.admit() == False:
+            status = 429
+            payload = {'error': {'code': 429, 'message': 'Too many requests.'}}
+        elif state.failNow() == True:
+            status = 500
+            payload = {'error': {'code': 500, 'message': 'Injected failure.'}}
+        elif payload == None:
+            status = 404
+            payload = {'error': {'code': 404, 'message': 'Not found.'}}
+        else:
+            status = 200
+
+        if endpoint != 'stub/stats':
+            state.delay()
+
+        responseBody = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(responseBody)))
+        self.end_headers()
+        self.wfile.write(responseBody)
+
+        if endpoint != 'stub/stats':
+            state.count(endpoint, status, time.time() - requestStart)
+
+def routeRequest(state, path, params):
+#-------------------------------------------------------------------------------
+# Name:        Function - routeRequest
+# Purpose:  Works out which endpoint was asked for & builds its response.
+#           Hands back (endpoint, payload). Payload is None when not found.
+#-------------------------------------------------------------------------------
+
+    pathParts = [part for part in path.split('/') if part != '']
+    if len(pathParts) >= 2 and pathParts[0] == 'stub' and pathParts[1] == 'stats':
+        with state.lock:
+            stubStats = {endpoint: dict(endpointStats) for endpoint, endpointStats in state.stats.items()}
+        return ('stub/stats', {'stats': stubStats, 'items': len(state.items)})
+
+    if pathParts[:2] == ['sharing', 'rest']:
+        pathParts = pathParts[2:]
+
+    if pathParts == [] or pathParts == ['info']:
+        return ('info', {'owningSystemUrl': '',
+                         'authInfo': {'isTokenBasedSecurity': True,
+                                      'tokenServicesUrl': '/sharing/rest/generateToken'}})
+
+    if pathParts == ['generateToken']:
+        expiration = int(params.get('expiration', 120))
+        return ('generateToken', {'token': 'stub-{}'.format(hashlib.md5(params.get('username', '').encode('utf-8')).hexdigest()),
+                                  'expires': int((time.time() + expiration * 60) * 1000),
+                                  'ssl': False})
+
+    if pathParts == ['portals', 'self']:
+        return ('portals/self', {'id': stubPortalID,
+                                 'name': 'Stub Org',
+                                 'isPortal': False,
+                                 'currentVersion': '2024.1',
+                                 'urlKey': 'stub',
+                                 'customBaseUrl': 'maps.arcgis.com',
+                                 'user': {'username': 'stub_admin', 'role': 'org_admin', 'orgId': stubPortalID}})
+
+    if pathParts == ['community', 'self']:
+        return ('community/self', {'username': 'stub_admin', 'role': 'org_admin', 'orgId': stubPortalID,
+                                   'privileges': ['portal:admin:viewItems', 'portal:admin:viewUsers']})
+
+    if pathParts == ['search']:
+        start = max(1, int(params.get('start', 1)))
+        num = min(100, int(params.get('num', 10)))
+        searchItems = state.items
+        rangeMatch = createdRange.search(params.get('q', ''))
+        if rangeMatch != None:
+            searchItems = [item for item in searchItems if int(rangeMatch.group(1)) <= item['created'] <= int(rangeMatch.group(2))]
+        if params.get('sortField', '') == 'created':
+            searchItems = sorted(searchItems, key=lambda item: item['created'], reverse=params.get('sortOrder', 'asc') == 'desc')
+        results = [publicItem(item) for item in searchItems[start - 1:min(start - 1 + num, searchLimit)]]
+        nextStart = start + len(results) if start - 1 + num < min(len(searchItems), searchLimit) else -1
+        return ('search', {'query': params.get('q', ''), 'total': len(searchItems), 'start': start,
+                           'num': len(results), 'nextStart': nextStart, 'results': results})
+
+    if len(pathParts) == 3 and pathParts[0] == 'portals' and pathParts[2] == 'usage':
+        item = state.itemIndex.get(params.get('name', ''))
+        if item == None:
+            return ('portals/usage', {'data': []})
+        startTime = int(params.get('startTime', 0))
+        usage = getUsage(item, startTime)
+        if usage == 0:
+            usageData = []
+        else:
+            usageData = [{'etype': 'svcusg', 'name': item['id'], 'num': [[str(startTime), str(usage)]]}]
+        return ('portals/usage', {'startTime': startTime, 'endTime': int(params.get('endTime', 0)),
+                                  'period': params.get('period', '1d'), 'data': usageData})
+
+    if len(pathParts) >= 3 and pathParts[:2] == ['content', 'items']:
+        item = state.itemIndex.get(pathParts[2])
+        if item == None:
+            return ('content/items', None)
+        if len(pathParts) == 3:
+            return ('content/items', publicItem(item))
+        if pathParts[3] == 'description':
+            return ('content/items/description', {'description': item['description']})
+        if pathParts[3] == 'data':
+            if item['type'] == 'Web Map':
+                return ('content/items/data', {'operationalLayers': [], 'baseMap': {'baseMapLayers': [], 'title': 'Topographic'},
+                                               'spatialReference': {'wkid': 102100}, 'version': '2.28'})
+            return ('content/items/data', {'values': {}, 'source': item['id']})
+
+    return ('unknown', None)
+
+def publicItem(item):
+#-------------------------------------------------------------------------------
+# Name:        Function - publicItem
+# Purpose:  The item as AGOL would return it, without the stub's own fields.
+#-------------------------------------------------------------------------------
+
+    return ({key: value for key, value in item.items() if key != 'dailyUsage'})
+
+def startStub(itemCount=None, port=None, latencyMS=None, requestsPerSecond=-1, errorRate=None):
+#-------------------------------------------------------------------------------
+# Name:        Function - startStub
+# Purpose:  Starts the stub on a background thread & hands back the server.
+#           Anything not passed falls back to the configuration above. Port 0
+#           picks a free port.
+#-------------------------------------------------------------------------------
+
+    if requestsPerSecond == -1:
+        requestsPerSecond = stubRequestsPerSecond
+
+    state = StubState(itemCount if itemCount != None else stubItems,
+                      stubSeed,
+                      latencyMS if latencyMS != None else stubLatencyMS,
+                      stubJitterMS,
+                      requestsPerSecond,
+                      errorRate if errorRate != None else stubErrorRate)
+
+    server = http.server.ThreadingHTTPServer((stubHost, port if port != None else stubPort), StubHandler)
+    server.daemon_threads = True
+    server.state = state
+
+    serverThread = threading.Thread(target=server.serve_forever, daemon=True)
+    serverThread.start()
+
+    return (server)
+
+def readArgument(flag, default, convert):
+#-------------------------------------------------------------------------------
+# Name:        Function - readArgument
+# Purpose:  Reads the value following a command line flag.
+#-------------------------------------------------------------------------------
+
+    if flag in sys.argv:
+        return (convert(sys.argv[sys.argv.index(flag) + 1]))
+
+    return (default)
+
+#-------------------------------------------------------------------------------
+#
+#
+#                                 MAIN SCRIPT
+#
+#
+#-------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    server = startStub(readArgument('--items', stubItems, int),
+                       readArgument('--port', stubPort, int),
+                       readArgument('--latency', stubLatencyMS, float),
+                       readArgument('--rate', stubRequestsPerSecond, int),
+                       readArgument('--errors', stubErrorRate, float))
+
+    print ('AGOL stub serving {} items on http://{}:{}/'.format(len(server.state.items), stubHost, server.server_address[1]))
+    print ('Counters at http://{}:{}/stub/stats.  Ctrl+C to stop.'.format(stubHost, server.server_address[1]))
+    try:
+        while True:
+            time.sleep (1)
+    except KeyboardInterrupt:
+        server.shutdown()
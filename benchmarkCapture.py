@@ -0,0 +1,157 @@
+#-------------------------------------------------------------------------------
+# Name:        Capture Benchmark
+# Purpose:  Runs captureData.main() end to end against the AGOL stub for a few
+#           org sizes and reports run time plus per phase & per endpoint
+#           throughput. Uses a throw away SQLite database, so no SQL Server or
+#           live org is touched.
+#
+#           python benchmarkCapture.py
+#           python benchmarkCapture.py --items 10000 --latency 80 --rate 200
+#
+# Author:      John Spence
+#
+#
+#
+# Created:  10/19/2026
+# Modified:
+# Modification Purpose:
+#
+#
+#-------------------------------------------------------------------------------
+
+# 888888888888888888888888888888888888888888888888888888888888888888888888888888
+# ------------------------------- Configuration --------------------------------
+
+benchOrgSizes = [1000, 10000, 50000] #Synthetic org sizes to run.
+benchLatencyMS = 50 #Average stub response delay.
+benchRequestsPerSecond = None #Stub throttle. None for no limit.
+benchErrorRate = 0.0 #Share of stub requests that fail.
+benchBackfill = 0 #Set to 1 to include a backfill pass in each run.
+benchFolder = None #Where the benchmark databases go. None for a temp folder.
+
+# ------------------------------------------------------------------------------
+# DO NOT UPDATE BELOW THIS LINE OR RISK DOOM AND DISPAIR!  Have a nice day!
+# ------------------------------------------------------------------------------
+
+import base64
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import urllib.request
+
+import agolStub
+import captureData
+import runStats
+
+#-------------------------------------------------------------------------------
+#
+#
+#                                 Functions
+#
+#
+#-------------------------------------------------------------------------------
+
+def runBenchmark(itemCount, latencyMS, requestsPerSecond, errorRate, dbFolder):
+#-------------------------------------------------------------------------------
+# Name:        Function - runBenchmark
+# Purpose:  One capture run against a fresh stub org & database.
+#-------------------------------------------------------------------------------
+
+    server = agolStub.startStub(itemCount, 0, latencyMS, requestsPerSecond, errorRate)
+    stubURL = 'http://{}:{}/'.format(server.server_address[0], server.server_address[1])
+
+    dbPath = os.path.join(dbFolder, 'bench_{}.db'.format(itemCount))
+    if os.path.exists(dbPath):
+        os.remove(dbPath)
+
+    captureData.portal_URL = stubURL
+    captureData.portal_uName = 'stub_admin'
+    captureData.portal_pWord = base64.b64encode(b'stub').decode('utf-8')
+    captureData.portalList = []
+    captureData.portalRequestsPerSecond = None
+    captureData.dbBackend = 'sqlite'
+    captureData.db_conn = dbPath
+    captureData.initLoad = 0
+    captureData.parquetDir = None
+    if benchBackfill == 0:
+        captureData.backfillDays = 0
+
+    print ('\n==== {} items | {} ms latency | {} req/s cap | {} error rate ===='.format(itemCount, latencyMS, requestsPerSecond, errorRate))
+    runStats.resetStats()
+    runStart = time.time()
+    phaseTimes = captureData.main()
+    runElapsed = time.time() - runStart
+
+    # Rates come from what was captured, not the org size asked for.
+    phaseCounts = runStats.takeCounts()[0]
+    phaseItems = {phaseName: phaseCounts.get((phaseName, 'items'), 0) for phaseName in phaseTimes}
+    with sqlite3.connect(dbPath) as bench_conn:
+        capturedItems = bench_conn.execute('select count(*) from [GIS_Content]').fetchone()[0]
+    bench_conn.close()
+
+    with urllib.request.urlopen(stubURL + 'stub/stats') as response:
+        stubStats = json.loads(response.read().decode('utf-8'))['stats']
+    server.shutdown()
+    server.server_close()
+
+    return ({'items': itemCount, 'captured': capturedItems, 'seconds': runElapsed, 'phases': phaseTimes,
+             'phaseItems': phaseItems, 'endpoints': stubStats})
+
+def printReport(benchResults):
+#-------------------------------------------------------------------------------
+# Name:        Function - printReport
+# Purpose:  Throughput summary for each run.
+#-------------------------------------------------------------------------------
+
+    print ('\nBenchmark Results....')
+    for benchResult in benchResults:
+        print ('\n  {} item org:  {} items captured, {:.1f}s total, {:.1f} items/s'.format(
+            benchResult['items'], benchResult['captured'], benchResult['seconds'],
+            benchResult['captured'] / max(benchResult['seconds'], 0.001)))
+
+        print ('    Phases')
+        for phaseName, phaseElapsed in benchResult['phases'].items():
+            phaseItems = benchResult['phaseItems'][phaseName]
+            print ('      {:<40} {:>9.1f}s {:>8} items {:>10.1f} items/s'.format(phaseName, phaseElapsed, phaseItems,
+                                                                                phaseItems / max(phaseElapsed, 0.001)))
+
+        print ('    Endpoints')
+        for endpoint, endpointStats in sorted(benchResult['endpoints'].items()):
+            print ('      {:<40} {:>9} req {:>8.1f} req/s {:>7.1f} ms avg {:>6} throttled {:>6} errors'.format(
+                endpoint, endpointStats['requests'], endpointStats['requests'] / max(benchResult['seconds'], 0.001),
+                1000 * endpointStats['seconds'] / max(endpointStats['requests'], 1),
+                endpointStats['throttled'], endpointStats['errors']))
+
+    return
+
+#-------------------------------------------------------------------------------
+#
+#
+#                                 MAIN SCRIPT
+#
+#
+#-------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    orgSizes = benchOrgSizes
+    if '--items' in sys.argv:
+        orgSizes = [int(size) for size in sys.argv[sys.argv.index('--items') + 1].split(',')]
+    if '--latency' in sys.argv:
+        benchLatencyMS = float(sys.argv[sys.argv.index('--latency') + 1])
+    if '--rate' in sys.argv:
+        benchRequestsPerSecond = int(sys.argv[sys.argv.index('--rate') + 1])
+    if '--errors' in sys.argv:
+        benchErrorRate = float(sys.argv[sys.argv.index('--errors') + 1])
+
+    dbFolder = benchFolder
+    if dbFolder == None:
+        dbFolder = tempfile.mkdtemp(prefix='metaSnaggerBench_')
+
+    benchResults = []
+    for itemCount in orgSizes:
+        benchResults.append(runBenchmark(itemCount, benchLatencyMS, benchRequestsPerSecond, benchErrorRate, dbFolder))
+
+    printReport(benchResults)
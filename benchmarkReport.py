@@ -0,0 +1,122 @@
+#-------------------------------------------------------------------------------
+# Name:        Report Benchmark
+# Purpose:  Times reportOut's HTML renderer on synthetic owners with a few up
+#           to many thousands of items, next to the old row by row string
+#           concatenation it replaced. Nothing is queried or sent.
+#
+#           python benchmarkReport.py
+#           python benchmarkReport.py --rows 1000,50000
+#
+# Author:      John Spence
+#
+#
+#
+# Created:  10/19/2026
+# Modified:
+# Modification Purpose:
+#
+#
+#-------------------------------------------------------------------------------
+
+# 888888888888888888888888888888888888888888888888888888888888888888888888888888
+# ------------------------------- Configuration --------------------------------
+
+benchRowCounts = [10, 100, 1000, 5000, 20000] #Items per synthetic owner.
+benchRepeats = 5 #Renders per size. The best time is reported.
+
+# ------------------------------------------------------------------------------
+# DO NOT UPDATE BELOW THIS LINE OR RISK DOOM AND DISPAIR!  Have a nice day!
+# ------------------------------------------------------------------------------
+
+import datetime
+import sys
+import time
+
+import reportOut
+
+#-------------------------------------------------------------------------------
+#
+#
+#                                 Functions
+#
+#
+#-------------------------------------------------------------------------------
+
+def buildOwner(rowCount):
+#-------------------------------------------------------------------------------
+# Name:        Function - buildOwner
+# Purpose:  A summary tuple & report rows shaped like the database's.
+#-------------------------------------------------------------------------------
+
+    userDATA = ('bench_owner', 'bench_owner@gis.dev', rowCount, 72, 1234.5, 'id0', 'Oldest <Item>',
+                'id1', 'Newest & Best', 'id2', 'Last "Modified"', None, None, None)
+
+    itemTypes = ['Web Mapping Application', 'Dashboard', 'Web Map', 'Web Experience']
+    ownerDataReturn = []
+    for rowNumber in range(rowCount):
+        ownerDataReturn.append((rowNumber, 'item{}'.format(rowNumber), 'Application <{}> & Co'.format(rowNumber),
+                                itemTypes[rowNumber % len(itemTypes)], 'bench_owner', datetime.date(2024, 1, 1 + rowNumber % 28),
+                                None, None, None, 'public', 'FALSE' if rowNumber % 3 else 'TRUE',
+                                None, None, None, None, rowCount - rowNumber))
+
+    return (userDATA, ownerDataReturn)
+
+def legacyRows(ownerDataReturn):
+#-------------------------------------------------------------------------------
+# Name:        Function - legacyRows
+# Purpose:  The old table building loop, kept only for comparison.
+#-------------------------------------------------------------------------------
+
+    rowOutput = ''
+    for od in ownerDataReturn:
+        rowLine = '''
+
+          <tr>
+            <td>{}</td>
+            <td>{}</td>
+            <td>{}</td>
+            <td>{}</td>
+            <td>{}</td>
+          </tr>
+
+        '''.format(od[2], od[3], od[9], od[5], od[15])
+        rowOutput = rowOutput + rowLine
+
+    return (rowOutput)
+
+def bestTime(benchFunction, benchArgs):
+#-------------------------------------------------------------------------------
+# Name:        Function - bestTime
+# Purpose:  Fastest of benchRepeats runs, in seconds.
+#-------------------------------------------------------------------------------
+
+    runTimes = []
+    for repeat in range(benchRepeats):
+        runStart = time.perf_counter()
+        benchFunction(*benchArgs)
+        runTimes.append(time.perf_counter() - runStart)
+
+    return (min(runTimes))
+
+#-------------------------------------------------------------------------------
+#
+#
+#                                 MAIN SCRIPT
+#
+#
+#-------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    rowCounts = benchRowCounts
+    if '--rows' in sys.argv:
+        rowCounts = [int(rowCount) for rowCount in sys.argv[sys.argv.index('--rows') + 1].split(',')]
+
+    print ('{:>8}  {:>12}  {:>12}  {:>12}  {:>10}'.format('Rows', 'Render (ms)', 'Rows/s', 'Legacy (ms)', 'HTML KB'))
+    for rowCount in rowCounts:
+        userDATA, ownerDataReturn = buildOwner(rowCount)
+        renderSeconds = bestTime(reportOut.renderReport, (userDATA, ownerDataReturn))
+        legacySeconds = bestTime(legacyRows, (ownerDataReturn,))
+        htmlSize = len(reportOut.renderReport(userDATA, ownerDataReturn)) / 1024.0
+        print ('{:>8}  {:>12.2f}  {:>12.0f}  {:>12.2f}  {:>10.1f}'.format(rowCount, renderSeconds * 1000,
+                                                                          rowCount / max(renderSeconds, 0.000001),
+                                                                          legacySeconds * 1000, htmlSize))
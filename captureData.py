@@ -52,8 +52,11 @@ db_conn = ('Driver={ODBC Driver 17 for SQL Server};'  # This will require adjust
                       #r'PWD='     # Comment out if you are using AD authentication.
                       )
 
+# Storage Backend
+dbBackend = 'sqlserver' #Set to 'sqlite' and point db_conn at a file path (e.g. r'C:\GIS\metaSnagger.db') to run without SQL Server.
+
 # Initial Data Loaad
-initLoad = 0 #Set to 1 if you are wanting a full initial pull.
+initLoad = 0 #Set to 1 if you are wanting a full initial pull. Run with --resume to pick an interrupted one back up.
 
 # Debug on/off
 debugBIN = 0 #Set to 1 if you want to see the output for each line of code.
@@ -64,6 +67,57 @@ workFastest = 1 #Increases speed of capturing metrics data.
 # Data Source
 dataSource = 'AGOL'
 
+# Additional Portals (captured alongside the portal above, all in the same run)
+#   Example:  {'url': 'https://yourserver.com/portal/', 'uName': '', 'pWord': '', 'source': 'Portal'}
+#   Each portal needs its own source name. 'requestsPerSecond' can be added to override the default below.
+portalList = []
+portalRequestsPerSecond = 10 #Request cap per portal for usage & backup calls. None for no limit.
+
+# Phase Scheduling
+runParallelPhases = 1 #Set to 0 to run each phase one after another.
+metricsWorkers = None #Thread budget for metrics capture. None lets Python decide.
+metricsQueueDepth = 64 #Payloads queued ahead of the metrics threads.
+targetFetchSize = 500 #Targets pulled from the database per fetch.
+
+# Database Pool
+dbPoolSize = 16 #Database connections shared by every thread. Keep this at 4 or more.
+dbPoolCheckSeconds = 60 #Idle connections older than this are tested before reuse.
+dbPoolWaitSeconds = 600 #Give up waiting for a free connection after this long.
+
+# Sharding (set from the command line with --shard i/N, or --shards N to run N local processes)
+shardIndex = 0
+shardCount = 1 #Items are split between shards by a hash of the itemID.
+leaseMinutes = 15 #A shard lease lapses if not renewed within this many minutes.
+
+# Checkpointing
+checkpointEvery = 30 #Metric rows stored per item before progress is committed.
+
+# Backfill (only used when initLoad = 0)
+backfillDays = 720 #History filled in over several nightly runs. Set to 0 to turn off.
+backfillSliceDays = 30 #Days per slice. Slices run newest first across all items.
+backfillRequests = 20000 #Usage requests allowed for backfill per run. None for no limit.
+backfillMinutes = 60 #Minutes allowed for backfill per run. None for no limit.
+
+# Work Priority
+dormantDays = 30 #No usage or edits in this many days marks an item dormant.
+dormantPollDays = 7 #Dormant items are only polled this often.
+priorityTypes = ['Web Mapping Application', 'Dashboard', 'Web Experience', 'Hub Site Application',
+                 'Web Map', 'Feature Service', 'Map Service'] #Captured ahead of other types.
+
+# Parquet Export (needs pyarrow)
+parquetDir = None #Folder for the columnar metrics & content export, e.g. r'\\fileserver\GIS\metaSnagger'. None to turn off.
+parquetArchiveDays = None #Metrics older than this are removed from the database once exported. None to keep everything.
+parquetSettleMinutes = 10 #Rows stamped this recently wait for the next export, so writers still committing aren't skipped.
+
+# Run Stats (every run is also logged to GIS_CaptureRunLog)
+runStatsFile = None #Prometheus text file written after each run, e.g. for the node exporter textfile collector. None to skip.
+ledgerHistoryRuns = 14 #Past runs of a phase its throughput is compared against.
+ledgerDropShare = 0.5 #Flag a phase when throughput falls this far below its trailing median.
+
+# Profiling (python captureData.py --profile)
+profileDir = None #Where profile files go. None for the folder this script is in.
+profileSampleMS = 10 #How often every thread's stack is sampled.
+
 # ------------------------------------------------------------------------------
 # DO NOT UPDATE BELOW THIS LINE OR RISK DOOM AND DISPAIR!  Have a nice day!
 # ------------------------------------------------------------------------------
@@ -77,16 +131,50 @@ import smtplib
 import base64
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-import pyodbc
+import storageBackend
+import runStats
+import runProfile
 import concurrent.futures
 from bs4 import BeautifulSoup
 import urllib
 import requests
 import json
+import sys
+import os
+import socket
+import hashlib
+import subprocess
+import threading
+import uuid
 from tqdm import tqdm
 import warnings
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 warnings.filterwarnings("ignore", category=UserWarning, module='bs4')
 
+# Shared database pool for every thread in the run.
+dbPoolLock = threading.Lock()
+dbPoolSlots = threading.BoundedSemaphore(dbPoolSize)
+dbPoolIdle = []
+dbPoolLocal = threading.local()
+
+# Set when the run has to stop early, e.g. a shard that lost its lease.
+captureStop = threading.Event()
+
+# Settings handed down to --shards child processes, so anything changed after
+# import (benchmarks, tests, wrapper scripts) reaches the shards as well.
+shardSettings = ['portal_URL', 'portal_uName', 'portal_pWord', 'portal_Type', 'db_conn', 'dbBackend',
+                 'initLoad', 'debugBIN', 'workFastest', 'dataSource', 'portalList', 'portalRequestsPerSecond',
+                 'runParallelPhases', 'metricsWorkers', 'metricsQueueDepth', 'targetFetchSize',
+                 'dbPoolSize', 'dbPoolCheckSeconds', 'dbPoolWaitSeconds', 'leaseMinutes', 'checkpointEvery',
+                 'backfillDays', 'backfillSliceDays', 'backfillRequests', 'backfillMinutes',
+                 'dormantDays', 'dormantPollDays', 'priorityTypes', 'runStatsFile',
+                 'ledgerHistoryRuns', 'ledgerDropShare', 'profileDir', 'profileSampleMS']
+shardSettingsVariable = 'METASNAGGER_SETTINGS'
+
 #-------------------------------------------------------------------------------
 #
 #
@@ -101,241 +189,844 @@ def main():
 # Purpose:  Starts the whole thing.
 #-------------------------------------------------------------------------------
 
+    runStart = datetime.datetime.now()
+    portals = buildPortals()
+    phasePlan = buildPhasePlan(portals, ['queryPortal', 'dataCleaning', 'buildQueryForFast',
+                                         'getWebMapSources', 'disasterStore'], 1)
+
+    phaseTimes = runPhases(phasePlan)
+    refreshReportTables()
+    exportParquet()
+    saveRunStats('full', runStart)
+    closeConnections()
+
+    return (phaseTimes)
+
+def buildPortals():
+#-------------------------------------------------------------------------------
+# Name:        Function - buildPortals
+# Purpose:  Builds the list of portals to capture, each with its own token &
+#           request rate tracking.
+#-------------------------------------------------------------------------------
+
+    portalConfigs = [{'url': portal_URL, 'uName': portal_uName, 'pWord': portal_pWord, 'source': dataSource}] + portalList
+
+    portals = []
+    for portalConfig in portalConfigs:
+        portal = {'url': portalConfig['url'],
+                  'uName': portalConfig['uName'],
+                  'pWord': portalConfig['pWord'],
+                  'source': portalConfig['source'],
+                  'requestsPerSecond': portalConfig.get('requestsPerSecond', portalRequestsPerSecond),
+                  'tokenLock': threading.Lock(),
+                  'token': None,
+                  'tokenExpires': 0,
+                  'rateLock': threading.Lock(),
+                  'nextRequest': 0,
+                  'backfillLock': threading.Lock(),
+                  'backfillRemaining': None,
+                  'backfillDeadline': None}
+        portals.append(portal)
+
+    return (portals)
+
+def buildPhasePlan(portals, phaseNames, includeWorkspace):
+#-------------------------------------------------------------------------------
+# Name:        Function - buildPhasePlan
+# Purpose:  Lays out the requested phases for every portal. Metrics, webmap
+#           sources & backups only need the content inventory.
+#-------------------------------------------------------------------------------
+
+    capturePhases = {'queryPortal': (queryPortal, []),
+                     'dataCleaning': (dataCleaning, ['queryPortal']),
+                     'buildQueryForFast': (buildQueryForFast, ['dataCleaning']),
+                     'getWebMapSources': (getWebMapSources, ['dataCleaning']),
+                     'disasterStore': (disasterStore, ['dataCleaning'])}
+
+    phasePlan = []
+    if includeWorkspace == 1:
+        phasePlan.append(('checkWorkspace', checkWorkspace, (), []))
+
+    for portal in portals:
+        for phaseName in phaseNames:
+            phaseFunction, phaseDepends = capturePhases[phaseName]
+            phaseDepends = ['{}:{}'.format(portal['source'], depend) for depend in phaseDepends if depend in phaseNames]
+            if includeWorkspace == 1:
+                phaseDepends.append('checkWorkspace')
+            phasePlan.append(('{}:{}'.format(portal['source'], phaseName), phaseFunction, (portal,), phaseDepends))
+
+    return (phasePlan)
+
+def resumeLoad():
+#-------------------------------------------------------------------------------
+# Name:        Function - resumeLoad
+# Purpose:  Picks an interrupted initial load back up from the checkpoints.
+#-------------------------------------------------------------------------------
+
+    global initLoad
+    initLoad = 1
+
+    runStart = datetime.datetime.now()
+    phasePlan = buildPhasePlan(buildPortals(), ['buildQueryForFast'], 1)
+
+    runPhases(phasePlan)
+    refreshReportTables()
+    saveRunStats('resume', runStart)
+    closeConnections()
+
+    return
+
+def launchShards(shardTotal):
+#-------------------------------------------------------------------------------
+# Name:        Function - launchShards
+# Purpose:  Runs the shared phases once, then splits metrics capture & backups
+#           across shardTotal local processes.
+#-------------------------------------------------------------------------------
+
+    runStart = datetime.datetime.now()
+    phasePlan = buildPhasePlan(buildPortals(), ['queryPortal', 'dataCleaning', 'getWebMapSources'], 1)
+
+    runPhases(phasePlan)
+    saveRunStats('shared', runStart)
+    closeConnections()
+
+    print ('\nLaunching {} Shards....'.format(shardTotal))
+    shardEnvironment = dict(os.environ)
+    shardEnvironment[shardSettingsVariable] = json.dumps({settingName: globals()[settingName] for settingName in shardSettings})
+    shardProcesses = []
+    for shardNumber in range(shardTotal):
+        shardCommand = [sys.executable, os.path.abspath(__file__), '--shard', '{}/{}'.format(shardNumber, shardTotal)]
+        if '--profile' in sys.argv:
+            shardCommand.append('--profile')
+        shardProcesses.append(subprocess.Popen(shardCommand, env=shardEnvironment))
+
+    shardFailures = 0
+    for shardNumber, shardProcess in enumerate(shardProcesses):
+        shardProcess.wait()
+        if shardProcess.returncode != 0:
+            print ('    Shard {} exited with code {}'.format(shardNumber, shardProcess.returncode))
+            shardFailures += 1
+
+    if shardFailures > 0:
+        sys.exit(1)
+
+    runStats.resetStats()
+    exportStart = datetime.datetime.now()
+    refreshReportTables()
+    exportParquet()
+    saveRunStats('export', exportStart)
+    closeConnections()
+
+    return
+
+def applyShardSettings():
+#-------------------------------------------------------------------------------
+# Name:        Function - applyShardSettings
+# Purpose:  Takes on the settings launchShards handed down, if any.
+#-------------------------------------------------------------------------------
+
+    global dbPoolSlots
+
+    if shardSettingsVariable not in os.environ:
+        return
+
+    passedSettings = json.loads(os.environ[shardSettingsVariable])
+    for settingName in shardSettings:
+        if settingName in passedSettings:
+            globals()[settingName] = passedSettings[settingName]
+
+    # The pool was sized at import, before the settings arrived.
+    dbPoolSlots = threading.BoundedSemaphore(dbPoolSize)
+
+    return
+
+def runShard():
+#-------------------------------------------------------------------------------
+# Name:        Function - runShard
+# Purpose:  Runs metrics capture & backups for this process' share of items.
+#           Can run on any host that can reach the database.
+#-------------------------------------------------------------------------------
+
+    runStart = datetime.datetime.now()
     checkWorkspace()
-    queryPortal (portal_URL, portal_uName, portal_pWord)
-    dataCleaning()
-    buildQueryForFast()
-    getWebMapSources(portal_URL, portal_uName, portal_pWord)
-    disasterStore()
+    portals = buildPortals()
+
+    leaseKey = '{}:{}/{}'.format(','.join([portal['source'] for portal in portals]), shardIndex, shardCount)
+    leaseOwner = '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    if claimShardLease(leaseKey, leaseOwner) == False:
+        print ('Shard {} is already held by another worker. Exiting.'.format(leaseKey))
+        closeConnections()
+        sys.exit(1)
+
+    leaseStop = threading.Event()
+    leaseThread = threading.Thread(target=renewShardLease, args=(leaseKey, leaseOwner, leaseStop), daemon=True)
+    leaseThread.start()
+
+    try:
+        phasePlan = buildPhasePlan(portals, ['buildQueryForFast', 'disasterStore'], 0)
+
+        runPhases(phasePlan)
+    finally:
+        leaseStop.set()
+        leaseThread.join()
+        releaseShardLease(leaseKey, leaseOwner)
+        saveRunStats('shard {}/{}'.format(shardIndex, shardCount), runStart)
+        closeConnections()
+
+    # The phases may have finished, but another worker can have the shard now.
+    if captureStop.is_set():
+        print ('Shard {} lost its lease before finishing.'.format(leaseKey))
+        sys.exit(1)
+
+    return
+
+def inShard(itemID):
+#-------------------------------------------------------------------------------
+# Name:        Function - inShard
+# Purpose:  Checks if an item belongs to this process' shard.
+#-------------------------------------------------------------------------------
+
+    if shardCount <= 1:
+        return (True)
+
+    itemHash = int(hashlib.md5('{}'.format(itemID).encode('utf-8')).hexdigest(), 16)
+
+    return (itemHash % shardCount == shardIndex)
+
+def claimShardLease(leaseKey, leaseOwner):
+#-------------------------------------------------------------------------------
+# Name:        Function - claimShardLease
+# Purpose:  Takes or renews the lease on a shard. False if someone else has it.
+#-------------------------------------------------------------------------------
+
+    sqlCommand = '''
+
+    update [dbo].[GIS_CaptureLease]
+    set [leaseOwner] = '{}'
+        , [leaseExpires] = dateadd(minute, {}, getdate())
+        , [SysCaptureDate] = getdate()
+        where [leaseKey] = '{}'
+        and ([leaseOwner] = '{}' or [leaseExpires] < getdate())
+
+    '''.format(leaseOwner, leaseMinutes, leaseKey, leaseOwner)
+
+    insertCommand = '''
+
+    insert into [dbo].[GIS_CaptureLease] (
+        [leaseKey]
+        ,[leaseOwner]
+        ,[leaseExpires]
+        ,[SysCaptureDate]
+    )
+        Values ('{}', '{}', dateadd(minute, {}, getdate()), getdate())
+
+    '''.format(leaseKey, leaseOwner, leaseMinutes)
+
+    query_string = '''
+
+    select [leaseOwner] from [dbo].[GIS_CaptureLease] where [leaseKey] = '{}'
+
+    '''.format(leaseKey)
+
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
+        query_cursor.execute(sqlCommand)
+        if query_cursor.rowcount == 0:
+            try:
+                query_cursor.execute(insertCommand)
+            except storageBackend.IntegrityError:
+                # Someone else holds it.
+                query_conn.rollback()
+        query_conn.commit()
+        query_cursor.execute(query_string)
+        db_return = query_cursor.fetchone()
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
+
+    return (db_return != None and db_return[0] == leaseOwner)
+
+def renewShardLease(leaseKey, leaseOwner, leaseStop):
+#-------------------------------------------------------------------------------
+# Name:        Function - renewShardLease
+# Purpose:  Heartbeat that keeps the shard lease alive while the shard runs.
+#           Sets captureStop if the lease is lost or about to lapse.
+#-------------------------------------------------------------------------------
+
+    leaseSeconds = leaseMinutes * 60
+    lastRenewed = time.time()
+    while not leaseStop.wait(leaseSeconds / 3):
+        try:
+            if claimShardLease(leaseKey, leaseOwner) == False:
+                print ('Lost the lease on shard {}. Stopping.'.format(leaseKey))
+                captureStop.set()
+                return
+            lastRenewed = time.time()
+        except Exception as leaseError:
+            # A missed renewal is fine, as long as the lease cannot run out before the next one.
+            print ('Could not renew the lease on shard {}:  {}'.format(leaseKey, leaseError))
+            if time.time() - lastRenewed >= (leaseSeconds * 2) / 3:
+                print ('Lease on shard {} is about to lapse. Stopping.'.format(leaseKey))
+                captureStop.set()
+                return
+
+    return
+
+def releaseShardLease(leaseKey, leaseOwner):
+#-------------------------------------------------------------------------------
+# Name:        Function - releaseShardLease
+# Purpose:  Lets the shard lease lapse now that the shard is done.
+#-------------------------------------------------------------------------------
+
+    sqlCommand = '''
+
+    update [dbo].[GIS_CaptureLease]
+    set [leaseExpires] = getdate()
+        , [SysCaptureDate] = getdate()
+        where [leaseKey] = '{}'
+        and [leaseOwner] = '{}'
+
+    '''.format(leaseKey, leaseOwner)
+
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
+        query_cursor.execute(sqlCommand)
+        query_conn.commit()
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
+
+    return
+
+def getConnection():
+#-------------------------------------------------------------------------------
+# Name:        Function - getConnection
+# Purpose:  Hands out a pooled database connection, waiting if all dbPoolSize
+#           are in use. A thread gets back its last connection when it can.
+#-------------------------------------------------------------------------------
+
+    poolWaitStart = time.time()
+    if dbPoolSlots.acquire(timeout=dbPoolWaitSeconds) == False:
+        raise TimeoutError('No database connection free after {} seconds. Are connections being leaked?'.format(dbPoolWaitSeconds))
+    poolWait = time.time() - poolWaitStart
+    if poolWait > 0.001:
+        runStats.recordStat('wait', 'dbPool', poolWait)
+
+    conn = None
+    with dbPoolLock:
+        for pooled in dbPoolIdle:
+            if pooled[0] is getattr(dbPoolLocal, 'lastConn', None):
+                dbPoolIdle.remove(pooled)
+                conn, lastUsed = pooled
+                break
+        if conn == None and len(dbPoolIdle) > 0:
+            conn, lastUsed = dbPoolIdle.pop()
+
+    # Make sure long idle connections are still alive.
+    if conn != None and time.time() - lastUsed > dbPoolCheckSeconds:
+        try:
+            check_cursor = conn.cursor()
+            check_cursor.execute('select 1')
+            check_cursor.fetchone()
+            check_cursor.close()
+        except:
+            try:
+                conn.close()
+            except:
+                pass
+            conn = None
+
+    if conn == None:
+        try:
+            conn = storageBackend.connect(dbBackend, db_conn, runStats.recordSQL)
+        except:
+            dbPoolSlots.release()
+            raise
+
+    dbPoolLocal.lastConn = conn
+
+    return (conn)
+
+def releaseConnection(conn):
+#-------------------------------------------------------------------------------
+# Name:        Function - releaseConnection
+# Purpose:  Returns a connection to the pool. Anything not committed is dropped.
+#-------------------------------------------------------------------------------
+
+    try:
+        conn.rollback()
+        with dbPoolLock:
+            dbPoolIdle.append((conn, time.time()))
+    except:
+        try:
+            conn.close()
+        except:
+            pass
+
+    dbPoolSlots.release()
+
+    return
+
+def closeConnections():
+#-------------------------------------------------------------------------------
+# Name:        Function - closeConnections
+# Purpose:  Closes out the idle pooled connections at the end of a run.
+#-------------------------------------------------------------------------------
+
+    with dbPoolLock:
+        while len(dbPoolIdle) > 0:
+            conn, lastUsed = dbPoolIdle.pop()
+            try:
+                conn.close()
+            except:
+                pass
 
     return
 
+def timePhase(phaseFunction, phaseArgs):
+#-------------------------------------------------------------------------------
+# Name:        Function - timePhase
+# Purpose:  Runs a single phase and hands back the wall time it took.
+#-------------------------------------------------------------------------------
+
+    phaseStart = time.time()
+    phaseFunction(*phaseArgs)
+    phaseElapsed = time.time() - phaseStart
+    runStats.recordStat('phase', 'wall', phaseElapsed)
+    runStats.recordSpan(runStats.getPhase(), phaseStart, phaseStart + phaseElapsed)
+
+    return (phaseElapsed)
+
+def runPhases(phasePlan):
+#-------------------------------------------------------------------------------
+# Name:        Function - runPhases
+# Purpose:  Runs each phase as soon as the phases it depends on are finished.
+#-------------------------------------------------------------------------------
+
+    if runParallelPhases == 1:
+        phaseWorkers = len(phasePlan)
+    else:
+        phaseWorkers = 1
+
+    runStart = time.time()
+    phaseTimes = {}
+    pendingPhases = list(phasePlan)
+    runningPhases = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=phaseWorkers, thread_name_prefix='Phase_') as executor:
+        while len(pendingPhases) > 0 or len(runningPhases) > 0:
+            for phase in list(pendingPhases):
+                phaseName, phaseFunction, phaseArgs, phaseDepends = phase
+                if all(depend in phaseTimes for depend in phaseDepends):
+                    pendingPhases.remove(phase)
+                    runningPhases[executor.submit(runStats.inPhase, phaseName, timePhase, phaseFunction, phaseArgs)] = phaseName
+
+            if len(runningPhases) == 0:
+                raise ValueError('Phase plan cannot be completed:  {}'.format([phase[0] for phase in pendingPhases]))
+
+            phasesDone, phasesWaiting = concurrent.futures.wait(runningPhases, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in phasesDone:
+                phaseName = runningPhases.pop(future)
+                phaseTimes[phaseName] = future.result()
+
+    runElapsed = time.time() - runStart
+
+    print ('\nPhase Timing...')
+    for phase in phasePlan:
+        print ('    {}:  {:.1f}s'.format(phase[0], phaseTimes[phase[0]]))
+    print ('    Total Run:  {:.1f}s'.format(runElapsed))
+
+    return (phaseTimes)
+
 def checkWorkspace():
 #-------------------------------------------------------------------------------
 # Name:        Function - checkWorkspace
 # Purpose:  Creates the tables, views and indexes needed for the capture & use.
 #-------------------------------------------------------------------------------
     print ('Checking Database & Configuration...')
-    conn = pyodbc.connect(db_conn)
-    cursor = conn.cursor()
-
-    sqlCommand = '''
-    IF OBJECT_ID ('[DBO].[GIS_Content]' , N'U') IS NULL
-		    Begin
-                CREATE TABLE [DBO].[GIS_Content](
-                    [itemID] [VARCHAR] (64) NULL
-                    , [title] [VARCHAR] (255) NULL
-                    , [source] [VARCHAR] (255) NULL
-                    , [type] [VARCHAR] (80) NULL
-                    , [metadataScore] [NUMERIC] (3,0) NULL
-                    , [owner] [VARCHAR] (100) NULL
-                    , [dateCreated] [DATETIME2] (7) NULL
-                    , [dateModified] [DATETIME2] (7) NULL
-                    , [itemSummary] [VARCHAR] (max) NULL
-                    , [itemDescription] [VARCHAR] (max) NULL
-                    , [itemTermsofUse] [VARCHAR] (max) NULL
-                    , [itemTags] [VARCHAR] (max) NULL
-                    , [itemKeywords] [VARCHAR] (max) NULL
-                    , [sharingConfig] [VARCHAR] (80) NULL
-                    , [contentConfig] [VARCHAR] (80) NULL
-                    , [contentCredits] [VARCHAR] (max) NULL
-                    , [contentProtected] [VARCHAR] (5) NULL
-                    , [storageUsed] [NUMERIC] (12,0) NULL
-                    , [totalViews] [NUMERIC] (12,0) NULL
-                    , [totalRatings] [NUMERIC] (12,0) NULL
-                    , [avgRating] [DECIMAL] (3,2) NULL
-                    , [collectorDisabled] [VARCHAR] (5) NULL
-                    , [fieldMapsDisabled] [VARCHAR] (5) NULL
-                    , [archived] [VARCHAR] (5) NULL
-                    , [SysCaptureDate] [DATETIME2] (7) NULL
-                    , [GlobalID] [UNIQUEIDENTIFIER] NOT NULL
-                )
-            End
-    '''
-    cursor.execute(sqlCommand)
-    conn.commit()
+    conn = getConnection()
+    try:
+        cursor = conn.cursor()
 
-    sqlCommand = '''
-    IF OBJECT_ID ('[DBO].[GIS_ContentMetrics]' , N'U') IS NULL
-		    Begin
-                CREATE TABLE [DBO].[GIS_ContentMetrics](
-                    [itemID] [VARCHAR] (64) NULL
-                    , [periodDate] [DATE] NULL
-                    , [requests] [NUMERIC] (12,0) NULL
-                    , [archived] [VARCHAR] (5) NULL
-                    , [SysCaptureDate] [DATETIME2] (7) NULL
-                    , [FkID] [UNIQUEIDENTIFIER] NOT NULL
-                    , [GlobalID] [UNIQUEIDENTIFIER] NOT NULL
-                )
-            End
-    '''
-    cursor.execute(sqlCommand)
-    conn.commit()
+        sqlCommand = '''
+        IF OBJECT_ID ('[DBO].[GIS_Content]' , N'U') IS NULL
+    		    Begin
+                    CREATE TABLE [DBO].[GIS_Content](
+                        [itemID] [VARCHAR] (64) NULL
+                        , [title] [VARCHAR] (255) NULL
+                        , [source] [VARCHAR] (255) NULL
+                        , [type] [VARCHAR] (80) NULL
+                        , [metadataScore] [NUMERIC] (3,0) NULL
+                        , [owner] [VARCHAR] (100) NULL
+                        , [dateCreated] [DATETIME2] (7) NULL
+                        , [dateModified] [DATETIME2] (7) NULL
+                        , [itemSummary] [VARCHAR] (max) NULL
+                        , [itemDescription] [VARCHAR] (max) NULL
+                        , [itemTermsofUse] [VARCHAR] (max) NULL
+                        , [itemTags] [VARCHAR] (max) NULL
+                        , [itemKeywords] [VARCHAR] (max) NULL
+                        , [sharingConfig] [VARCHAR] (80) NULL
+                        , [contentConfig] [VARCHAR] (80) NULL
+                        , [contentCredits] [VARCHAR] (max) NULL
+                        , [contentProtected] [VARCHAR] (5) NULL
+                        , [storageUsed] [NUMERIC] (12,0) NULL
+                        , [totalViews] [NUMERIC] (12,0) NULL
+                        , [totalRatings] [NUMERIC] (12,0) NULL
+                        , [avgRating] [DECIMAL] (3,2) NULL
+                        , [collectorDisabled] [VARCHAR] (5) NULL
+                        , [fieldMapsDisabled] [VARCHAR] (5) NULL
+                        , [archived] [VARCHAR] (5) NULL
+                        , [SysCaptureDate] [DATETIME2] (7) NULL
+                        , [GlobalID] [UNIQUEIDENTIFIER] NOT NULL
+                    )
+                End
+        '''
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-    sqlCommand = '''
-    IF OBJECT_ID ('[DBO].[GIS_ContentSources]' , N'U') IS NULL
-		    Begin
-                CREATE TABLE [DBO].[GIS_ContentSources]( 
-                    [layerID] [VARCHAR] (255) NULL
-                    , [layerTitle] [VARCHAR] (255) NULL
-                    , [layerType] [VARCHAR] (100) NULL
-                    , [layerSource] [VARCHAR] (255) NULL
-                    , [layerVisibility] [VARCHAR] (5) NULL
-                    , [layerTest] [VARCHAR] (5) NULL
-                    , [SysCaptureDate] [DATETIME2] (7) NULL
-                    , [FkID] [UNIQUEIDENTIFIER] NOT NULL
-                    , [GlobalID] [UNIQUEIDENTIFIER] NOT NULL
-                )
-            End
-    '''
-    cursor.execute(sqlCommand)
-    conn.commit()
+        sqlCommand = '''
+        IF OBJECT_ID ('[DBO].[GIS_ContentMetrics]' , N'U') IS NULL
+    		    Begin
+                    CREATE TABLE [DBO].[GIS_ContentMetrics](
+                        [itemID] [VARCHAR] (64) NULL
+                        , [periodDate] [DATE] NULL
+                        , [requests] [NUMERIC] (12,0) NULL
+                        , [archived] [VARCHAR] (5) NULL
+                        , [SysCaptureDate] [DATETIME2] (7) NULL
+                        , [FkID] [UNIQUEIDENTIFIER] NOT NULL
+                        , [GlobalID] [UNIQUEIDENTIFIER] NOT NULL
+                    )
+                End
+        '''
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-    sqlCommand = '''
-    IF OBJECT_ID ('[DBO].[GIS_ContentConfig]' , N'U') IS NULL
-		    Begin
-                CREATE TABLE [DBO].[GIS_ContentConfig]( 
-                    [itemID] [VARCHAR] (64) NULL
-                    , [dateModified] [DATETIME2] (7) NULL
-                    , [description] [NVARCHAR] (MAX) NULL
-                    , [data] [NVARCHAR] (MAX) NULL
-                    , [archived] [VARCHAR] (5) NULL
-                    , [SysCaptureDate] [DATETIME2] (7) NULL
-                    , [FkID] [UNIQUEIDENTIFIER] NOT NULL
-                    , [GlobalID] [UNIQUEIDENTIFIER] NOT NULL
-                )
-            End
-    '''
-    cursor.execute(sqlCommand)
-    conn.commit()
+        sqlCommand = '''
+        IF OBJECT_ID ('[DBO].[GIS_ContentMetricsProgress]' , N'U') IS NULL
+    		    Begin
+                    CREATE TABLE [DBO].[GIS_ContentMetricsProgress](
+                        [itemID] [VARCHAR] (64) NULL
+                        , [completedFrom] [DATE] NULL
+                        , [completedThrough] [DATE] NULL
+                        , [SysCaptureDate] [DATETIME2] (7) NULL
+                        , [FkID] [UNIQUEIDENTIFIER] NOT NULL PRIMARY KEY
+                    )
+                End
+        '''
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-    sqlCommand = '''
-    IF OBJECT_ID ('[DBO].[View_SVC_GISContent]') IS NULL
+        sqlCommand = '''
+        IF OBJECT_ID ('[DBO].[GIS_CaptureLease]' , N'U') IS NULL
+    		    Begin
+                    CREATE TABLE [DBO].[GIS_CaptureLease](
+                        [leaseKey] [VARCHAR] (100) NOT NULL PRIMARY KEY
+                        , [leaseOwner] [VARCHAR] (255) NULL
+                        , [leaseExpires] [DATETIME2] (7) NULL
+                        , [SysCaptureDate] [DATETIME2] (7) NULL
+                    )
+                End
+        '''
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-        Begin
-        EXECUTE ('
+        sqlCommand = '''
+        IF OBJECT_ID ('[DBO].[GIS_CaptureRunLog]' , N'U') IS NULL
+    		    Begin
+                    CREATE TABLE [DBO].[GIS_CaptureRunLog](
+                        [runID] [VARCHAR] (36) NOT NULL
+                        , [runMode] [VARCHAR] (50) NULL
+                        , [hostName] [VARCHAR] (255) NULL
+                        , [runStart] [DATETIME2] (7) NULL
+                        , [runSeconds] [NUMERIC] (12,3) NULL
+                        , [phase] [VARCHAR] (255) NULL
+                        , [statKind] [VARCHAR] (20) NULL
+                        , [statName] [VARCHAR] (255) NULL
+                        , [calls] [INT] NULL
+                        , [errors] [INT] NULL
+                        , [retries] [INT] NULL
+                        , [totalSeconds] [NUMERIC] (12,3) NULL
+                        , [p50Seconds] [NUMERIC] (12,3) NULL
+                        , [p95Seconds] [NUMERIC] (12,3) NULL
+                        , [maxSeconds] [NUMERIC] (12,3) NULL
+                        , [SysCaptureDate] [DATETIME2] (7) NULL
+                    )
+                End
+        '''
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-                CREATE view [dbo].[View_SVC_GISContent] as
+        sqlCommand = '''
+        IF OBJECT_ID ('[DBO].[GIS_CaptureRunLedger]' , N'U') IS NULL
+    		    Begin
+                    CREATE TABLE [DBO].[GIS_CaptureRunLedger](
+                        [runID] [VARCHAR] (36) NOT NULL
+                        , [runMode] [VARCHAR] (50) NULL
+                        , [hostName] [VARCHAR] (255) NULL
+                        , [phase] [VARCHAR] (255) NULL
+                        , [phaseStart] [DATETIME2] (7) NULL
+                        , [phaseEnd] [DATETIME2] (7) NULL
+                        , [phaseSeconds] [NUMERIC] (12,3) NULL
+                        , [items] [INT] NULL
+                        , [metricRows] [INT] NULL
+                        , [httpCalls] [INT] NULL
+                        , [httpErrors] [INT] NULL
+                        , [sqlCalls] [INT] NULL
+                        , [sqlErrors] [INT] NULL
+                        , [throughput] [NUMERIC] (12,3) NULL
+                        , [trailingMedian] [NUMERIC] (12,3) NULL
+                        , [anomaly] [VARCHAR] (255) NULL
+                        , [SysCaptureDate] [DATETIME2] (7) NULL
+                    )
+                End
+        '''
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-                SELECT
-	                CAST(ROW_NUMBER() over(order by [dateCreated] asc) as int) as [ObjectID]
-	                , *
-                FROM [dbo].[GIS_Content]')
-        END
+        sqlCommand = '''
+        IF OBJECT_ID ('[DBO].[GIS_ContentSources]' , N'U') IS NULL
+    		    Begin
+                    CREATE TABLE [DBO].[GIS_ContentSources]( 
+                        [layerID] [VARCHAR] (255) NULL
+                        , [layerTitle] [VARCHAR] (255) NULL
+                        , [layerType] [VARCHAR] (100) NULL
+                        , [layerSource] [VARCHAR] (255) NULL
+                        , [layerVisibility] [VARCHAR] (5) NULL
+                        , [layerTest] [VARCHAR] (5) NULL
+                        , [SysCaptureDate] [DATETIME2] (7) NULL
+                        , [FkID] [UNIQUEIDENTIFIER] NOT NULL
+                        , [GlobalID] [UNIQUEIDENTIFIER] NOT NULL
+                    )
+                End
+        '''
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-    '''
+        sqlCommand = '''
+        IF OBJECT_ID ('[DBO].[GIS_ContentConfig]' , N'U') IS NULL
+    		    Begin
+                    CREATE TABLE [DBO].[GIS_ContentConfig]( 
+                        [itemID] [VARCHAR] (64) NULL
+                        , [dateModified] [DATETIME2] (7) NULL
+                        , [description] [NVARCHAR] (MAX) NULL
+                        , [data] [NVARCHAR] (MAX) NULL
+                        , [archived] [VARCHAR] (5) NULL
+                        , [SysCaptureDate] [DATETIME2] (7) NULL
+                        , [FkID] [UNIQUEIDENTIFIER] NOT NULL
+                        , [GlobalID] [UNIQUEIDENTIFIER] NOT NULL
+                    )
+                End
+        '''
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-    cursor.execute(sqlCommand)
-    conn.commit()
+        sqlCommand = '''
+        IF OBJECT_ID ('[DBO].[View_SVC_GISContent]') IS NULL
 
-    sqlCommand = '''
-    IF OBJECT_ID ('[DBO].[View_SVC_GISMetrics]') IS NULL
-
-        Begin
-        EXECUTE ('
-
-                CREATE View [dbo].[View_SVC_GISMetrics] as
-
-                SELECT
-	                CAST(ROW_NUMBER() over(order by content.[dateCreated] asc) as int) as [ObjectID]
-	                , content.[itemID]
-	                , content.[title]
-                    , content.[source]
-	                , content.[type]
-	                , content.[owner]
-	                , content.[dateCreated]
-	                , content.[dateModified]
-	                , content.[itemTags]
-	                , content.[sharingConfig]
-	                , content.[fieldMapsDisabled]
-	                , content.[archived]
-	                , content.[SysCaptureDate]
-	                , case
-		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and metrics.[periodDate] = cast(getdate()-1 as date)) is NULL then 0
-		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and metrics.[periodDate] = cast(getdate()-1 as date))
-	                  end as [TotalUsage_Yesterday]
-	                , case
-		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(ww, metrics.[periodDate]) = datepart(ww, cast(getdate() as date))) is null then 0
-		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(ww, metrics.[periodDate]) = datepart(ww, cast(getdate() as date)))
-	                  end as [TotalUsage_ThisWeek]
-	                , case
-		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(ww, metrics.[periodDate]) = datepart(ww, cast(getdate() as date))-1) is null then 0
-		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(ww, metrics.[periodDate]) = datepart(ww, cast(getdate() as date))-1)
-	                  end as [TotalUsage_LastWeek]
-	                , case
-		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(mm, metrics.[periodDate]) = datepart(mm, cast(getdate() as date))) is null then 0
-		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(mm, metrics.[periodDate]) = datepart(mm, cast(getdate() as date)))
-	                  end as [TotalUsage_ThisMonth]
-	                , case
-		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(mm, metrics.[periodDate]) = datepart(mm, cast(getdate() as date))-1) is null then 0
-		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(mm, metrics.[periodDate]) = datepart(mm, cast(getdate() as date))-1)
-	                  end as [TotalUsage_LastMonth]
-	                , case
-		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(yy, metrics.[periodDate]) = datepart(yy, cast(getdate() as date))) is null then 0
-		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(yy, metrics.[periodDate]) = datepart(yy, cast(getdate() as date)))
-	                  end as [TotalUsage_ThisYear]
-	                , case
-		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(yy, metrics.[periodDate]) = datepart(yy, cast(getdate() as date))-1) is null then 0
-		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
-			                and datepart(yy, metrics.[periodDate]) = datepart(yy, cast(getdate() as date))-1)
-	                  end as [TotalUsage_LastYear]
-	                , (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]) as [TotalUsage_AllTime]
-
-                  FROM [dbo].[GIS_Content] as content')
-        END
+            Begin
+            EXECUTE ('
 
-    '''
+                    CREATE view [dbo].[View_SVC_GISContent] as
 
-    cursor.execute(sqlCommand)
-    conn.commit()
+                    SELECT
+    	                CAST(ROW_NUMBER() over(order by [dateCreated] asc) as int) as [ObjectID]
+    	                , *
+                    FROM [dbo].[GIS_Content]')
+            END
 
-    sqlCommand = '''
-    IF OBJECT_ID ('[DBO].[View_SVC_GISContentSources]') IS NULL
-
-        Begin
-        EXECUTE ('
-            CREATE view [DBO].[View_SVC_GISContentSources] as 
-                select 
-	                CAST(ROW_NUMBER() over(order by [sources].[globalID] asc) as int) as [ObjectID]
-	                , [content].[itemID]
-	                , [content].[title]
-	                , [content].[source]
-	                , [content].[type]
-	                , [content].[owner]
-	                , [content].[dateModified]
-	                , [sources].[layerID]
-	                , [sources].[layerTitle]
-	                , [sources].[layerType]
-	                , [sources].[layerSource]
-                from [DBO].GIS_Content as [content]
-                inner join [DBO].[GIS_ContentSources] as [sources] on [sources].FkID = [content].[GlobalID]
-                ')
-        END
+        '''
 
-    '''
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-    cursor.execute(sqlCommand)
-    conn.commit()
+        sqlCommand = '''
+        IF OBJECT_ID ('[DBO].[View_SVC_GISMetrics]') IS NULL
+
+            Begin
+            EXECUTE ('
+
+                    CREATE View [dbo].[View_SVC_GISMetrics] as
+
+                    SELECT
+    	                CAST(ROW_NUMBER() over(order by content.[dateCreated] asc) as int) as [ObjectID]
+    	                , content.[itemID]
+    	                , content.[title]
+                        , content.[source]
+    	                , content.[type]
+    	                , content.[owner]
+    	                , content.[dateCreated]
+    	                , content.[dateModified]
+    	                , content.[itemTags]
+    	                , content.[sharingConfig]
+    	                , content.[fieldMapsDisabled]
+    	                , content.[archived]
+    	                , content.[SysCaptureDate]
+    	                , case
+    		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and metrics.[periodDate] = cast(getdate()-1 as date)) is NULL then 0
+    		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and metrics.[periodDate] = cast(getdate()-1 as date))
+    	                  end as [TotalUsage_Yesterday]
+    	                , case
+    		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(ww, metrics.[periodDate]) = datepart(ww, cast(getdate() as date))) is null then 0
+    		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(ww, metrics.[periodDate]) = datepart(ww, cast(getdate() as date)))
+    	                  end as [TotalUsage_ThisWeek]
+    	                , case
+    		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(ww, metrics.[periodDate]) = datepart(ww, cast(getdate() as date))-1) is null then 0
+    		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(ww, metrics.[periodDate]) = datepart(ww, cast(getdate() as date))-1)
+    	                  end as [TotalUsage_LastWeek]
+    	                , case
+    		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(mm, metrics.[periodDate]) = datepart(mm, cast(getdate() as date))) is null then 0
+    		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(mm, metrics.[periodDate]) = datepart(mm, cast(getdate() as date)))
+    	                  end as [TotalUsage_ThisMonth]
+    	                , case
+    		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(mm, metrics.[periodDate]) = datepart(mm, cast(getdate() as date))-1) is null then 0
+    		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(mm, metrics.[periodDate]) = datepart(mm, cast(getdate() as date))-1)
+    	                  end as [TotalUsage_LastMonth]
+    	                , case
+    		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(yy, metrics.[periodDate]) = datepart(yy, cast(getdate() as date))) is null then 0
+    		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(yy, metrics.[periodDate]) = datepart(yy, cast(getdate() as date)))
+    	                  end as [TotalUsage_ThisYear]
+    	                , case
+    		                when (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(yy, metrics.[periodDate]) = datepart(yy, cast(getdate() as date))-1) is null then 0
+    		                else (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]
+    			                and datepart(yy, metrics.[periodDate]) = datepart(yy, cast(getdate() as date))-1)
+    	                  end as [TotalUsage_LastYear]
+    	                , (select SUM(metrics.[requests]) from [dbo].[GIS_ContentMetrics] metrics where metrics.[FkID] = content.[GlobalID]) as [TotalUsage_AllTime]
+
+                      FROM [dbo].[GIS_Content] as content')
+            END
+
+        '''
+
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-    # Close it out when not needed.
-    conn.close()
+        sqlCommand = '''
+        IF OBJECT_ID ('[DBO].[View_SVC_GISContentSources]') IS NULL
+
+            Begin
+            EXECUTE ('
+                CREATE view [DBO].[View_SVC_GISContentSources] as 
+                    select 
+    	                CAST(ROW_NUMBER() over(order by [sources].[globalID] asc) as int) as [ObjectID]
+    	                , [content].[itemID]
+    	                , [content].[title]
+    	                , [content].[source]
+    	                , [content].[type]
+    	                , [content].[owner]
+    	                , [content].[dateModified]
+    	                , [sources].[layerID]
+    	                , [sources].[layerTitle]
+    	                , [sources].[layerType]
+    	                , [sources].[layerSource]
+                    from [DBO].GIS_Content as [content]
+                    inner join [DBO].[GIS_ContentSources] as [sources] on [sources].FkID = [content].[GlobalID]
+                    ')
+            END
+
+        '''
+
+        cursor.execute(sqlCommand)
+        conn.commit()
+
+        # Reporting tables for reportOut & the feature services. They hold the
+        # same rows as the View_SVC_* views, precomputed by refreshReportTables
+        # at the end of each run. Each has a staging twin it is rebuilt into.
+        for tableName in ['MV_SVC_GISContent', 'MV_SVC_GISContent_Stage']:
+            sqlCommand = '''
+            IF OBJECT_ID ('[DBO].[{0}]' , N'U') IS NULL
+    		        Begin
+                        CREATE TABLE [DBO].[{0}](
+                            [ObjectID] [INT] NULL
+                            , [itemID] [VARCHAR] (64) NULL
+                            , [title] [VARCHAR] (255) NULL
+                            , [source] [VARCHAR] (255) NULL
+                            , [type] [VARCHAR] (80) NULL
+                            , [metadataScore] [NUMERIC] (3,0) NULL
+                            , [owner] [VARCHAR] (100) NULL
+                            , [dateCreated] [DATETIME2] (7) NULL
+                            , [dateModified] [DATETIME2] (7) NULL
+                            , [itemSummary] [VARCHAR] (max) NULL
+                            , [itemDescription] [VARCHAR] (max) NULL
+                            , [itemTermsofUse] [VARCHAR] (max) NULL
+                            , [itemTags] [VARCHAR] (max) NULL
+                            , [itemKeywords] [VARCHAR] (max) NULL
+                            , [sharingConfig] [VARCHAR] (80) NULL
+                            , [contentConfig] [VARCHAR] (80) NULL
+                            , [contentCredits] [VARCHAR] (max) NULL
+                            , [contentProtected] [VARCHAR] (5) NULL
+                            , [storageUsed] [NUMERIC] (12,0) NULL
+                            , [totalViews] [NUMERIC] (12,0) NULL
+                            , [totalRatings] [NUMERIC] (12,0) NULL
+                            , [avgRating] [DECIMAL] (3,2) NULL
+                            , [collectorDisabled] [VARCHAR] (5) NULL
+                            , [fieldMapsDisabled] [VARCHAR] (5) NULL
+                            , [archived] [VARCHAR] (5) NULL
+                            , [SysCaptureDate] [DATETIME2] (7) NULL
+                            , [GlobalID] [UNIQUEIDENTIFIER] NOT NULL
+                        )
+                    End
+            '''.format(tableName)
+            cursor.execute(sqlCommand)
+            conn.commit()
+
+        # reportOut reads these rows by position, so the column order matters.
+        for tableName in ['MV_SVC_GISMetrics', 'MV_SVC_GISMetrics_Stage']:
+            sqlCommand = '''
+            IF OBJECT_ID ('[DBO].[{0}]' , N'U') IS NULL
+    		        Begin
+                        CREATE TABLE [DBO].[{0}](
+                            [ObjectID] [INT] NULL
+                            , [itemID] [VARCHAR] (64) NULL
+                            , [title] [VARCHAR] (255) NULL
+                            , [type] [VARCHAR] (80) NULL
+                            , [owner] [VARCHAR] (100) NULL
+                            , [dateCreated] [DATETIME2] (7) NULL
+                            , [dateModified] [DATETIME2] (7) NULL
+                            , [itemTags] [VARCHAR] (max) NULL
+                            , [itemKeywords] [VARCHAR] (max) NULL
+                            , [sharingConfig] [VARCHAR] (80) NULL
+                            , [fieldMapsDisabled] [VARCHAR] (5) NULL
+                            , [archived] [VARCHAR] (5) NULL
+                            , [SysCaptureDate] [DATETIME2] (7) NULL
+                            , [TotalUsage_Yesterday] [NUMERIC] (18,0) NULL
+                            , [TotalUsage_ThisWeek] [NUMERIC] (18,0) NULL
+                            , [TotalUsage_LastWeek] [NUMERIC] (18,0) NULL
+                            , [TotalUsage_ThisMonth] [NUMERIC] (18,0) NULL
+                            , [TotalUsage_LastMonth] [NUMERIC] (18,0) NULL
+                            , [TotalUsage_ThisYear] [NUMERIC] (18,0) NULL
+                            , [TotalUsage_LastYear] [NUMERIC] (18,0) NULL
+                            , [TotalUsage_AllTime] [NUMERIC] (18,0) NULL
+                            , [source] [VARCHAR] (255) NULL
+                            , [GlobalID] [UNIQUEIDENTIFIER] NOT NULL
+                        )
+                    End
+            '''.format(tableName)
+            cursor.execute(sqlCommand)
+            conn.commit()
+
+    finally:
+        # Close it out when not needed.
+        releaseConnection(conn)
 
     return ()
 
-def queryPortal (portal_URL, portal_uName, portal_pWord):
+def queryPortal (portal):
 #-------------------------------------------------------------------------------
 # Name:        Function - queryPortal
 # Purpose:  1st step in querying portal...logging in.
@@ -344,11 +1035,13 @@ def queryPortal (portal_URL, portal_uName, portal_pWord):
     errorLoc = 'queryPortal'
 
     try:
-        portal_pWordDec = base64.b64decode(portal_pWord).decode("utf-8")
-        gis = GIS('{}'.format(portal_URL), '{}'.format(portal_uName), '{}'.format(portal_pWordDec))
+        portal_pWordDec = base64.b64decode(portal['pWord']).decode("utf-8")
+        loginStart = time.time()
+        gis = GIS('{}'.format(portal['url']), '{}'.format(portal['uName']), '{}'.format(portal_pWordDec))
+        runStats.recordStat('http', 'login', time.time() - loginStart)
         errorCond = 0
         errorResponse = ''
-        getInfo(gis)
+        getInfo(gis, portal)
 
     except Exception as errorResponse:
         print ('Error establishing connection to URL:  {}'.format(errorResponse))
@@ -357,14 +1050,33 @@ def queryPortal (portal_URL, portal_uName, portal_pWord):
 
     return
 
-def getInfo(gis):
+def getInfo(gis, portal):
 #-------------------------------------------------------------------------------
 # Name:        Function - getInfo
-# Purpose:  Snags up to 10,000 items from the portal and processes for capture.
+# Purpose:  Snags every item from the portal and processes for capture. The
+#           portal stops handing back results at 10,000 per search, so larger
+#           orgs are searched again below the oldest created date seen.
 #-------------------------------------------------------------------------------
 
     print ('Querying data from specified environment.....')
-    search_results = gis.content.search (query='', sort_field='created', sort_order='desc', max_items=10000)
+    searchCap = 10000
+    searchQuery = ''
+    search_results = []
+    seenItems = set()
+    while True:
+        searchStart = time.time()
+        searchPage = gis.content.search (query=searchQuery, sort_field='created', sort_order='desc', max_items=searchCap)
+        runStats.recordStat('http', 'search', time.time() - searchStart)
+
+        # Items sharing the oldest created date come back again on the next pass.
+        newItems = [result for result in searchPage if result.itemid not in seenItems]
+        for result in newItems:
+            seenItems.add(result.itemid)
+        search_results.extend(newItems)
+
+        if len(searchPage) < searchCap or len(newItems) == 0:
+            break
+        searchQuery = 'created: [0 TO {}]'.format(searchPage[-1].created)
 
     dataStore = search_results
     for result in search_results:
@@ -391,364 +1103,420 @@ def getInfo(gis):
             print ('Number of Ratings:  {}'.format(result.numRatings))
             print ('Average Rating:  {}\n'.format(result.avgRating))
 
-    sendContent2Storage(dataStore)
+    sendContent2Storage(dataStore, portal)
 
     return
 
-def dataCleaning():
+def dataCleaning(portal):
 #-------------------------------------------------------------------------------
 # Name:        Function - dataCleaning
 # Purpose:  Cleans up afterwards adding in metadata for fieldmaps, archived, etc.
 #-------------------------------------------------------------------------------
 
-    conn = pyodbc.connect(db_conn)
-    cursor = conn.cursor()
+    conn = getConnection()
+    try:
+        cursor = conn.cursor()
 
-    sqlCommand = '''
+        sqlCommand = '''
 
-    update [dbo].[GIS_Content]
-    set [fieldMapsDisabled] = 'TRUE'
-        , [SysCaptureDate] = getdate()
-        where [type] = 'Web Map'
-        and [archived] is NULL
-		and [itemKeywords] like '%FieldMapsDisabled%'
-        and cast ([SysCaptureDate] as date) = cast (getdate() as date)
-        and [source] = '{}'
+        update [dbo].[GIS_Content]
+        set [fieldMapsDisabled] = 'TRUE'
+            , [SysCaptureDate] = getdate()
+            where [type] = 'Web Map'
+            and [archived] is NULL
+    		and [itemKeywords] like '%FieldMapsDisabled%'
+            and cast ([SysCaptureDate] as date) = cast (getdate() as date)
+            and [source] = '{}'
 
-    '''.format(dataSource)
-    cursor.execute(sqlCommand)
-    conn.commit()
+        '''.format(portal['source'])
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-    sqlCommand = '''
+        sqlCommand = '''
 
-    update [dbo].[GIS_Content]
-    set [fieldMapsDisabled] = 'FALSE'
-        , [SysCaptureDate] = getdate()
-        where [type] = 'Web Map'
-        and [archived] is NULL
-		and [fieldMapsDisabled] is NULL
-        and cast ([SysCaptureDate] as date) = cast (getdate() as date)
-        and [source] = '{}'
+        update [dbo].[GIS_Content]
+        set [fieldMapsDisabled] = 'FALSE'
+            , [SysCaptureDate] = getdate()
+            where [type] = 'Web Map'
+            and [archived] is NULL
+    		and [fieldMapsDisabled] is NULL
+            and cast ([SysCaptureDate] as date) = cast (getdate() as date)
+            and [source] = '{}'
 
-    '''.format(dataSource)
+        '''.format(portal['source'])
 
-    cursor.execute(sqlCommand)
-    conn.commit()
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-    sqlCommand = '''
+        sqlCommand = '''
 
-    update [dbo].[GIS_Content]
-    set [fieldMapsDisabled] = 'N/A'
-        , [SysCaptureDate] = getdate()
-        where [type] <> 'Web Map'
-        and [archived] is NULL
-        and [fieldMapsDisabled] is NULL
-        and cast ([SysCaptureDate] as date) = cast (getdate() as date)
-        and [source] = '{}'
+        update [dbo].[GIS_Content]
+        set [fieldMapsDisabled] = 'N/A'
+            , [SysCaptureDate] = getdate()
+            where [type] <> 'Web Map'
+            and [archived] is NULL
+            and [fieldMapsDisabled] is NULL
+            and cast ([SysCaptureDate] as date) = cast (getdate() as date)
+            and [source] = '{}'
 
-    '''.format(dataSource)
+        '''.format(portal['source'])
 
-    cursor.execute(sqlCommand)
-    conn.commit()
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-    sqlCommand = '''
+        sqlCommand = '''
 
-    update [dbo].[GIS_Content]
-    set [collectorDisabled] = 'TRUE'
-        , [SysCaptureDate] = getdate()
-        where [type] = 'Web Map'
-        and [archived] is NULL
-		and [itemKeywords] like '%CollectorDisabled%'
-        and [collectorDisabled] is NULL
-        and cast ([SysCaptureDate] as date) = cast (getdate() as date)
-        and [source] = '{}'
+        update [dbo].[GIS_Content]
+        set [collectorDisabled] = 'TRUE'
+            , [SysCaptureDate] = getdate()
+            where [type] = 'Web Map'
+            and [archived] is NULL
+    		and [itemKeywords] like '%CollectorDisabled%'
+            and [collectorDisabled] is NULL
+            and cast ([SysCaptureDate] as date) = cast (getdate() as date)
+            and [source] = '{}'
 
-    '''.format(dataSource)
+        '''.format(portal['source'])
 
-    cursor.execute(sqlCommand)
-    conn.commit()
+        cursor.execute(sqlCommand)
+        conn.commit()
 
-    sqlCommand = '''
+        sqlCommand = '''
 
-    update [dbo].[GIS_Content]
-    set [archived] = 'TRUE'
-        , [SysCaptureDate] = getdate()
-	   where cast ([SysCaptureDate] as date) <> cast (getdate() as date)
-        and [archived] is NULL
-        and [source] = '{}'
+        update [dbo].[GIS_Content]
+        set [archived] = 'TRUE'
+            , [SysCaptureDate] = getdate()
+    	   where cast ([SysCaptureDate] as date) <> cast (getdate() as date)
+            and [archived] is NULL
+            and [source] = '{}'
 
-    '''.format(dataSource)
+        '''.format(portal['source'])
 
-    cursor.execute(sqlCommand)
-    conn.commit()
-    conn.close()
+        cursor.execute(sqlCommand)
+        conn.commit()
+    finally:
+        releaseConnection(conn)
 
     return
 
 
-def sendContent2Storage(dataStore):
+def sendContent2Storage(dataStore, portal):
 #-------------------------------------------------------------------------------
 # Name:        Function - sendContent2Storage
 # Purpose:  Fires off the input to the database.
 #-------------------------------------------------------------------------------
 
-    query_conn = pyodbc.connect(db_conn, autocommit = False)
-    query_cursor = query_conn.cursor()
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
+
+        print ('\nInserting & Updating Content Data...')
+        for result in tqdm(dataStore):
+            runStats.addCount('items')
+
+            contentTitle = '{}'.format(result.title)
+            contentTitle = contentTitle.replace("'", '\'\'')
+            contentTitle = '\'{}\''.format(contentTitle)
+            contentType = '\'{}\''.format(result.type)
+            contentID = '\'{}\''.format(result.itemid)
+            contentmetadataScore = '\'{}\''.format(result.scoreCompleteness)
+            owner = result.owner.rstrip('_cobgis')
+            owner = '\'{}\''.format(owner)
+            dateCreated = datetime.datetime.fromtimestamp(result.created/1000).strftime('%Y-%m-%d %H:%M:%S')
+            dateModified = datetime.datetime.fromtimestamp(result.modified/1000).strftime('%Y-%m-%d %H:%M:%S')
+            dateCreated = '\'{}\''.format(dateCreated)
+            dateModified = '\'{}\''.format(dateModified)
+            if result.snippet != None:
+                soup = BeautifulSoup (result.snippet, 'lxml')
+                for data in soup (['style', 'script']):
+                    data.decompose()
+                resultSnippet = (' '.join(soup.stripped_strings))
+                resultSnippet = resultSnippet.replace("'", '\'\'')
+                itemSummary = '\'{}\''.format(resultSnippet)
+            else:
+                itemSummary = 'NULL'
+            if result.description != None:
+                soup = BeautifulSoup (result.description, 'lxml')
+                for data in soup (['style', 'script']):
+                    data.decompose()
+                resultDescription = (' '.join(soup.stripped_strings))
+                resultDescription = resultDescription.replace("'", '\'\'')
+                itemDescription = '\'{}\''.format(resultDescription)
+            else:
+                itemDescription = 'NULL'
+            if result.licenseInfo != None:
+                soup = BeautifulSoup (result.licenseInfo, 'lxml')
+                for data in soup (['style', 'script']):
+                    data.decompose()
+                resultTOU = (' '.join(soup.stripped_strings))
+                resultTOU = resultTOU.replace("'", '\'\'')
+                itemTermsofUse = '\'{}\''.format(resultTOU)
+            else:
+                itemTermsofUse = 'NULL'
+            tag_content = ''
+            if len(result.tags) > 1:
+                tag_content = result.tags[0]
+                for tag in result.tags:
+                    tag_content = '{}, {}'.format(tag_content, tag)
+                tag_content = tag_content.split(', ', 1)
+                tag_content = tag_content[1]
+            elif len(result.tags) == 1:
+                tag_content = '{}'.format(result.tags[0])
+            else:
+                tag_content = 'None'
 
-    print ('\nInserting & Updating Content Data...')
-    for result in tqdm(dataStore):
-
-        contentTitle = '{}'.format(result.title)
-        contentTitle = contentTitle.replace("'", '\'\'')
-        contentTitle = '\'{}\''.format(contentTitle)
-        contentType = '\'{}\''.format(result.type)
-        contentID = '\'{}\''.format(result.itemid)
-        contentmetadataScore = '\'{}\''.format(result.scoreCompleteness)
-        owner = result.owner.rstrip('_cobgis')
-        owner = '\'{}\''.format(owner)
-        dateCreated = datetime.datetime.fromtimestamp(result.created/1000).strftime('%Y-%m-%d %H:%M:%S')
-        dateModified = datetime.datetime.fromtimestamp(result.modified/1000).strftime('%Y-%m-%d %H:%M:%S')
-        dateCreated = '\'{}\''.format(dateCreated)
-        dateModified = '\'{}\''.format(dateModified)
-        if result.snippet != None:
-            soup = BeautifulSoup (result.snippet, 'lxml')
-            for data in soup (['style', 'script']):
-                data.decompose()
-            resultSnippet = (' '.join(soup.stripped_strings))
-            resultSnippet = resultSnippet.replace("'", '\'\'')
-            itemSummary = '\'{}\''.format(resultSnippet)
-        else:
-            itemSummary = 'NULL'
-        if result.description != None:
-            soup = BeautifulSoup (result.description, 'lxml')
-            for data in soup (['style', 'script']):
-                data.decompose()
-            resultDescription = (' '.join(soup.stripped_strings))
-            resultDescription = resultDescription.replace("'", '\'\'')
-            itemDescription = '\'{}\''.format(resultDescription)
-        else:
-            itemDescription = 'NULL'
-        if result.licenseInfo != None:
-            soup = BeautifulSoup (result.licenseInfo, 'lxml')
-            for data in soup (['style', 'script']):
-                data.decompose()
-            resultTOU = (' '.join(soup.stripped_strings))
-            resultTOU = resultTOU.replace("'", '\'\'')
-            itemTermsofUse = '\'{}\''.format(resultTOU)
-        else:
-            itemTermsofUse = 'NULL'
-        tag_content = ''
-        if len(result.tags) > 1:
-            tag_content = result.tags[0]
-            for tag in result.tags:
-                tag_content = '{}, {}'.format(tag_content, tag)
-            tag_content = tag_content.split(', ', 1)
-            tag_content = tag_content[1]
-        elif len(result.tags) == 1:
-            tag_content = '{}'.format(result.tags[0])
-        else:
-            tag_content = 'None'
+            if tag_content != 'None':
+                itemTags = tag_content.replace("'", '\'\'')
+                itemTags = '\'{}\''.format(itemTags)
+            else:
+                itemTags = 'NULL'
+            keyword_content = ''
+
+            if len(result.typeKeywords) > 1:
+                keyword_content = result.typeKeywords[0]
+                for keyword in result.typeKeywords:
+                    keyword_content = '{}, {}'.format(keyword_content, keyword)
+                keyword_content = keyword_content.split(', ', 1)
+                keyword_content = keyword_content[1]
+            elif len(result.typeKeywords) == 1:
+                keyword_content = '{}'.format(result.typeKeywords[0])
+            else:
+                keyword_content = 'None'
 
-        if tag_content != 'None':
-            itemTags = tag_content.replace("'", '\'\'')
-            itemTags = '\'{}\''.format(itemTags)
-        else:
-            itemTags = 'NULL'
-        keyword_content = ''
-
-        if len(result.typeKeywords) > 1:
-            keyword_content = result.typeKeywords[0]
-            for keyword in result.typeKeywords:
-                keyword_content = '{}, {}'.format(keyword_content, keyword)
-            keyword_content = keyword_content.split(', ', 1)
-            keyword_content = keyword_content[1]
-        elif len(result.typeKeywords) == 1:
-            keyword_content = '{}'.format(result.typeKeywords[0])
-        else:
-            keyword_content = 'None'
+            if keyword_content != 'None':
+                itemKeywords = '\'{}, {}\''.format(portal['source'], keyword_content)
+            else:
+                itemKeywords = 'NULL'
 
-        if keyword_content != 'None':
-            itemKeywords = '\'{}, {}\''.format(providerSource, keyword_content)
-        else:
-            itemKeywords = 'NULL'
+            sharingConfig = '\'{}\''.format(result.access)
 
-        sharingConfig = '\'{}\''.format(result.access)
+            if result.content_status != '':
+                contentConfig = '\'{}\''.format(result.content_status)
+            else:
+                contentConfig = 'NULL'
 
-        if result.content_status != '':
-            contentConfig = '\'{}\''.format(result.content_status)
-        else:
-            contentConfig = 'NULL'
+            if result.accessInformation != None:
+                contentCredits = '\'{}\''.format(result.accessInformation)
+            else:
+                contentCredits = 'NULL'
+            contentProtected = '\'{}\''.format(result.protected)
+            storageUsed = '{}'.format(result.size)
+            totalViews = '{}'.format(result.numViews)
+            totalRatings = '{}'.format(result.numRatings)
+            avgRating = '{}'.format(result.avgRating)
 
-        if result.accessInformation != None:
-            contentCredits = '\'{}\''.format(result.accessInformation)
-        else:
-            contentCredits = 'NULL'
-        contentProtected = '\'{}\''.format(result.protected)
-        storageUsed = '{}'.format(result.size)
-        totalViews = '{}'.format(result.numViews)
-        totalRatings = '{}'.format(result.numRatings)
-        avgRating = '{}'.format(result.avgRating)
+            #Check if it exists...
+            query_string = '''
 
-        #Check if it exists...
-        query_string = '''
+            select [GlobalID] from [dbo].[GIS_Content] where
+                [itemID] = {}
 
-        select [GlobalID] from [dbo].[GIS_Content] where
-            [itemID] = {}
+            '''.format(contentID)
 
-        '''.format(contentID)
+            query_cursor.execute(query_string)
+            db_return = query_cursor.fetchone()
 
-        query_cursor.execute(query_string)
-        db_return = query_cursor.fetchone()
+            try:
+                tableFK = db_return[0]
+                if debugBIN == 1:
+                    print ('...Updating')
+                    print ('\n\n')
 
-        try:
-            tableFK = db_return[0]
-            if debugBIN == 1:
-                print ('...Updating')
-                print ('\n\n')
+                sqlCommand = '''
 
-            sqlCommand = '''
+                update [dbo].[GIS_Content]
+                set [title] = {}
+                    , [source] = '{}'
+                    , [type] = {}
+                    , [metadataScore] = {}
+                    , [owner] = {}
+                    , [dateCreated] = {}
+                    , [dateModified] = {}
+                    , [itemSummary] = {}
+                    , [itemDescription] = {}
+                    , [itemTermsofUse] = {}
+                    , [itemTags] = {}
+                    , [itemKeywords] = {}
+                    , [sharingConfig] = {}
+                    , [contentConfig] = {}
+                    , [contentCredits] = {}
+                    , [contentProtected] = {}
+                    , [storageUsed] = {}
+                    , [totalViews] = {}
+                    , [totalRatings] = {}
+                    , [avgRating] = {}
+                    , [SysCaptureDate] = getdate()
+                    where [GlobalID] = '{}'
+
+                '''.format(contentTitle, portal['source'], contentType, contentmetadataScore,
+                           owner, dateCreated, dateModified, itemSummary, itemDescription,
+                           itemTermsofUse, itemTags, itemKeywords, sharingConfig, contentConfig,
+                           contentCredits, contentProtected, storageUsed, totalViews, totalRatings,
+                           avgRating, tableFK)
 
-            update [dbo].[GIS_Content]
-            set [title] = {}
-                , [source] = '{}'
-                , [type] = {}
-                , [metadataScore] = {}
-                , [owner] = {}
-                , [dateCreated] = {}
-                , [dateModified] = {}
-                , [itemSummary] = {}
-                , [itemDescription] = {}
-                , [itemTermsofUse] = {}
-                , [itemTags] = {}
-                , [itemKeywords] = {}
-                , [sharingConfig] = {}
-                , [contentConfig] = {}
-                , [contentCredits] = {}
-                , [contentProtected] = {}
-                , [storageUsed] = {}
-                , [totalViews] = {}
-                , [totalRatings] = {}
-                , [avgRating] = {}
-                , [SysCaptureDate] = getdate()
-                where [GlobalID] = '{}'
-
-            '''.format(contentTitle, dataSource, contentType, contentmetadataScore,
-                       owner, dateCreated, dateModified, itemSummary, itemDescription,
-                       itemTermsofUse, itemTags, itemKeywords, sharingConfig, contentConfig,
-                       contentCredits, contentProtected, storageUsed, totalViews, totalRatings,
-                       avgRating, tableFK)
+                query_cursor.execute(sqlCommand)
 
-            query_cursor.execute(sqlCommand)
+            except:
+                if debugBIN == 1:
+                    print ('...Inserting')
+                    print ('\n\n')
 
-        except:
-            if debugBIN == 1:
-                print ('...Inserting')
-                print ('\n\n')
+                sqlCommand = '''
 
-            sqlCommand = '''
+                insert into [dbo].[GIS_Content] (
+                    [itemID]
+                    ,[title]
+                    ,[source]
+                    ,[type]
+                    ,[metadataScore]
+                    ,[owner]
+                    ,[dateCreated]
+                    ,[dateModified]
+                    ,[itemSummary]
+                    ,[itemDescription]
+                    ,[itemTermsofUse]
+                    ,[itemTags]
+                    ,[itemKeywords]
+                    ,[sharingConfig]
+                    ,[contentConfig]
+                    ,[contentCredits]
+                    ,[contentProtected]
+                    ,[storageUsed]
+                    ,[totalViews]
+                    ,[totalRatings]
+                    ,[avgRating]
+                    ,[archived]
+                    ,[SysCaptureDate]
+                    ,[GlobalID]
+                )
+                    Values ({}, {}, '{}',{}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {},
+                    {}, {}, {}, {}, {}, NULL, getdate(), newid())
 
-            insert into [dbo].[GIS_Content] (
-                [itemID]
-                ,[title]
-                ,[source]
-                ,[type]
-                ,[metadataScore]
-                ,[owner]
-                ,[dateCreated]
-                ,[dateModified]
-                ,[itemSummary]
-                ,[itemDescription]
-                ,[itemTermsofUse]
-                ,[itemTags]
-                ,[itemKeywords]
-                ,[sharingConfig]
-                ,[contentConfig]
-                ,[contentCredits]
-                ,[contentProtected]
-                ,[storageUsed]
-                ,[totalViews]
-                ,[totalRatings]
-                ,[avgRating]
-                ,[archived]
-                ,[SysCaptureDate]
-                ,[GlobalID]
-            )
-                Values ({}, {}, '{}',{}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {},
-                {}, {}, {}, {}, {}, NULL, getdate(), newid())
+                '''.format(contentID, contentTitle, portal['source'], contentType, contentmetadataScore,
+                           owner, dateCreated, dateModified, itemSummary, itemDescription,
+                           itemTermsofUse, itemTags, itemKeywords, sharingConfig, contentConfig,
+                           contentCredits, contentProtected, storageUsed, totalViews, totalRatings,
+                           avgRating)
 
-            '''.format(contentID, contentTitle, dataSource, contentType, contentmetadataScore,
-                       owner, dateCreated, dateModified, itemSummary, itemDescription,
-                       itemTermsofUse, itemTags, itemKeywords, sharingConfig, contentConfig,
-                       contentCredits, contentProtected, storageUsed, totalViews, totalRatings,
-                       avgRating)
-
-            query_cursor.execute(sqlCommand)
+                query_cursor.execute(sqlCommand)
 
-    query_conn.commit()
-    query_cursor.close()
-    query_conn.close()
+        query_conn.commit()
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
 
     return
 
-def getToken():
+def getToken(portal):
 #-------------------------------------------------------------------------------
 # Name:        Function - getToken
-# Purpose:  Get's a authentication token from Portal.
+# Purpose:  Get's a authentication token from Portal. Reuses the portal's token
+#           until it is close to expiring.
 #-------------------------------------------------------------------------------
 
-    if portal_URL[-1] == '/':
-        url = portal_URL + 'sharing/rest/generateToken'
-        referrer = portal_URL[0: -1]
-    else:
-        url = portal_URL + '/sharing/rest/generateToken'
-        referrer = portal_URL
+    with portal['tokenLock']:
+        if portal['token'] != None and time.time() < portal['tokenExpires']:
+            return (portal['token'])
 
-    values = {'f': 'json',
-              'username': portal_uName,
-              'password': base64.b64decode(portal_pWord),
-              'referer' : referrer,
-              'expiration' : '120'}
+        portalURL = portal['url']
+        if portalURL[-1] == '/':
+            url = portalURL + 'sharing/rest/generateToken'
+            referrer = portalURL[0: -1]
+        else:
+            url = portalURL + '/sharing/rest/generateToken'
+            referrer = portalURL
 
-    data = urllib.parse.urlencode(values).encode("utf-8")
-    req = urllib.request.Request(url)
+        values = {'f': 'json',
+                  'username': portal['uName'],
+                  'password': base64.b64decode(portal['pWord']),
+                  'referer' : referrer,
+                  'expiration' : '120'}
+
+        data = urllib.parse.urlencode(values).encode("utf-8")
+        req = urllib.request.Request(url)
+
+        the_page = openPortal(portal, 'generateToken', req, data, 3)
+
+        #Garbage Collection with some house building
+        payload_json = the_page.decode('utf8')
+        payload_json = json.loads(payload_json)
+
+        # Refresh 10 minutes ahead of the expiry.
+        portal['token'] = payload_json['token']
+        if 'expires' in payload_json:
+            portal['tokenExpires'] = (payload_json['expires'] / 1000) - 600
+        else:
+            portal['tokenExpires'] = time.time() + (110 * 60)
+
+        data_token = portal['token']
+
+    return (data_token)
+
+def waitForPortal(portal):
+#-------------------------------------------------------------------------------
+# Name:        Function - waitForPortal
+# Purpose:  Holds a request back until it fits under the portal's rate cap.
+#-------------------------------------------------------------------------------
+
+    if portal['requestsPerSecond'] == None:
+        return
 
-    response = None
+    with portal['rateLock']:
+        sendAt = max(portal['nextRequest'], time.time())
+        portal['nextRequest'] = sendAt + (1.0 / portal['requestsPerSecond'])
+
+    waitTime = sendAt - time.time()
+    if waitTime > 0:
+        time.sleep (waitTime)
+        runStats.recordStat('wait', 'portalRateLimit', waitTime)
+
+    return
+
+def openPortal(portal, endpoint, req, data=None, pauseAfter=None):
+#-------------------------------------------------------------------------------
+# Name:        Function - openPortal
+# Purpose:  Sends a request to the portal & hands back the response body,
+#           retrying until it goes through. With pauseAfter, backs off for 10
+#           seconds after that many failures in a row. Each attempt is timed.
+#-------------------------------------------------------------------------------
+
+    the_page = None
     attempt = 0
-    while response is None:
+    retries = 0
+    while the_page is None:
         attempt += 1
-        if attempt > 3:
+        if pauseAfter != None and attempt > pauseAfter:
             time.sleep (10)
+            runStats.recordStat('wait', 'retryBackoff', 10)
             attempt = 0
+        waitForPortal(portal)
+        requestStart = time.time()
         try:
-            response = urllib.request.urlopen(req,data=data)
+            response = urllib.request.urlopen(req, data=data)
+            the_page = response.read()
         except:
-            pass
-
-    the_page = response.read()
-
-    #Garbage Collection with some house building
-    payload_json = the_page.decode('utf8')
-    payload_json = json.loads(payload_json)
+            runStats.recordStat('http', endpoint, time.time() - requestStart, failed=1)
+            retries += 1
 
-    data_token = payload_json['token']
-
-    return (data_token)
+    runStats.recordStat('http', endpoint, time.time() - requestStart, retries=retries)
 
+    return (the_page)
 
-def getPortalID():
+def getPortalID(portal):
 #-------------------------------------------------------------------------------
 # Name:        Function - getPortalID
 # Purpose:  Get the portalID to build the URL strings.
 #-------------------------------------------------------------------------------
 
-    if portal_URL[-1] == '/':
-        url = portal_URL + 'sharing/rest/portals/self'
-        referrer = portal_URL[0: -1]
+    portalURL = portal['url']
+    if portalURL[-1] == '/':
+        url = portalURL + 'sharing/rest/portals/self'
+        referrer = portalURL[0: -1]
     else:
-        url = portal_URL + '/sharing/rest/portals/self'
-        referrer = portal_URL
+        url = portalURL + '/sharing/rest/portals/self'
+        referrer = portalURL
 
-    data_token = getToken()
+    data_token = getToken(portal)
 
     values = {'f': 'json',
               'token': data_token}
@@ -756,13 +1524,7 @@ def getPortalID():
     data = urllib.parse.urlencode(values).encode("utf-8")
     req = urllib.request.Request(url)
 
-    response = None
-    while response is None:
-        try:
-            response = urllib.request.urlopen(req,data=data)
-        except:
-            pass
-    the_page = response.read()
+    the_page = openPortal(portal, 'portals/self', req, data)
 
     #Garbage Collection with some house building
     payload_json = the_page.decode('utf8')
@@ -772,30 +1534,63 @@ def getPortalID():
 
     return (portalID)
 
-def getMetricTargets():
+def getMetricTargets(portal):
 #-------------------------------------------------------------------------------
 # Name:        Function - getMetricTargets
-# Purpose:  Pull targets from the Database.
+# Purpose:  Streams targets from the Database, busiest first. Dormant items
+#           are left out until their last capture is dormantPollDays old.
 #-------------------------------------------------------------------------------
 
-    query_string = '''
+    # Full loads and resumes need every item regardless of activity.
+    if initLoad == 1:
+        dormantFilter = ''
+    else:
+        dormantFilter = '''
+    and (
+        progress.[completedThrough] is NULL
+        or coalesce(usage.[recentRequests], 0) > 0
+        or content.[dateModified] >= getdate()-{}
+        or progress.[completedThrough] <= cast(getdate()-{} as date))'''.format(dormantDays, dormantPollDays)
 
-    select [itemID], [GlobalID], cast ([dateCreated] as date) [dateCreated]
-    from [dbo].[GIS_Content]
-    where [archived] is NULL
-    and [source] = '{}'
-    order by [dateCreated] asc
+    typeList = ', '.join(['\'{}\''.format(priorityType.replace("'", '\'\'')) for priorityType in priorityTypes])
 
-    '''.format(dataSource)
+    query_string = '''
 
-    query_conn = pyodbc.connect(db_conn)
+    select content.[itemID], content.[GlobalID], cast (content.[dateCreated] as date) [dateCreated]
+        , coalesce(usage.[recentRequests], 0) [recentRequests]
+    from [dbo].[GIS_Content] as content
+    left join (
+        select [FkID], sum([requests]) [recentRequests]
+        from [dbo].[GIS_ContentMetrics]
+        where [periodDate] >= cast(getdate()-{} as date)
+        group by [FkID]) as usage on usage.[FkID] = content.[GlobalID]
+    left join [dbo].[GIS_ContentMetricsProgress] as progress on progress.[FkID] = content.[GlobalID]
+    where content.[archived] is NULL
+    and content.[source] = '{}'{}
+    order by
+        case when coalesce(usage.[recentRequests], 0) > 0 then 0 else 1 end
+        , case when content.[type] in ({}) then 0 else 1 end
+        , coalesce(usage.[recentRequests], 0) desc
+        , content.[totalViews] desc
+        , content.[dateModified] desc
+
+    '''.format(dormantDays, portal['source'], dormantFilter, typeList)
+
+    query_conn = getConnection()
     query_cursor = query_conn.cursor()
-    query_cursor.execute(query_string)
-    db_return = query_cursor.fetchall()
-    query_cursor.close()
-    query_conn.close()
+    try:
+        query_cursor.execute(query_string)
+        db_return = query_cursor.fetchmany(targetFetchSize)
+        while len(db_return) > 0:
+            for asset in db_return:
+                if inShard(asset[0]):
+                    yield asset
+            db_return = query_cursor.fetchmany(targetFetchSize)
+    finally:
+        query_cursor.close()
+        releaseConnection(query_conn)
 
-    return(db_return)
+    return
 
 def checkMetricTarget(searchStopDate, fkID):
 #-------------------------------------------------------------------------------
@@ -810,12 +1605,14 @@ def checkMetricTarget(searchStopDate, fkID):
 
     '''.format(searchStopDate, fkID)
 
-    query_conn = pyodbc.connect(db_conn)
-    query_cursor = query_conn.cursor()
-    query_cursor.execute(query_string)
-    db_return = query_cursor.fetchone()
-    query_cursor.close()
-    query_conn.close()
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
+        query_cursor.execute(query_string)
+        db_return = query_cursor.fetchone()
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
 
     return(db_return)
 
@@ -858,18 +1655,21 @@ def buildSearchStop(timeLookbackStop):
 
     return (searchStopDateTS, startDate, zeroTime, searchStopDate)
 
-def getMetric(portalID, data_token, itemID, timehackTS):
+def getMetric(portal, portalID, itemID, timehackTS):
 #-------------------------------------------------------------------------------
 # Name:        Function - getMetric
 # Purpose:  Query API to get metrics.
 #-------------------------------------------------------------------------------
 
-    if portal_URL[-1] == '/':
-        url = portal_URL + 'sharing/rest/portals/{}/usage'.format(portalID)
-        referrer = portal_URL[0: -1]
+    portalURL = portal['url']
+    if portalURL[-1] == '/':
+        url = portalURL + 'sharing/rest/portals/{}/usage'.format(portalID)
+        referrer = portalURL[0: -1]
     else:
-        url = portal_URL + '/sharing/rest/portals/{}/usage'.format(portalID)
-        referrer = portal_URL
+        url = portalURL + '/sharing/rest/portals/{}/usage'.format(portalID)
+        referrer = portalURL
+
+    data_token = getToken(portal)
 
     tempTime = datetime.datetime.fromtimestamp(timehackTS/1000.0)
     deltaTime = datetime.timedelta(days=1)
@@ -892,19 +1692,7 @@ def getMetric(portalID, data_token, itemID, timehackTS):
     data = urllib.parse.urlencode(values).encode("utf-8")
     req = urllib.request.Request(url, data, headers)
 
-    response = None
-    attempt = 0
-    while response is None:
-        attempt += 1
-        if attempt > 3:
-            time.sleep (10)
-            attempt = 0
-        try:
-            response = urllib.request.urlopen(req)
-        except:
-            pass
-
-    the_page = response.read().decode(response.headers.get_content_charset())
+    the_page = openPortal(portal, 'portals/usage', req, None, 3).decode('utf-8')
     payload_json = json.loads(the_page)
 
     if len(payload_json['data']) != 0:
@@ -921,32 +1709,60 @@ def queryPortalUsage(workerPayload):
 # Purpose:  Get the useage data.
 #-------------------------------------------------------------------------------
 
-    query_conn = pyodbc.connect(db_conn)
-    query_cursor = query_conn.cursor()
     itemID = workerPayload[0]
     fkID = workerPayload[1]
     startRecord = workerPayload[2]
     timeStopWindows = workerPayload[3]
     portalID = workerPayload[4]
-    data_token = workerPayload[5]
+    portal = workerPayload[5]
 
-    #Check if it exists...
-    query_string = '''
+    if len(timeStopWindows) == 0:
+        return ()
 
-    select [periodDate] from dbo.GIS_ContentMetrics
-    where [itemID] = '{}' and
-    [FkID] = '{}'
-    order by [periodDate] desc
+    windowStart = max(timeStopWindows[0][0], startRecord)
 
-    '''.format(itemID, fkID)
+    # The connection is only held for the reads, not the HTTP calls below.
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
+        completedFrom, completedThrough = getMetricProgress(query_cursor, fkID)
+
+        # A checkpoint covering the start of the window means everything up to
+        # completedThrough is already stored, so skip the inventory scan.
+        if completedFrom != None and completedFrom <= windowStart:
+            resumeFrom = completedThrough
+            date2BeChecked = set()
+            progressFrom = completedFrom
+            timeStopWindows = buildCatchUpWindows(completedThrough, timeStopWindows[0][0]) + timeStopWindows
+        else:
+            resumeFrom = None
+            progressFrom = windowStart
 
-    query_cursor.execute(query_string)
-    listedInventory = query_cursor.fetchall()
+            #Check if it exists...
+            query_string = '''
 
-    date2BeChecked = []
-    for dateLook in listedInventory:
-        add2List = dateLook[0]
-        date2BeChecked.append(add2List)
+            select [periodDate] from dbo.GIS_ContentMetrics
+            where [itemID] = '{}' and
+            [FkID] = '{}'
+            order by [periodDate] desc
+
+            '''.format(itemID, fkID)
+
+            query_cursor.execute(query_string)
+            listedInventory = query_cursor.fetchall()
+
+            date2BeChecked = set()
+            for dateLook in listedInventory:
+                add2List = dateLook[0].strftime('%Y-%m-%d')
+                date2BeChecked.add(add2List)
+
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
+
+    progressThrough = None
+    sinceCheckpoint = 0
+    metricRows = []
 
     for timehacks in timeStopWindows:
         timehackDT = timehacks[0]
@@ -954,54 +1770,164 @@ def queryPortalUsage(workerPayload):
         insertTrigger = 0
 
         if timehackDT >= startRecord:
+            if resumeFrom != None and timehackDT <= resumeFrom:
+                continue
+
             if debugBIN == 1:
                 print ('\nData is within specifications for review.')
                 print ('Check for insert-- ItemID: {} | Date: {} | timehackTS: {}'.format(itemID, timehackDT, timehackTS))
 
-            if len(date2BeChecked) == 0:
+            if timehackDT.strftime('%Y-%m-%d') not in date2BeChecked:
                 insertTrigger = 1
-            else:
-                if timehackDT.strftime('%Y-%m-%d') not in [uID.strftime('%Y-%m-%d') for uID in date2BeChecked]:
-                    insertTrigger = 1
 
             if  insertTrigger == 1:
                 if debugBIN == 1:
                     print ('*** No data found. Sending to storage...')
-                useageMeter = getMetric(portalID, data_token, itemID, timehackTS)
+                useageMeter = getMetric(portal, portalID, itemID, timehackTS)
                 if debugBIN ==1:
                     print ('Inserting Metrics-- ItemID: {} | Date: {} | Usage: {}'.format(itemID, timehackDT, useageMeter))
 
-                conn = pyodbc.connect(db_conn)
-                cursor = conn.cursor()
-                sqlCommand = '''
-
-                insert into [dbo].[GIS_ContentMetrics] (
-                    [itemID]
-                    ,[periodDate]
-                    ,[requests]
-                    ,[archived]
-                    ,[SysCaptureDate]
-                    ,[FkID]
-                    ,[GlobalID]
-                )
-                    Values ('{}', '{}', {}, NULL, getdate(), '{}', newid())
-
-                '''.format(itemID, timehackDT, useageMeter, fkID)
-
-                query_cursor.execute(sqlCommand)
+                metricRows.append((itemID, timehackDT, useageMeter, None, datetime.datetime.now(), fkID, str(uuid.uuid4())))
+                sinceCheckpoint += 1
                 if debugBIN ==1:
                     print ('    Committed....\n')
             else:
                 if debugBIN == 1:
                     print ('*** Data Already stored.')
 
-    query_conn.commit()
-    query_cursor.close()
-    query_conn.close()
+            progressThrough = timehackDT
+
+            # Metrics and the checkpoint go in together so a restart never skips a gap.
+            if sinceCheckpoint >= checkpointEvery:
+                saveMetricCheckpoint(metricRows, fkID, itemID, progressFrom, progressThrough)
+                sinceCheckpoint = 0
+
+    if progressThrough != None:
+        if completedThrough != None and completedThrough > progressThrough and completedFrom <= progressThrough:
+            progressThrough = completedThrough
+        saveMetricCheckpoint(metricRows, fkID, itemID, progressFrom, progressThrough)
+    else:
+        saveMetricCheckpoint(metricRows, fkID, itemID, None, None)
 
     return ()
 
-def buildQueryForFast():
+def buildCatchUpWindows(completedThrough, windowFirst):
+#-------------------------------------------------------------------------------
+# Name:        Function - buildCatchUpWindows
+# Purpose:  Date windows between an item's checkpoint and the nightly window,
+#           for items that were skipped on earlier runs.
+#-------------------------------------------------------------------------------
+
+    catchUpWindows = []
+    dayWindow = datetime.timedelta(days=1)
+    zeroTime = datetime.datetime.min.time()
+    searchDate = completedThrough + dayWindow
+    while searchDate < windowFirst:
+        timeWindow = datetime.datetime.combine(searchDate, zeroTime).timestamp()
+        timeWindow = int(float(timeWindow)*1000)
+        catchUpWindows.append([searchDate, timeWindow])
+        searchDate = searchDate + dayWindow
+
+    return (catchUpWindows)
+
+def getMetricProgress(query_cursor, fkID):
+#-------------------------------------------------------------------------------
+# Name:        Function - getMetricProgress
+# Purpose:  Pulls the metrics checkpoint for an item.
+#-------------------------------------------------------------------------------
+
+    query_string = '''
+
+    select [completedFrom], [completedThrough]
+    from [dbo].[GIS_ContentMetricsProgress]
+    where [FkID] = '{}'
+
+    '''.format(fkID)
+
+    query_cursor.execute(query_string)
+    db_return = query_cursor.fetchone()
+
+    if db_return == None:
+        return (None, None)
+
+    return (db_return[0], db_return[1])
+
+def storeMetricRows(query_cursor, metricRows):
+#-------------------------------------------------------------------------------
+# Name:        Function - storeMetricRows
+# Purpose:  Bulk appends pending metric rows and empties the list. Caller commits.
+#-------------------------------------------------------------------------------
+
+    if len(metricRows) == 0:
+        return
+
+    runStats.addCount('metricRows', len(metricRows))
+    storageBackend.bulkInsert(query_cursor, '[dbo].[GIS_ContentMetrics]',
+                              ['[itemID]', '[periodDate]', '[requests]', '[archived]',
+                               '[SysCaptureDate]', '[FkID]', '[GlobalID]'],
+                              metricRows)
+    del metricRows[:]
+
+    return
+
+def saveMetricProgress(query_cursor, fkID, itemID, completedFrom, completedThrough):
+#-------------------------------------------------------------------------------
+# Name:        Function - saveMetricProgress
+# Purpose:  Records how far metrics capture got for an item. Caller commits.
+#-------------------------------------------------------------------------------
+
+    sqlCommand = '''
+
+    update [dbo].[GIS_ContentMetricsProgress]
+    set [completedFrom] = '{}'
+        , [completedThrough] = '{}'
+        , [SysCaptureDate] = getdate()
+        where [FkID] = '{}'
+
+    '''.format(completedFrom, completedThrough, fkID)
+
+    query_cursor.execute(sqlCommand)
+
+    if query_cursor.rowcount == 0:
+        sqlCommand = '''
+
+        insert into [dbo].[GIS_ContentMetricsProgress] (
+            [itemID]
+            ,[completedFrom]
+            ,[completedThrough]
+            ,[SysCaptureDate]
+            ,[FkID]
+        )
+            Values ('{}', '{}', '{}', getdate(), '{}')
+
+        '''.format(itemID, completedFrom, completedThrough, fkID)
+
+        query_cursor.execute(sqlCommand)
+
+    return
+
+def saveMetricCheckpoint(metricRows, fkID, itemID, completedFrom, completedThrough):
+#-------------------------------------------------------------------------------
+# Name:        Function - saveMetricCheckpoint
+# Purpose:  Stores pending metric rows & the checkpoint in one commit, on a
+#           connection taken just for the write. No checkpoint is written
+#           when completedThrough is None.
+#-------------------------------------------------------------------------------
+
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
+        storeMetricRows(query_cursor, metricRows)
+        if completedThrough != None:
+            saveMetricProgress(query_cursor, fkID, itemID, completedFrom, completedThrough)
+        query_conn.commit()
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
+
+    return
+
+def buildQueryForFast(portal):
 #-------------------------------------------------------------------------------
 # Name:        Function - buildQueryForFast
 # Purpose:  Do more faster.
@@ -1016,34 +1942,227 @@ def buildQueryForFast():
 
     searchStopDateTS, startDate, zeroTime, searchStopDate = buildSearchStop(timeLookbackStop)
     timeStopWindows = buildDateWindow(startDate, zeroTime, timeLookbackWindow, searchStopDateTS)
-    portalID = getPortalID()
-    db_return = getMetricTargets()
-    data_token = getToken()
+    portalID = getPortalID(portal)
+
+    print ('\nBuilding Payload For Metrics Scan & Capture ({})....'.format(portal['source']))
+    workerPayload = buildMetricPayload(getMetricTargets(portal), timeStopWindows, portalID, portal)
+    runMetricWorkers(queryPortalUsage, workerPayload)
+
+    if initLoad != 1:
+        runBackfill(portal, portalID, startDate, timeLookbackWindow)
+
+    return
+
+def buildMetricPayload(metricTargets, windowSpec, portalID, portal):
+#-------------------------------------------------------------------------------
+# Name:        Function - buildMetricPayload
+# Purpose:  Hands out worker payloads one at a time as the targets stream in.
+#-------------------------------------------------------------------------------
+
+    for asset in metricTargets:
+        itemID = asset[0]
+        fkID = asset[1]
+        startRecord = asset[2]
+        yield (itemID, fkID, startRecord, windowSpec, portalID, portal)
+
+    return
+
+def runMetricWorkers(workerFunction, workerPayload):
+#-------------------------------------------------------------------------------
+# Name:        Function - runMetricWorkers
+# Purpose:  Feeds the payload through the thread pool, keeping no more than
+#           metricsQueueDepth in flight, or one by one in slow-mo. Stops
+#           handing out work once captureStop is set.
+#-------------------------------------------------------------------------------
 
-    workerPayload = []
-    print ('\nBuilding Payload For Metrics Scan & Capture....')
     if initLoad == 1 or workFastest == 1:
-        for asset in db_return:
-            itemID = asset[0]
-            fkID = asset[1]
-            startRecord = asset[2]
-            prepData = (itemID, fkID, startRecord, timeStopWindows, portalID, data_token)
-            workerPayload.append(prepData)
         print ('    -- Sending Payload....')
-        with concurrent.futures.ThreadPoolExecutor(max_workers=None, thread_name_prefix='AGOL_') as executor:
-            results = list(tqdm(executor.map(queryPortalUsage, workerPayload), total = len(workerPayload)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=metricsWorkers, thread_name_prefix='AGOL_') as executor:
+            with tqdm() as progressBar:
+                inFlight = set()
+                for prepData in workerPayload:
+                    if captureStop.is_set():
+                        break
+                    if len(inFlight) >= metricsQueueDepth:
+                        workersDone, inFlight = concurrent.futures.wait(inFlight, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in workersDone:
+                            future.result()
+                            progressBar.update(1)
+                            runStats.addCount('items')
+                    inFlight.add(executor.submit(runStats.inPhase, runStats.getPhase(), workerFunction, prepData))
+
+                workersDone, inFlight = concurrent.futures.wait(inFlight)
+                for future in workersDone:
+                    future.result()
+                    progressBar.update(1)
+                    runStats.addCount('items')
     else:
         print ('\nSending Payloads For Metrics Scan & Capture via slow-mo mode....')
-        for asset in tqdm(db_return):
-            itemID = asset[0]
-            fkID = asset[1]
-            startRecord = asset[2]
-            prepData = (itemID, fkID, startRecord, timeStopWindows, portalID, data_token)
-            queryPortalUsage(prepData)
+        for prepData in tqdm(workerPayload):
+            if captureStop.is_set():
+                break
+            workerFunction(prepData)
+            runStats.addCount('items')
+
+    if captureStop.is_set():
+        raise RuntimeError('Metrics capture was stopped before the payload was finished.')
 
     return
 
-def getWebMapSources(portal_URL, portal_uName, portal_pWord):
+def buildBackfillSlices(startDate, timeLookbackWindow):
+#-------------------------------------------------------------------------------
+# Name:        Function - buildBackfillSlices
+# Purpose:  Splits history past the nightly window into slices, newest first.
+#-------------------------------------------------------------------------------
+
+    backfillSlices = []
+    dayBack = timeLookbackWindow
+    while dayBack < backfillDays:
+        dayBack = min(dayBack + backfillSliceDays, backfillDays)
+        sliceFloor = startDate - datetime.timedelta(dayBack)
+        backfillSlices.append(sliceFloor)
+
+    return (backfillSlices)
+
+def backfillBudgetLeft(portal):
+#-------------------------------------------------------------------------------
+# Name:        Function - backfillBudgetLeft
+# Purpose:  Checks whether the portal's backfill budget has anything left.
+#-------------------------------------------------------------------------------
+
+    if portal['backfillDeadline'] != None and time.time() > portal['backfillDeadline']:
+        return (False)
+    if portal['backfillRemaining'] != None and portal['backfillRemaining'] <= 0:
+        return (False)
+
+    return (True)
+
+def claimBackfillRequest(portal):
+#-------------------------------------------------------------------------------
+# Name:        Function - claimBackfillRequest
+# Purpose:  Takes one request from the portal's backfill budget if any is left.
+#-------------------------------------------------------------------------------
+
+    with portal['backfillLock']:
+        if backfillBudgetLeft(portal) == False:
+            return (False)
+        if portal['backfillRemaining'] != None:
+            portal['backfillRemaining'] -= 1
+
+    return (True)
+
+def runBackfill(portal, portalID, startDate, timeLookbackWindow):
+#-------------------------------------------------------------------------------
+# Name:        Function - runBackfill
+# Purpose:  Fills in older history a slice at a time within the run's budget.
+#-------------------------------------------------------------------------------
+
+    backfillSlices = buildBackfillSlices(startDate, timeLookbackWindow)
+    if len(backfillSlices) == 0:
+        return
+
+    with portal['backfillLock']:
+        # The portal quota is shared, so each shard gets its cut of the budget.
+        if backfillRequests != None:
+            portal['backfillRemaining'] = backfillRequests // shardCount
+        else:
+            portal['backfillRemaining'] = None
+        if backfillMinutes != None:
+            portal['backfillDeadline'] = time.time() + (backfillMinutes * 60)
+        else:
+            portal['backfillDeadline'] = None
+
+    print ('\nBackfilling Metrics History ({})....'.format(portal['source']))
+    for sliceFloor in backfillSlices:
+        with portal['backfillLock']:
+            budgetLeft = backfillBudgetLeft(portal)
+        if budgetLeft == False:
+            print ('    -- Backfill budget used up. Picking up here next run.')
+            break
+
+        print ('    -- Back to {}'.format(sliceFloor))
+        workerPayload = buildMetricPayload(getMetricTargets(portal), sliceFloor, portalID, portal)
+        runMetricWorkers(queryPortalBackfill, workerPayload)
+
+    return
+
+def queryPortalBackfill(workerPayload):
+#-------------------------------------------------------------------------------
+# Name:        Function - queryPortalBackfill
+# Purpose:  Walks an item's history backwards from its checkpoint to the floor.
+#-------------------------------------------------------------------------------
+
+    itemID = workerPayload[0]
+    fkID = workerPayload[1]
+    startRecord = workerPayload[2]
+    sliceFloor = workerPayload[3]
+    portalID = workerPayload[4]
+    portal = workerPayload[5]
+
+    backfillFloor = max(sliceFloor, startRecord)
+
+    dayWindow = datetime.timedelta(days=1)
+    zeroTime = datetime.datetime.min.time()
+
+    # The connection is only held for the reads, not the HTTP calls below.
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
+
+        # Only items whose checkpoint stops above the floor have anything to do.
+        completedFrom, completedThrough = getMetricProgress(query_cursor, fkID)
+        if completedFrom == None or completedFrom <= backfillFloor:
+            query_cursor.close()
+            return ()
+
+        query_string = '''
+
+        select [periodDate] from dbo.GIS_ContentMetrics
+        where [FkID] = '{}' and
+        [periodDate] between '{}' and '{}'
+
+        '''.format(fkID, backfillFloor, completedFrom - dayWindow)
+
+        query_cursor.execute(query_string)
+        listedInventory = query_cursor.fetchall()
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
+
+    date2BeChecked = set()
+    for dateLook in listedInventory:
+        date2BeChecked.add(dateLook[0].strftime('%Y-%m-%d'))
+
+    sinceCheckpoint = 0
+    metricRows = []
+    timehackDT = completedFrom - dayWindow
+    while timehackDT >= backfillFloor:
+        if timehackDT.strftime('%Y-%m-%d') not in date2BeChecked:
+            if claimBackfillRequest(portal) == False:
+                break
+
+            timehackTS = datetime.datetime.combine(timehackDT, zeroTime).timestamp()
+            timehackTS = int(float(timehackTS)*1000)
+            useageMeter = getMetric(portal, portalID, itemID, timehackTS)
+            if debugBIN ==1:
+                print ('Backfilling Metrics-- ItemID: {} | Date: {} | Usage: {}'.format(itemID, timehackDT, useageMeter))
+
+            metricRows.append((itemID, timehackDT, useageMeter, None, datetime.datetime.now(), fkID, str(uuid.uuid4())))
+            sinceCheckpoint += 1
+
+        completedFrom = timehackDT
+
+        if sinceCheckpoint >= checkpointEvery:
+            saveMetricCheckpoint(metricRows, fkID, itemID, completedFrom, completedThrough)
+            sinceCheckpoint = 0
+
+        timehackDT = timehackDT - dayWindow
+
+    saveMetricCheckpoint(metricRows, fkID, itemID, completedFrom, completedThrough)
+
+    return ()
+
+def getWebMapSources(portal):
 #-------------------------------------------------------------------------------
 # Name:        Function - getWebMapSources
 # Purpose:  
@@ -1051,8 +2170,8 @@ def getWebMapSources(portal_URL, portal_uName, portal_pWord):
     errorLoc = 'queryPortal'
 
     try:
-        portal_pWordDec = base64.b64decode(portal_pWord).decode("utf-8")
-        gis = GIS('{}'.format(portal_URL), '{}'.format(portal_uName), '{}'.format(portal_pWordDec))
+        portal_pWordDec = base64.b64decode(portal['pWord']).decode("utf-8")
+        gis = GIS('{}'.format(portal['url']), '{}'.format(portal['uName']), '{}'.format(portal_pWordDec))
         errorCond = 0
         errorResponse = ''
 
@@ -1062,65 +2181,99 @@ def getWebMapSources(portal_URL, portal_uName, portal_pWord):
         # Gotta do something with this eventually.
         return
 
-    query_conn = pyodbc.connect(db_conn)
-    query_cursor = query_conn.cursor()
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
 
-    sqlCommand = '''
+        # Only clear this portal's sources, other portals may be mid capture.
+        sqlCommand = '''
 
-    truncate table [dbo].[GIS_ContentSources]
+        delete from [dbo].[GIS_ContentSources]
+            where [FkID] in (
+                select [GlobalID] from [dbo].[GIS_Content]
+                where [source] = '{}')
 
-    '''
+        '''.format(portal['source'])
 
-    query_cursor.execute(sqlCommand)
-    query_conn.commit()
+        query_cursor.execute(sqlCommand)
+        query_conn.commit()
 
-    #Check if it exists...
-    query_string = '''
+        #Check if it exists...
+        query_string = '''
 
-    select 
-	    [itemID]
-	    , [GlobalID]
-    from [dbo].[GIS_Content] where [type] = 'Web Map' and [archived] is NULL
-    order by [dateModified] desc
+        select 
+    	    [itemID]
+    	    , [GlobalID]
+        from [dbo].[GIS_Content] where [type] = 'Web Map' and [archived] is NULL
+        and [source] = '{}'
+        order by [dateModified] desc
 
-    '''
+        '''.format(portal['source'])
 
-    query_cursor.execute(query_string)
-    mapInventory = query_cursor.fetchall()
-
-    print ('\nCapturing Webmap Data Sources....')
-
-    for wmf in tqdm(mapInventory):
-        wmSearch = wmf[0]
-        fkID = wmf[1]
-
-        wmItem = gis.content.get(wmSearch)
-        webMap = WebMap(wmItem)
-        #print ('Title:  {}'.format(wmItem.title))
-        wmTitle = wmItem.title
-        #print ('Item ID:  {}'.format(wmSearch))
-        #print ('----------------------------------------------')
-        if len(webMap.layers)>0:
-            for layer in webMap.layers:
-                try:
-                    if layer.layerType == 'GroupLayer':
-                        for grpdlayer in layer.layers:
-                            if grpdlayer.layerType == 'GroupLayer':
-                                for grpdlayer2 in grpdlayer.layers:
-                                    if grpdlayer2.layerType == 'GroupLayer':
-                                        for grpdlayer3 in grpdlayer2.layers:
-                                            layerTitle = grpdlayer3.title
-                                            layerID = grpdlayer3.id
-                                            try:
-                                                layerType = grpdlayer3.layerType
-                                                if grpdlayer3.layerType != 'VectorTileLayer':
+        query_cursor.execute(query_string)
+        mapInventory = query_cursor.fetchall()
+
+        print ('\nCapturing Webmap Data Sources ({})....'.format(portal['source']))
+
+        for wmf in tqdm(mapInventory):
+            runStats.addCount('items')
+            wmSearch = wmf[0]
+            fkID = wmf[1]
+
+            wmItem = gis.content.get(wmSearch)
+            webMap = WebMap(wmItem)
+            #print ('Title:  {}'.format(wmItem.title))
+            wmTitle = wmItem.title
+            #print ('Item ID:  {}'.format(wmSearch))
+            #print ('----------------------------------------------')
+            if len(webMap.layers)>0:
+                for layer in webMap.layers:
+                    try:
+                        if layer.layerType == 'GroupLayer':
+                            for grpdlayer in layer.layers:
+                                if grpdlayer.layerType == 'GroupLayer':
+                                    for grpdlayer2 in grpdlayer.layers:
+                                        if grpdlayer2.layerType == 'GroupLayer':
+                                            for grpdlayer3 in grpdlayer2.layers:
+                                                layerTitle = grpdlayer3.title
+                                                layerID = grpdlayer3.id
+                                                try:
+                                                    layerType = grpdlayer3.layerType
+                                                    if grpdlayer3.layerType != 'VectorTileLayer':
+                                                        try:
+                                                            layerURL = grpdlayer3.url
+                                                        except:
+                                                            layerURL = None
+                                                    else:
+                                                        try:
+                                                            layerItemID = grpdlayer3.itemId
+                                                            layerURL = layerItemID
+                                                        except:
+                                                            layerItemID = None
+                                                            layerURL = layerItemID
+                                                except:
+                                                    layerType = None
                                                     try:
                                                         layerURL = grpdlayer3.url
                                                     except:
                                                         layerURL = None
+                                                try:
+                                                    layerVisibility = grpdlayer3.visibility
+                                                except:
+                                                    layerVisibility = None
+                                        else:
+                                            layerTitle = grpdlayer2.title
+                                            layerID = grpdlayer2.id
+                                            try:
+                                                layerType = grpdlayer2.layerType
+                                                if grpdlayer2.layerType != 'VectorTileLayer':
+                                                    try:
+                                                        layerURL = grpdlayer2.url
+                                                    except:
+                                                        layerURL = None
                                                 else:
                                                     try:
-                                                        layerItemID = grpdlayer3.itemId
+                                                        layerItemID = grpdlayer2.itemId
                                                         layerURL = layerItemID
                                                     except:
                                                         layerItemID = None
@@ -1128,214 +2281,166 @@ def getWebMapSources(portal_URL, portal_uName, portal_pWord):
                                             except:
                                                 layerType = None
                                                 try:
-                                                    layerURL = grpdlayer3.url
+                                                    layerURL = grpdlayer2.url
                                                 except:
                                                     layerURL = None
                                             try:
-                                                layerVisibility = grpdlayer3.visibility
+                                                layerVisibility = grpdlayer2.visibility
                                             except:
                                                 layerVisibility = None
-                                    else:
-                                        layerTitle = grpdlayer2.title
-                                        layerID = grpdlayer2.id
-                                        try:
-                                            layerType = grpdlayer2.layerType
-                                            if grpdlayer2.layerType != 'VectorTileLayer':
-                                                try:
-                                                    layerURL = grpdlayer2.url
-                                                except:
-                                                    layerURL = None
-                                            else:
-                                                try:
-                                                    layerItemID = grpdlayer2.itemId
-                                                    layerURL = layerItemID
-                                                except:
-                                                    layerItemID = None
-                                                    layerURL = layerItemID
-                                        except:
-                                            layerType = None
+                                else:
+                                    layerTitle = grpdlayer.title
+                                    layerID = grpdlayer.id
+                                    try:
+                                        layerType = grpdlayer.layerType
+                                        if grpdlayer.layerType != 'VectorTileLayer':
                                             try:
-                                                layerURL = grpdlayer2.url
+                                                layerURL = grpdlayer.url
                                             except:
                                                 layerURL = None
-                                        try:
-                                            layerVisibility = grpdlayer2.visibility
-                                        except:
-                                            layerVisibility = None
-                            else:
-                                layerTitle = grpdlayer.title
-                                layerID = grpdlayer.id
-                                try:
-                                    layerType = grpdlayer.layerType
-                                    if grpdlayer.layerType != 'VectorTileLayer':
+                                        else:
+                                            try:
+                                                layerItemID = grpdlayer.itemId
+                                                layerURL = layerItemID
+                                            except:
+                                                layerItemID = None
+                                                layerURL = layerItemID
+                                    except:
+                                        layerType = None
                                         try:
                                             layerURL = grpdlayer.url
                                         except:
                                             layerURL = None
-                                    else:
-                                        try:
-                                            layerItemID = grpdlayer.itemId
-                                            layerURL = layerItemID
-                                        except:
-                                            layerItemID = None
-                                            layerURL = layerItemID
-                                except:
-                                    layerType = None
                                     try:
-                                        layerURL = grpdlayer.url
+                                        layerVisibility = grpdlayer.visibility
+                                    except:
+                                        layerVisibility = None
+                        else:
+                            layerTitle = layer.title
+                            layerID = layer.id
+                            try:
+                                layerType = layer.layerType
+                                if layer.layerType != 'VectorTileLayer':
+                                    try:
+                                        layerURL = layer.url
                                     except:
                                         layerURL = None
-                                try:
-                                    layerVisibility = grpdlayer.visibility
-                                except:
-                                    layerVisibility = None
-                    else:
-                        layerTitle = layer.title
-                        layerID = layer.id
-                        try:
-                            layerType = layer.layerType
-                            if layer.layerType != 'VectorTileLayer':
+                                else:
+                                    try:
+                                        layerItemID = layer.itemId
+                                        layerURL = layerItemID
+                                    except:
+                                        layerItemID = None
+                                        layerURL = layerItemID
+                            except:
+                                layerType = None
                                 try:
                                     layerURL = layer.url
                                 except:
                                     layerURL = None
-                            else:
-                                try:
-                                    layerItemID = layer.itemId
-                                    layerURL = layerItemID
-                                except:
-                                    layerItemID = None
-                                    layerURL = layerItemID
-                        except:
-                            layerType = None
                             try:
-                                layerURL = layer.url
+                                layerVisibility = layer.visibility
                             except:
-                                layerURL = None
+                                layerVisibility = None
+                    except:
+                        layerTitle = layer.title
+                        layerID = layer.id
+                        layerType = None
+                        try:
+                            layerURL = layer.url
+                        except:
+                            layerURL = None
                         try:
                             layerVisibility = layer.visibility
                         except:
                             layerVisibility = None
-                except:
-                    layerTitle = layer.title
-                    layerID = layer.id
-                    layerType = None
-                    try:
-                        layerURL = layer.url
-                    except:
-                        layerURL = None
-                    try:
-                        layerVisibility = layer.visibility
-                    except:
-                        layerVisibility = None
-
-                #print ('    Layer Title:  {}'.format(layerTitle))
-                #print ('    Layer Map ID: {}'.format(layerID))
-                #print ('    Layer Type: {}'.format(layerType))
-                #print ('    Layer Source URL: {}'.format(layerURL))
-                #print ('    Layer Default Visibility: {}\n'.format(layerVisibility))
-                layerTitle = layerTitle.replace('\'', '')
-                if layerType == None:
-                    layerType = 'NULL'
-                else:
-                    layerType = '\'{}\''.format(layerType)
-                if layerURL == None:
-                    layerURL = 'NULL'
-                else:
-                    layerURL = '\'{}\''.format(layerURL)
 
-                sqlCommand = '''
+                    #print ('    Layer Title:  {}'.format(layerTitle))
+                    #print ('    Layer Map ID: {}'.format(layerID))
+                    #print ('    Layer Type: {}'.format(layerType))
+                    #print ('    Layer Source URL: {}'.format(layerURL))
+                    #print ('    Layer Default Visibility: {}\n'.format(layerVisibility))
+                    layerTitle = layerTitle.replace('\'', '')
+                    if layerType == None:
+                        layerType = 'NULL'
+                    else:
+                        layerType = '\'{}\''.format(layerType)
+                    if layerURL == None:
+                        layerURL = 'NULL'
+                    else:
+                        layerURL = '\'{}\''.format(layerURL)
 
-                insert into [dbo].[GIS_ContentSources] (
-                    [layerID]
-                    ,[layerTitle]
-                    ,[layerType]
-                    ,[layerSource]
-                    ,[layerVisibility]
-                    ,[layerTest]
-                    ,[SysCaptureDate]
-                    ,[FkID]
-                    ,[GlobalID]
-                )
-                    Values ('{}', '{}', {}, {}, '{}', NULL, getdate(), '{}', newid())
+                    sqlCommand = '''
 
-                '''.format(layerID, layerTitle, layerType, layerURL, layerVisibility, fkID)
+                    insert into [dbo].[GIS_ContentSources] (
+                        [layerID]
+                        ,[layerTitle]
+                        ,[layerType]
+                        ,[layerSource]
+                        ,[layerVisibility]
+                        ,[layerTest]
+                        ,[SysCaptureDate]
+                        ,[FkID]
+                        ,[GlobalID]
+                    )
+                        Values ('{}', '{}', {}, {}, '{}', NULL, getdate(), '{}', newid())
 
-                query_cursor.execute(sqlCommand)
+                    '''.format(layerID, layerTitle, layerType, layerURL, layerVisibility, fkID)
+
+                    query_cursor.execute(sqlCommand)
 
 
-    query_conn.commit()
-    query_cursor.close()
-    query_conn.close()
+        query_conn.commit()
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
 
 
 
     return
 
-def disasterStore():
+def disasterStore(portal):
 #-------------------------------------------------------------------------------
 # Name:        Function - disasterStore
 # Purpose:  
 #-------------------------------------------------------------------------------
     errorLoc = 'disasterStore'
 
-    query_conn = pyodbc.connect(db_conn)
-    query_cursor = query_conn.cursor()
-
-    query_string = '''
-
-    select 
-	    [itemID]
-	    , [GlobalID]
-        , [dateModified]
-    from [dbo].[GIS_Content] where [source] = '{}' and [archived] is NULL
-    and cast(dateModified as date) = cast(getdate()-1 as date)
-    order by [dateModified] desc
-
-    '''.format(dataSource)
-
-    query_cursor.execute(query_string)
-    fullInventory = query_cursor.fetchall()
-    data_token = getToken()
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
 
-    print ('\nBacking Up Changes...')
+        query_string = '''
 
-    for item in tqdm(fullInventory):
-        itemID = '{}'.format(item[0])
-        fkID = '{}'.format(item[1])
-        dateModified = '{}'.format(item[2])
+        select 
+    	    [itemID]
+    	    , [GlobalID]
+            , [dateModified]
+        from [dbo].[GIS_Content] where [source] = '{}' and [archived] is NULL
+        and cast(dateModified as date) = cast(getdate()-1 as date)
+        order by [dateModified] desc
 
-        if portal_URL[-1] == '/':
-            url = portal_URL + 'sharing/rest/content/items/{}/description'.format(itemID)
-            referrer = portal_URL[0: -1]
-        else:
-            url = portal_URL + '/sharing/rest/content/items/{}/description'.format(itemID)
-            referrer = portal_URL
+        '''.format(portal['source'])
 
-        values = {'f': 'pjson',
-                  'token': data_token}
+        query_cursor.execute(query_string)
+        fullInventory = [item for item in query_cursor.fetchall() if inShard(item[0])]
 
-        data = urllib.parse.urlencode(values).encode("utf-8")
-        req = urllib.request.Request(url)
+        print ('\nBacking Up Changes ({})...'.format(portal['source']))
 
-        response = None
-        while response is None:
-            try:
-                response = urllib.request.urlopen(req,data=data)
-            except:
-                pass
-        the_page = response.read()
-        payload_json = the_page.decode('utf8')
-        payloadDescription = json.loads(payload_json)
-        payloadDescription = json.dumps(payloadDescription, indent=4)
+        for item in tqdm(fullInventory):
+            runStats.addCount('items')
+            itemID = '{}'.format(item[0])
+            fkID = '{}'.format(item[1])
+            dateModified = '{}'.format(item[2])
 
-        try: 
-            if portal_URL[-1] == '/':
-                url = portal_URL + 'sharing/rest/content/items/{}/data'.format(itemID)
-                referrer = portal_URL[0: -1]
+            portalURL = portal['url']
+            data_token = getToken(portal)
+            if portalURL[-1] == '/':
+                url = portalURL + 'sharing/rest/content/items/{}/description'.format(itemID)
+                referrer = portalURL[0: -1]
             else:
-                url = portal_URL + '/sharing/rest/content/items/{}/data'.format(itemID)
-                referrer = portal_URL
+                url = portalURL + '/sharing/rest/content/items/{}/description'.format(itemID)
+                referrer = portalURL
 
             values = {'f': 'pjson',
                       'token': data_token}
@@ -1343,74 +2448,555 @@ def disasterStore():
             data = urllib.parse.urlencode(values).encode("utf-8")
             req = urllib.request.Request(url)
 
-            response = None
-            while response is None:
-                try:
-                    response = urllib.request.urlopen(req,data=data)
-                except:
-                    pass
-            the_page = response.read()
+            the_page = openPortal(portal, 'content/items/description', req, data)
             payload_json = the_page.decode('utf8')
-            payloadData = json.loads(payload_json)
-            payloadData = json.dumps(payloadData, indent=4)
-        except:
-            payloadData = 'Cannot Access Data JSON'
+            payloadDescription = json.loads(payload_json)
+            payloadDescription = json.dumps(payloadDescription, indent=4)
+
+            try: 
+                if portalURL[-1] == '/':
+                    url = portalURL + 'sharing/rest/content/items/{}/data'.format(itemID)
+                    referrer = portalURL[0: -1]
+                else:
+                    url = portalURL + '/sharing/rest/content/items/{}/data'.format(itemID)
+                    referrer = portalURL
+
+                values = {'f': 'pjson',
+                          'token': data_token}
+
+                data = urllib.parse.urlencode(values).encode("utf-8")
+                req = urllib.request.Request(url)
+
+                the_page = openPortal(portal, 'content/items/data', req, data)
+                payload_json = the_page.decode('utf8')
+                payloadData = json.loads(payload_json)
+                payloadData = json.dumps(payloadData, indent=4)
+            except:
+                payloadData = 'Cannot Access Data JSON'
 
-        payloadDescription = r'{}'.format(payloadDescription.replace('\'', '\'\''))
-        payloadData = r'{}'.format(payloadData.replace('\'', '\'\''))
+            payloadDescription = r'{}'.format(payloadDescription.replace('\'', '\'\''))
+            payloadData = r'{}'.format(payloadData.replace('\'', '\'\''))
 
+            sqlCommand = '''
+
+            insert into [dbo].[GIS_ContentConfig] (
+                [itemID]
+                ,[dateModified]
+                ,[description]
+                ,[data]
+                ,[archived]
+                ,[SysCaptureDate]
+                ,[FkID]
+                ,[GlobalID]
+            )
+                Values ('{}', '{}', '{}', '{}', NULL, getdate(), '{}', newid())
+
+            '''.format(itemID, dateModified, payloadDescription, payloadData, fkID)
+
+            query_cursor.execute(sqlCommand)
+            query_conn.commit()
+
+        # Cascade archival to the config backups in one pass. One shard is enough.
+        if shardIndex == 0:
+            sqlCommand = '''
+
+            update [dbo].[GIS_ContentConfig]
+            set [archived] = 'TRUE'
+                where [archived] is NULL
+                and [FkID] in (
+                    select [GlobalID] from [dbo].[GIS_Content]
+                    where [source] = '{}'
+                    and [archived] is not NULL)
+
+            '''.format(portal['source'])
+
+            query_cursor.execute(sqlCommand)
+            query_conn.commit()
+
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
+
+    return
+
+def refreshReportTables():
+#-------------------------------------------------------------------------------
+# Name:        Function - refreshReportTables
+# Purpose:  Rebuilds the MV_SVC_* reporting tables from this run's content &
+#           metrics. Each is built in its staging table first, then both are
+#           swapped in within one transaction so readers never see them half
+#           done or out of step. On SQL Server the swap is a truncate & a
+#           partition switch, so no row is copied a second time. SQLite has
+#           no switch and copies the staged rows over instead.
+#-------------------------------------------------------------------------------
+
+    print ('\nRefreshing Reporting Tables....')
+
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
+
+        query_cursor.execute('truncate table [dbo].[MV_SVC_GISContent_Stage]')
         sqlCommand = '''
 
-        insert into [dbo].[GIS_ContentConfig] (
-            [itemID]
-            ,[dateModified]
-            ,[description]
-            ,[data]
-            ,[archived]
-            ,[SysCaptureDate]
-            ,[FkID]
-            ,[GlobalID]
-        )
-            Values ('{}', '{}', '{}', '{}', NULL, getdate(), '{}', newid())
+        insert into [dbo].[MV_SVC_GISContent_Stage]
+            select
+                CAST(ROW_NUMBER() over(order by [dateCreated] asc) as int) as [ObjectID]
+                , [itemID]
+                , [title]
+                , [source]
+                , [type]
+                , [metadataScore]
+                , [owner]
+                , [dateCreated]
+                , [dateModified]
+                , [itemSummary]
+                , [itemDescription]
+                , [itemTermsofUse]
+                , [itemTags]
+                , [itemKeywords]
+                , [sharingConfig]
+                , [contentConfig]
+                , [contentCredits]
+                , [contentProtected]
+                , [storageUsed]
+                , [totalViews]
+                , [totalRatings]
+                , [avgRating]
+                , [collectorDisabled]
+                , [fieldMapsDisabled]
+                , [archived]
+                , [SysCaptureDate]
+                , [GlobalID]
+            from [dbo].[GIS_Content]
+
+        '''
+        query_cursor.execute(sqlCommand)
+        stagedRows = {'MV_SVC_GISContent': query_cursor.rowcount}
+        query_conn.commit()
 
-        '''.format(itemID, dateModified, payloadDescription, payloadData, fkID)
+        # One grouped pass over the metrics in place of the view's correlated
+        # subqueries. The date buckets match View_SVC_GISMetrics.
+        query_cursor.execute('truncate table [dbo].[MV_SVC_GISMetrics_Stage]')
+        sqlCommand = '''
 
+        insert into [dbo].[MV_SVC_GISMetrics_Stage]
+            select
+                CAST(ROW_NUMBER() over(order by content.[dateCreated] asc) as int) as [ObjectID]
+                , content.[itemID]
+                , content.[title]
+                , content.[type]
+                , content.[owner]
+                , content.[dateCreated]
+                , content.[dateModified]
+                , content.[itemTags]
+                , content.[itemKeywords]
+                , content.[sharingConfig]
+                , content.[fieldMapsDisabled]
+                , content.[archived]
+                , content.[SysCaptureDate]
+                , coalesce(usage.[TotalUsage_Yesterday], 0)
+                , coalesce(usage.[TotalUsage_ThisWeek], 0)
+                , coalesce(usage.[TotalUsage_LastWeek], 0)
+                , coalesce(usage.[TotalUsage_ThisMonth], 0)
+                , coalesce(usage.[TotalUsage_LastMonth], 0)
+                , coalesce(usage.[TotalUsage_ThisYear], 0)
+                , coalesce(usage.[TotalUsage_LastYear], 0)
+                , usage.[TotalUsage_AllTime]
+                , content.[source]
+                , content.[GlobalID]
+            from [dbo].[GIS_Content] as content
+            left join (
+                select
+                    metrics.[FkID]
+                    , sum(case when metrics.[periodDate] = cast(getdate()-1 as date) then metrics.[requests] end) as [TotalUsage_Yesterday]
+                    , sum(case when datepart(ww, metrics.[periodDate]) = datepart(ww, cast(getdate() as date)) then metrics.[requests] end) as [TotalUsage_ThisWeek]
+                    , sum(case when datepart(ww, metrics.[periodDate]) = datepart(ww, cast(getdate() as date))-1 then metrics.[requests] end) as [TotalUsage_LastWeek]
+                    , sum(case when datepart(mm, metrics.[periodDate]) = datepart(mm, cast(getdate() as date)) then metrics.[requests] end) as [TotalUsage_ThisMonth]
+                    , sum(case when datepart(mm, metrics.[periodDate]) = datepart(mm, cast(getdate() as date))-1 then metrics.[requests] end) as [TotalUsage_LastMonth]
+                    , sum(case when datepart(yy, metrics.[periodDate]) = datepart(yy, cast(getdate() as date)) then metrics.[requests] end) as [TotalUsage_ThisYear]
+                    , sum(case when datepart(yy, metrics.[periodDate]) = datepart(yy, cast(getdate() as date))-1 then metrics.[requests] end) as [TotalUsage_LastYear]
+                    , sum(metrics.[requests]) as [TotalUsage_AllTime]
+                from [dbo].[GIS_ContentMetrics] as metrics
+                group by metrics.[FkID]
+            ) as usage on usage.[FkID] = content.[GlobalID]
+
+        '''
         query_cursor.execute(sqlCommand)
+        stagedRows['MV_SVC_GISMetrics'] = query_cursor.rowcount
         query_conn.commit()
 
-    query_string = '''
+        # The staging tables are identical heaps, which is all a switch needs.
+        for tableName in ['MV_SVC_GISContent', 'MV_SVC_GISMetrics']:
+            if dbBackend == 'sqlserver':
+                query_cursor.execute('truncate table [dbo].[{}]'.format(tableName))
+                query_cursor.execute('alter table [dbo].[{0}_Stage] switch to [dbo].[{0}]'.format(tableName))
+            else:
+                query_cursor.execute('delete from [dbo].[{}]'.format(tableName))
+                query_cursor.execute('insert into [dbo].[{0}] select * from [dbo].[{0}_Stage]'.format(tableName))
+                query_cursor.execute('delete from [dbo].[{}_Stage]'.format(tableName))
+        query_conn.commit()
 
-    select 
-	    [itemID]
-	    , [GlobalID]
-        , [dateModified]
-    from [dbo].[GIS_Content] where [source] = '{}' and [archived] is not NULL
-    and cast(SysCaptureDate as date) = cast(getdate()-1 as date)
-    order by [dateModified] desc
+        for tableName in ['MV_SVC_GISContent', 'MV_SVC_GISMetrics']:
+            print ('    {}:  {} rows'.format(tableName, stagedRows[tableName]))
 
-    '''.format(dataSource)
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
 
-    query_cursor.execute(query_string)
-    archivedInventory = query_cursor.fetchall()
+    return
 
-    for item in archivedInventory:
-        itemID = '{}'.format(item[0])
-        fkID = '{}'.format(item[1])
-        dateModified = '{}'.format(item[2])
+def exportParquet():
+#-------------------------------------------------------------------------------
+# Name:        Function - exportParquet
+# Purpose:  Appends new metrics rows to month partitioned Parquet files and
+#           writes a snapshot of the content table for the day.
+#-------------------------------------------------------------------------------
 
-        sqlCommand = '''
+    if parquetDir == None:
+        return
 
-        update [dbo].[GIS_ContentConfig]
-        set [archived] = 'TRUE'
-	       where fkid = '{}'
-            and [archived] is NULL
-        '''.format(fkID)
+    if pyarrow == None:
+        print ('\nSkipping Parquet Export:  pyarrow is not installed.')
+        return
 
-        query_cursor.execute(sqlCommand)
+    print ('\nExporting Metrics to Parquet....')
+
+    exportStatePath = os.path.join(parquetDir, 'exportState.json')
+    exportState = {'metricsThrough': None}
+    if os.path.exists(exportStatePath):
+        with open(exportStatePath) as stateFile:
+            exportState = json.load(stateFile)
+
+    metricsAfter = exportState['metricsThrough']
+
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
+
+        # The mark moves to the cutoff, not the newest row seen. A shard or
+        # collectGTX can still commit rows stamped before that row, and they
+        # would never be exported. The database's clock is used since the
+        # rows are stamped with getdate() from several hosts.
+        query_cursor.execute('select getdate()')
+        exportNow = query_cursor.fetchone()[0]
+        exportCutoff = exportNow - datetime.timedelta(minutes=parquetSettleMinutes)
+
+        # Files are named from the starting mark so a failed export is overwritten, not doubled.
+        if metricsAfter == None:
+            metricsAfter = datetime.datetime(1900, 1, 1)
+            partName = 'part-initial.parquet'
+        else:
+            metricsAfter = datetime.datetime.strptime(metricsAfter, '%Y-%m-%d %H:%M:%S.%f')
+            partName = 'part-{}.parquet'.format(metricsAfter.strftime('%Y%m%d%H%M%S%f'))
+
+        query_string = '''
+
+        select [itemID], [periodDate], [requests], [archived], [SysCaptureDate], [FkID], [GlobalID]
+            from [dbo].[GIS_ContentMetrics]
+            where [SysCaptureDate] > ?
+            and [SysCaptureDate] <= ?
+            order by [periodDate]
+
+        '''
+
+        metricsSchema = pyarrow.schema([('itemID', pyarrow.string()),
+                                        ('periodDate', pyarrow.date32()),
+                                        ('requests', pyarrow.int64()),
+                                        ('archived', pyarrow.string()),
+                                        ('SysCaptureDate', pyarrow.timestamp('us')),
+                                        ('FkID', pyarrow.string()),
+                                        ('GlobalID', pyarrow.string())])
+
+        query_cursor.execute(query_string, (metricsAfter, exportCutoff))
+
+        partitionMonth = None
+        partitionRows = []
+        rowsExported = 0
+        while True:
+            metricRows = query_cursor.fetchmany(targetFetchSize)
+            if len(metricRows) == 0:
+                break
+
+            for metricRow in metricRows:
+                periodDate = metricRow[1]
+                if isinstance(periodDate, datetime.datetime):
+                    periodDate = periodDate.date()
+                rowMonth = periodDate.strftime('%Y-%m')
+
+                if rowMonth != partitionMonth:
+                    if len(partitionRows) > 0:
+                        writeParquetPartition(os.path.join('metrics', 'periodMonth={}'.format(partitionMonth)), partName,
+                                              buildParquetTable(metricsSchema, partitionRows))
+                    partitionMonth = rowMonth
+                    partitionRows = []
+
+                partitionRows.append((metricRow[0], periodDate, int(metricRow[2]), metricRow[3],
+                                      metricRow[4], str(metricRow[5]), str(metricRow[6])))
+                rowsExported += 1
+
+        if len(partitionRows) > 0:
+            writeParquetPartition(os.path.join('metrics', 'periodMonth={}'.format(partitionMonth)), partName,
+                                  buildParquetTable(metricsSchema, partitionRows))
+        print ('    Metrics Rows Exported:  {}'.format(rowsExported))
+
+        # Fixed types so snapshots line up even when a column is all NULL on the day.
+        contentSchema = pyarrow.schema([('itemID', pyarrow.string()),
+                                        ('title', pyarrow.string()),
+                                        ('source', pyarrow.string()),
+                                        ('type', pyarrow.string()),
+                                        ('metadataScore', pyarrow.int64()),
+                                        ('owner', pyarrow.string()),
+                                        ('dateCreated', pyarrow.timestamp('us')),
+                                        ('dateModified', pyarrow.timestamp('us')),
+                                        ('itemSummary', pyarrow.string()),
+                                        ('itemDescription', pyarrow.string()),
+                                        ('itemTermsofUse', pyarrow.string()),
+                                        ('itemTags', pyarrow.string()),
+                                        ('itemKeywords', pyarrow.string()),
+                                        ('sharingConfig', pyarrow.string()),
+                                        ('contentConfig', pyarrow.string()),
+                                        ('contentCredits', pyarrow.string()),
+                                        ('contentProtected', pyarrow.string()),
+                                        ('storageUsed', pyarrow.int64()),
+                                        ('totalViews', pyarrow.int64()),
+                                        ('totalRatings', pyarrow.int64()),
+                                        ('avgRating', pyarrow.float64()),
+                                        ('collectorDisabled', pyarrow.string()),
+                                        ('fieldMapsDisabled', pyarrow.string()),
+                                        ('archived', pyarrow.string()),
+                                        ('SysCaptureDate', pyarrow.timestamp('us')),
+                                        ('GlobalID', pyarrow.string())])
+
+        query_cursor.execute('select {} from [dbo].[GIS_Content]'.format(', '.join(['[{}]'.format(field.name) for field in contentSchema])))
+        contentRows = [tuple(parquetValue(value, field.type) for value, field in zip(contentRow, contentSchema))
+                       for contentRow in query_cursor.fetchall()]
+        writeParquetPartition(os.path.join('content', 'snapshotDate={}'.format(exportNow.strftime('%Y-%m-%d'))), 'part-0.parquet',
+                              buildParquetTable(contentSchema, contentRows))
+        print ('    Content Rows Exported:  {}'.format(len(contentRows)))
+
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
+
+    if exportCutoff > metricsAfter:
+        exportState['metricsThrough'] = exportCutoff.strftime('%Y-%m-%d %H:%M:%S.%f')
+        with open(exportStatePath + '.tmp', 'w') as stateFile:
+            json.dump(exportState, stateFile)
+        os.replace(exportStatePath + '.tmp', exportStatePath)
+
+    if exportState['metricsThrough'] != None:
+        archiveExportedMetrics(datetime.datetime.strptime(exportState['metricsThrough'], '%Y-%m-%d %H:%M:%S.%f'))
+
+    return
+
+def buildParquetTable(tableSchema, tableRows):
+#-------------------------------------------------------------------------------
+# Name:        Function - buildParquetTable
+# Purpose:  Turns a list of row tuples into a columnar table.
+#-------------------------------------------------------------------------------
+
+    if len(tableRows) == 0:
+        return (tableSchema.empty_table())
+
+    tableColumns = list(zip(*tableRows))
+    parquetTable = pyarrow.Table.from_arrays([pyarrow.array(tableColumns[columnIndex], type=field.type)
+                                              for columnIndex, field in enumerate(tableSchema)], schema=tableSchema)
+
+    return (parquetTable)
+
+def parquetValue(value, fieldType):
+#-------------------------------------------------------------------------------
+# Name:        Function - parquetValue
+# Purpose:  Coerces a database value to its Parquet column type. NUMERIC comes
+#           back as Decimal & text from SQLite may be a date.
+#-------------------------------------------------------------------------------
+
+    if value == None:
+        return (None)
+
+    if pyarrow.types.is_integer(fieldType):
+        return (int(value))
+    if pyarrow.types.is_floating(fieldType):
+        return (float(value))
+    if pyarrow.types.is_timestamp(fieldType):
+        if not isinstance(value, datetime.datetime):
+            value = datetime.datetime.combine(value, datetime.datetime.min.time())
+        return (value)
+
+    return ('{}'.format(value))
+
+def writeParquetPartition(partitionPath, partName, partitionTable):
+#-------------------------------------------------------------------------------
+# Name:        Function - writeParquetPartition
+# Purpose:  Writes one partition file under the export folder.
+#-------------------------------------------------------------------------------
+
+    os.makedirs(os.path.join(parquetDir, partitionPath), exist_ok=True)
+    pyarrow.parquet.write_table(partitionTable, os.path.join(parquetDir, partitionPath, partName), compression='zstd')
+
+    return
+
+def archiveExportedMetrics(metricsThrough):
+#-------------------------------------------------------------------------------
+# Name:        Function - archiveExportedMetrics
+# Purpose:  Removes old metrics rows from the database that are already safe
+#           in the Parquet export.
+#-------------------------------------------------------------------------------
+
+    if parquetArchiveDays == None:
+        return
+
+    # Anything inside the capture or backfill windows would just be pulled again.
+    if parquetArchiveDays <= max(backfillDays, 730):
+        print ('    Skipping Archive:  parquetArchiveDays must be more than {} days.'.format(max(backfillDays, 730)))
+        return
+
+    sqlCommand = '''
+
+    delete from [dbo].[GIS_ContentMetrics]
+        where [periodDate] < ?
+        and [SysCaptureDate] <= ?
+
+    '''
+
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
+        query_cursor.execute(sqlCommand, (datetime.date.today() - datetime.timedelta(days=parquetArchiveDays), metricsThrough))
+        print ('    Metrics Rows Archived:  {}'.format(query_cursor.rowcount))
+        query_conn.commit()
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
+
+    return
+
+def saveRunStats(runMode, runStart):
+#-------------------------------------------------------------------------------
+# Name:        Function - saveRunStats
+# Purpose:  Prints the run's stats, logs them to GIS_CaptureRunLog & writes the
+#           Prometheus file if one is configured.
+#-------------------------------------------------------------------------------
+
+    statCopy = runStats.takeStats()
+    runSeconds = (datetime.datetime.now() - runStart).total_seconds()
+    runID = str(uuid.uuid4())
+    hostName = socket.gethostname()
+
+    runStats.printSummary(statCopy)
+
+    logRows = []
+    for statKey, stat in sorted(statCopy.items()):
+        logRows.append((runID, runMode, hostName, runStart, round(runSeconds, 3), statKey[0], statKey[1], statKey[2][:255],
+                        stat['calls'], stat['errors'], stat['retries'], round(stat['seconds'], 3),
+                        round(runStats.bucketQuantile(stat, 0.5), 3), round(runStats.bucketQuantile(stat, 0.95), 3),
+                        round(stat['max'], 3), datetime.datetime.now()))
+
+    try:
+        query_conn = getConnection()
+        try:
+            query_cursor = query_conn.cursor()
+            storageBackend.bulkInsert(query_cursor, '[dbo].[GIS_CaptureRunLog]',
+                                      ['[runID]', '[runMode]', '[hostName]', '[runStart]', '[runSeconds]', '[phase]',
+                                       '[statKind]', '[statName]', '[calls]', '[errors]', '[retries]', '[totalSeconds]',
+                                       '[p50Seconds]', '[p95Seconds]', '[maxSeconds]', '[SysCaptureDate]'],
+                                      logRows)
+            query_conn.commit()
+            query_cursor.close()
+        finally:
+            releaseConnection(query_conn)
+    except Exception as errorResponse:
+        print ('Could not store run stats:  {}'.format(errorResponse))
+
+    try:
+        saveRunLedger(runID, runMode, hostName, statCopy)
+    except Exception as errorResponse:
+        print ('Could not store run ledger:  {}'.format(errorResponse))
+
+    if runStatsFile != None:
+        runLabels = {'mode': runMode, 'host': hostName}
+        with open(runStatsFile + '.tmp', 'w') as statsFile:
+            statsFile.write(runStats.prometheusText(statCopy, runSeconds, runLabels))
+        os.replace(runStatsFile + '.tmp', runStatsFile)
+
+    return
+
+def saveRunLedger(runID, runMode, hostName, statCopy):
+#-------------------------------------------------------------------------------
+# Name:        Function - saveRunLedger
+# Purpose:  Writes one GIS_CaptureRunLedger row per phase & flags phases whose
+#           throughput fell well below their trailing median.
+#-------------------------------------------------------------------------------
+
+    countCopy, spanCopy = runStats.takeCounts()
+
+    query_conn = getConnection()
+    try:
+        query_cursor = query_conn.cursor()
+
+        ledgerRows = []
+        phaseAnomalies = []
+        for phaseName, phaseSpan in sorted(spanCopy.items()):
+            phaseSeconds = phaseSpan[1] - phaseSpan[0]
+            phaseItems = countCopy.get((phaseName, 'items'), 0)
+            phaseStats = {'http': [0, 0], 'sql': [0, 0]}
+            for statKey, stat in statCopy.items():
+                if statKey[0] == phaseName and statKey[1] in phaseStats:
+                    phaseStats[statKey[1]][0] += stat['calls']
+                    phaseStats[statKey[1]][1] += stat['errors']
+
+            throughput = None
+            if phaseItems > 0 and phaseSeconds > 0:
+                throughput = round(phaseItems / phaseSeconds, 3)
+
+            query_string = '''
+
+            select top {} [throughput] from [dbo].[GIS_CaptureRunLedger]
+                where [phase] = ? and [runMode] = ? and [throughput] is not NULL
+                order by [phaseStart] desc
+
+            '''.format(ledgerHistoryRuns)
+
+            query_cursor.execute(query_string, (phaseName, runMode))
+            pastThroughput = sorted([float(row[0]) for row in query_cursor.fetchall()])
+
+            trailingMedian = None
+            anomaly = None
+            if len(pastThroughput) > 0:
+                middle = len(pastThroughput) // 2
+                if len(pastThroughput) % 2 == 1:
+                    trailingMedian = pastThroughput[middle]
+                else:
+                    trailingMedian = (pastThroughput[middle - 1] + pastThroughput[middle]) / 2
+                trailingMedian = round(trailingMedian, 3)
+
+                # A few runs are needed before the median means much.
+                if throughput != None and len(pastThroughput) >= 3 and throughput < trailingMedian * (1 - ledgerDropShare):
+                    anomaly = 'Throughput {:.2f}/s vs trailing median {:.2f}/s'.format(throughput, trailingMedian)
+                    phaseAnomalies.append((phaseName, anomaly))
+
+            ledgerRows.append((runID, runMode, hostName, phaseName,
+                               datetime.datetime.fromtimestamp(phaseSpan[0]), datetime.datetime.fromtimestamp(phaseSpan[1]),
+                               round(phaseSeconds, 3), phaseItems, countCopy.get((phaseName, 'metricRows'), 0),
+                               phaseStats['http'][0], phaseStats['http'][1], phaseStats['sql'][0], phaseStats['sql'][1],
+                               throughput, trailingMedian, anomaly, datetime.datetime.now()))
+
+        storageBackend.bulkInsert(query_cursor, '[dbo].[GIS_CaptureRunLedger]',
+                                  ['[runID]', '[runMode]', '[hostName]', '[phase]', '[phaseStart]', '[phaseEnd]',
+                                   '[phaseSeconds]', '[items]', '[metricRows]', '[httpCalls]', '[httpErrors]',
+                                   '[sqlCalls]', '[sqlErrors]', '[throughput]', '[trailingMedian]', '[anomaly]',
+                                   '[SysCaptureDate]'],
+                                  ledgerRows)
         query_conn.commit()
+        query_cursor.close()
+    finally:
+        releaseConnection(query_conn)
 
-    query_cursor.close()
-    query_conn.close()
+    if len(phaseAnomalies) > 0:
+        print ('\n!!! Slow Phases This Run....')
+        for phaseName, anomaly in phaseAnomalies:
+            print ('    {}:  {}'.format(phaseName, anomaly))
 
     return
 
@@ -1423,4 +3009,30 @@ def disasterStore():
 #-------------------------------------------------------------------------------
 
 if __name__ == "__main__":
-    main()
+    if '--shard' in sys.argv:
+        applyShardSettings()
+
+    if '--profile' in sys.argv:
+        runProfile.startProfile(profileSampleMS / 1000.0)
+
+    try:
+        if '--resume' in sys.argv:
+            resumeLoad()
+        elif '--shard' in sys.argv:
+            shardIndex, shardCount = [int(part) for part in sys.argv[sys.argv.index('--shard') + 1].split('/')]
+            if shardCount < 1 or shardIndex < 0 or shardIndex >= shardCount:
+                print ('--shard needs i/N with 0 <= i < N, not {}/{}.'.format(shardIndex, shardCount))
+                sys.exit(2)
+            runShard()
+        elif '--shards' in sys.argv:
+            launchShards(int(sys.argv[sys.argv.index('--shards') + 1]))
+        else:
+            main()
+    finally:
+        if '--profile' in sys.argv:
+            runProfile.stopProfile()
+            profileFolder = profileDir
+            if profileFolder == None:
+                profileFolder = os.path.dirname(os.path.abspath(__file__))
+            profileName = 'captureProfile_{}_{}.folded'.format(datetime.datetime.now().strftime('%Y%m%d_%H%M%S'), os.getpid())
+            runProfile.writeProfile(os.path.join(profileFolder, profileName), runStats.takeCounts()[1])
@@ -31,6 +31,20 @@ gtx_RESTURLs = [(r'https://yourserverurl.com/Geocortex/Essentials/EssentialsInte
 
 gtx_AnalyticsBaseURL = r'https://analytics.yourserverurl.com/AnalyticsReports/'
 
+# Analytics Export // With an export URL set, each site's viewer report is downloaded straight from it,
+# with {instance}, {site}, {title} & {date} filled in. Copy it from the request the dashboard's export
+# link makes (browser dev tools). Left as None, the dashboard is clicked through in Chrome instead.
+gtx_AnalyticsExportURL = None
+gtx_ChromeDriver = r'D:\Selenium\chromedriver_win32\chromedriver.exe'
+gtx_Headless = 1 #Set to 0 to watch Chrome work.
+gtx_DownloadDir = r'C:\Users\JSpence\Downloads' #Where the report CSVs are downloaded to & read from.
+gtx_DownloadTimeout = 120 #Seconds to wait on the dashboard or a download before giving up.
+gtx_WatchSeconds = 300 #How often --watch looks in gtx_DownloadDir for new reports.
+
+gtxSiteWorkers = 8 #Site details fetched at once per Essentials instance.
+
+debugBIN = 0 #Set to 1 if you want to see the details of each site as it is captured.
+
 # Configure hard coded db connection here.
 db_conn = ('Driver={ODBC Driver 17 for SQL Server};'  # This will require adjustment if you are using a different database.
                       r'Server=GISPRODDB\GIS;'
@@ -40,6 +54,9 @@ db_conn = ('Driver={ODBC Driver 17 for SQL Server};'  # This will require adjust
                       #r'PWD='     # Comment out if you are using AD authentication.
                       )
 
+# Storage Backend
+dbBackend = 'sqlserver' #Set to 'sqlite' and point db_conn at a file path to run without SQL Server.
+
 # Content Ownership // Set ownership of all GTX apps to...
 appOwner = 'General Ownership'
 
@@ -54,9 +71,13 @@ mail_from = 'Metadata Capture<noreply@gis.dev>'
 # DO NOT UPDATE BELOW THIS LINE OR RISK DOOM AND DISPAIR!  Have a nice day!
 # ------------------------------------------------------------------------------
 
+import concurrent.futures
 import datetime
+import re
+import sys
 import time
-import pyodbc
+import urllib.parse
+import storageBackend
 import requests
 import json
 from requests_negotiate_sspi import HttpNegotiateAuth
@@ -64,10 +85,18 @@ from bs4 import BeautifulSoup
 import os
 import csv
 from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 
+# Analytics names its exports '<instance> - <site title> - Viewers (MM_DD_YYYY).csv'.
+reportPattern = re.compile(r'^(EssentialsExternal|EssentialsInternal) - (.+) - Viewers \((\d{2})_(\d{2})_(\d{4})\)\.csv$')
+
+stageColumns = ['itemID', 'title', 'type', 'metadataScore', 'itemSummary', 'itemDescription', 'itemTermsofUse',
+                'sharingConfig', 'contentConfig', 'contentCredits', 'contentProtected', 'storageUsed', 'totalViews',
+                'totalRatings', 'avgRating', 'owner', 'itemTags', 'itemKeywords']
+
 #-------------------------------------------------------------------------------
 #
 #
@@ -97,7 +126,7 @@ def checkWorkspace():
 # Purpose:  Creates the tables, views and indexes needed for the capture & use.
 #-------------------------------------------------------------------------------
     print ('Connecting...')
-    conn = pyodbc.connect(db_conn)
+    conn = storageBackend.connect(dbBackend, db_conn)
     cursor = conn.cursor()
 
     sqlCommand = '''
@@ -135,6 +164,34 @@ def checkWorkspace():
     cursor.execute(sqlCommand)
     conn.commit()
 
+    sqlCommand = '''
+    IF OBJECT_ID ('[DBO].[GTX_ContentStage]' , N'U') IS NULL
+		    Begin
+                CREATE TABLE [DBO].[GTX_ContentStage](
+                    [itemID] [VARCHAR] (64) NULL
+                    , [title] [VARCHAR] (255) NULL
+                    , [type] [VARCHAR] (80) NULL
+                    , [metadataScore] [NUMERIC] (3,0) NULL
+                    , [itemSummary] [VARCHAR] (max) NULL
+                    , [itemDescription] [VARCHAR] (max) NULL
+                    , [itemTermsofUse] [VARCHAR] (max) NULL
+                    , [sharingConfig] [VARCHAR] (80) NULL
+                    , [contentConfig] [VARCHAR] (80) NULL
+                    , [contentCredits] [VARCHAR] (max) NULL
+                    , [contentProtected] [VARCHAR] (5) NULL
+                    , [storageUsed] [NUMERIC] (12,0) NULL
+                    , [totalViews] [NUMERIC] (12,0) NULL
+                    , [totalRatings] [NUMERIC] (12,0) NULL
+                    , [avgRating] [DECIMAL] (3,2) NULL
+                    , [owner] [VARCHAR] (100) NULL
+                    , [itemTags] [VARCHAR] (max) NULL
+                    , [itemKeywords] [VARCHAR] (max) NULL
+                )
+            End
+    '''
+    cursor.execute(sqlCommand)
+    conn.commit()
+
     # Close it out when not needed.
     conn.close()
 
@@ -142,244 +199,209 @@ def checkWorkspace():
 
 def getInfo():
 #-------------------------------------------------------------------------------
-# Name:        Function - checkWorkspace
-# Purpose:  Creates the tables, views and indexes needed for the capture & use.
+# Name:        Function - getInfo
+# Purpose:  Pulls every site from each Essentials instance into GTX_Content.
 #-------------------------------------------------------------------------------
 
+    siteRecords = {}
+
     for target in gtx_RESTURLs:
         urlTarget = '{}'.format(target[0])
-        mainTarget = urlTarget + '/sites?f=pjson'
-        response = requests.get(mainTarget)
-        payload_json = response.json()
+        gtxInstance = target[1]
+
+        # One sign in per instance, shared by the sites list & every site.
+        with openGTXSession(urlTarget) as authSession:
+            mainTarget = urlTarget + '/sites?f=pjson'
+            response = authSession.get(mainTarget)
+            response.raise_for_status()
+            sites = response.json()['sites']
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=gtxSiteWorkers, thread_name_prefix='GTXSite_') as executor:
+                siteFutures = [executor.submit(getSiteDetail, authSession, urlTarget, site['id']) for site in sites]
+                siteDetails = [future.result() for future in siteFutures]
 
-        for site in payload_json['sites']:
+        print ('{}:  {} sites'.format(gtxInstance, len(sites)))
+
+        for site, payload_json in zip(sites, siteDetails):
             gtxID = site['id']
             gtxName = site['displayName']
-            gtxInstance = target[1]
-
-            with requests.session() as authSession:
-                authTarget = urlTarget + r'/security/signIn?idp_name=AD AUTHORITY'
-                response = authSession.get(authTarget, auth = HttpNegotiateAuth())
-                subTarget = urlTarget + '/sites/{}?f=pjson'.format(gtxID)
-                response = authSession.get(subTarget)
-                payload_json = response.json()
-                #print (payload_json)
-                gtxDescription = payload_json['description']
-                gtxSecurityEnabled = payload_json['signInEnabled']
-
-            # Item Title
-            print ('Title:  {}'.format(gtxName))
-            contentTitle = '{}'.format(gtxName)
-            contentTitle = contentTitle.replace("'", '\'\'')
-            contentTitle = '\'{}\''.format(contentTitle)
-
-            # Item Type
-            print ('Type:  Geocortex Essentials Site')
-            contentType = '\'Geocortex Essentials Site\''
-
-            # Item ID
-            print ('Item ID:  {}'.format(gtxID))
-            contentID = '\'{}\''.format(gtxID)
-
-            # Item Metedata Score
-            print ('Item Metadata Completeness:  0')
-            contentmetadataScore = '\'0\''
-
-            # Item Owner
-            print ('Item Owner:  Unknown')
-            owner = '\'GTX Essentials\''
-
-            # Date Created/Updated
-            print ('Date Created:  Unknown')
-            print ('Date Updated:  Unknown\n')
-            dateCreated = 'NULL'
-            dateModified = 'NULL'
-
-            # Item Summary
-            print ('    Item Snippet:  {}\n'.format(gtxDescription))
-            if gtxDescription != None:
-                soup = BeautifulSoup (gtxDescription, 'html.parser')
-                for data in soup (['style', 'script']):
-                    data.decompose()
-                resultSnippet = (' '.join(soup.stripped_strings))
-                resultSnippet = resultSnippet.replace("'", '\'\'')
-                itemSummary = '\'{}\''.format(resultSnippet)
-            else:
-                itemSummary = 'NULL'
+            gtxDescription = payload_json['description']
+            gtxSecurityEnabled = payload_json['signInEnabled']
 
-            # Item Description        
-            print ('    Item Description:  {}\n'.format(gtxDescription))
+            # Item Summary & Description
             if gtxDescription != None:
                 soup = BeautifulSoup (gtxDescription, 'html.parser')
                 for data in soup (['style', 'script']):
                     data.decompose()
-                resultDescription = (' '.join(soup.stripped_strings))
-                resultDescription = resultDescription.replace("'", '\'\'')
-                itemDescription = '\'{}\''.format(resultDescription)
+                itemDescription = (' '.join(soup.stripped_strings))
             else:
-                itemDescription = 'NULL'
-
-            # Terms of Use
-            print ('    Item Terms of Use:  None\n')
-            itemTermsofUse = 'NULL'
-
-            # Tags
-            itemTags = '\'{}, Geocortex, Geocortex Essentials\''.format(gtxName)
-
-            # Keywords
-            itemKeywords = '\'{}, Geocortex, Geocortex Essentials\''.format(gtxInstance)
+                itemDescription = None
 
             # Sharing Configuration & Content Configuration
             if gtxSecurityEnabled == True:
-                print ('Share Setting:  org')
-                sharingConfig = '\'org\''
-                print('Content Status:  org_authoritative')
-                contentConfig = '\'org_authoritative\''
+                sharingConfig = 'org'
+                contentConfig = 'org_authoritative'
             else:
-                print('Share Setting:  public')
-                sharingConfig = '\'public\''
-                print('Content Status:  public_authoritative')
-                contentConfig = '\'public_authoritative\''
+                sharingConfig = 'public'
+                contentConfig = 'public_authoritative'
 
             # Content Credits
-            print ('Access Information:  {}'.format(appOwner))
             if appOwner != '':
-                contentCredits = '\'{}\''.format(appOwner)
+                contentCredits = appOwner
             else:
-                contentCredits = 'NULL'
+                contentCredits = None
+
+            if debugBIN == 1:
+                print ('Title:  {}'.format(gtxName))
+                print ('Type:  Geocortex Essentials Site')
+                print ('Item ID:  {}'.format(gtxID))
+                print ('Item Metadata Completeness:  0')
+                print ('Item Owner:  Unknown')
+                print ('Date Created:  Unknown')
+                print ('Date Updated:  Unknown\n')
+                print ('    Item Snippet:  {}\n'.format(gtxDescription))
+                print ('    Item Description:  {}\n'.format(gtxDescription))
+                print ('    Item Terms of Use:  None\n')
+                print ('Share Setting:  {}'.format(sharingConfig))
+                print ('Content Status:  {}'.format(contentConfig))
+                print ('Access Information:  {}'.format(appOwner))
+                print ('Protected:  True')
+                print ('Storage Used:  0')
+                print ('Number of Views:  0')
+                print ('Number of Ratings:  0')
+                print ('Average Rating:  0')
+
+            # Same order as the GTX_ContentStage columns. The last three are
+            # only written when the site is first inserted.
+            siteRecord = (gtxID, gtxName, 'Geocortex Essentials Site', 0, itemDescription, itemDescription, None,
+                          sharingConfig, contentConfig, contentCredits, 'True', 0, 0, 0, 0,
+                          'GTX Essentials', '{}, Geocortex, Geocortex Essentials'.format(gtxName),
+                          '{}, Geocortex, Geocortex Essentials'.format(gtxInstance))
+
+            # A site listed by more than one instance keeps the first one's
+            # owner, tags & keywords, as the one row at a time upsert did.
+            if gtxID in siteRecords:
+                siteRecord = siteRecord[:15] + siteRecords[gtxID][15:]
+            siteRecords[gtxID] = siteRecord
+
+    sendContent2Storage(list(siteRecords.values()))
 
-            # Content Protected
-            print ('Protected:  True')
-            contentProtected = '\'True\''
+    return
 
-            print ('Storage Used:  0')
-            storageUsed = '0'
+def openGTXSession(urlTarget):
+#-------------------------------------------------------------------------------
+# Name:        Function - openGTXSession
+# Purpose:  Signs in to an Essentials instance & hands back the session. Its
+#           connection pool is sized to the site workers so they all reuse
+#           open connections.
+#-------------------------------------------------------------------------------
 
-            print ('Number of Views:  0')
-            totalViews = '0'
+    authSession = requests.session()
+    siteAdapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=gtxSiteWorkers)
+    authSession.mount('http://', siteAdapter)
+    authSession.mount('https://', siteAdapter)
 
-            print ('Number of Ratings:  0')
-            totalRatings = '0'
+    authTarget = urlTarget + r'/security/signIn?idp_name=AD AUTHORITY'
+    response = authSession.get(authTarget, auth = HttpNegotiateAuth())
+    response.raise_for_status()
 
-            print ('Average Rating:  0')
-            avgRating = '0'
+    return (authSession)
 
-            sendContent2Storage(contentID, contentTitle, contentType, contentmetadataScore, 
-                                owner, dateCreated, dateModified, itemSummary, itemDescription, 
-                                itemTermsofUse, itemTags, itemKeywords, sharingConfig, 
-                                contentConfig, contentCredits, contentProtected, storageUsed, 
-                                totalViews, totalRatings, avgRating)
+def getSiteDetail(authSession, urlTarget, gtxID):
+#-------------------------------------------------------------------------------
+# Name:        Function - getSiteDetail
+# Purpose:  Fetches one site's details on the shared session.
+#-------------------------------------------------------------------------------
 
+    subTarget = urlTarget + '/sites/{}?f=pjson'.format(gtxID)
+    response = authSession.get(subTarget)
+    response.raise_for_status()
 
-    return
+    return (response.json())
 
-def sendContent2Storage(contentID, contentTitle, contentType, contentmetadataScore, 
-                        owner, dateCreated, dateModified, itemSummary, itemDescription,
-                        itemTermsofUse, itemTags, itemKeywords, sharingConfig, 
-                        contentConfig, contentCredits, contentProtected, storageUsed,
-                        totalViews, totalRatings, avgRating):
+def sendContent2Storage(siteRecords):
 #-------------------------------------------------------------------------------
 # Name:        Function - sendContent2Storage
-# Purpose:  Fires off the input to the database.
+# Purpose:  Fires off the input to the database. The sites are loaded into
+#           GTX_ContentStage in one batch, then updated & inserted into
+#           GTX_Content with one statement each & a single commit.
 #-------------------------------------------------------------------------------
 
-    #Check if it exists...
-    query_string = '''
+    print ('\nInserting & Updating Content Data...')
 
-    select [GlobalID] from [dbo].[GTX_Content] where
-        [itemID] = {}
+    conn = storageBackend.connect(dbBackend, db_conn)
+    cursor = conn.cursor()
 
-    '''.format(contentID)
+    cursor.execute('truncate table [dbo].[GTX_ContentStage]')
+    storageBackend.bulkInsert(cursor, 'GTX_ContentStage', stageColumns, siteRecords)
 
-    query_conn = pyodbc.connect(db_conn)
-    query_cursor = query_conn.cursor()
-    query_cursor.execute(query_string)
-    db_return = query_cursor.fetchone()
-    query_cursor.close()
-    query_conn.close()
+    sqlCommand = '''
 
-    try:
-        tableFK = db_return[0]
-        print ('...Updating')
-        print ('\n\n')
-        conn = pyodbc.connect(db_conn)
-        cursor = conn.cursor()
-
-        sqlCommand = '''
-
-        update [dbo].[GTX_Content]
-        set [title] = {}
-            , [type] = {}
-            , [metadataScore] = {}
-            , [dateModified] = getdate()
-            , [itemSummary] = {}
-            , [itemDescription] = {}
-            , [itemTermsofUse] = {}
-            , [sharingConfig] = {}
-            , [contentConfig] = {}
-            , [contentCredits] = {}
-            , [contentProtected] = {}
-            , [storageUsed] = {}
-            , [totalViews] = {}
-            , [totalRatings] = {}
-            , [avgRating] = {}
-            , [SysCaptureDate] = getdate()
-            where [GlobalID] = '{}'
-
-        '''.format(contentTitle, contentType, contentmetadataScore, 
-                   itemSummary, itemDescription, itemTermsofUse, sharingConfig, contentConfig, 
-                   contentCredits, contentProtected, storageUsed, totalViews, totalRatings, 
-                   avgRating, tableFK)
-
-        cursor.execute(sqlCommand)
-        conn.commit()
-        conn.close()
-
-    except:
-        print ('...Inserting')
-        print ('\n\n')
-        conn = pyodbc.connect(db_conn)
-        cursor = conn.cursor()
-        sqlCommand = '''
-
-        insert into [dbo].[GTX_Content] (
-            [itemID]
-            ,[title]
-            ,[type]
-            ,[metadataScore]
-            ,[owner]
-            ,[dateCreated]
-            ,[dateModified]
-            ,[itemSummary]
-            ,[itemDescription]
-            ,[itemTermsofUse]
-            ,[itemTags]
-            ,[itemKeywords]
-            ,[sharingConfig]
-            ,[contentConfig]
-            ,[contentCredits]
-            ,[contentProtected]
-            ,[storageUsed]
-            ,[totalViews]
-            ,[totalRatings]
-            ,[avgRating]
-            ,[archived]
-            ,[SysCaptureDate]
-            ,[GlobalID]
-        )
-            Values ({}, {}, {}, {}, {}, getdate(), getdate(), {}, {}, {}, {}, {}, {}, {}, {}, 
-            {}, {}, {}, {}, {}, NULL, getdate(), newid())
-
-        '''.format(contentID, contentTitle, contentType, contentmetadataScore, 
-                   owner, itemSummary, itemDescription, 
-                   itemTermsofUse, itemTags, itemKeywords, sharingConfig, contentConfig, 
-                   contentCredits, contentProtected, storageUsed, totalViews, totalRatings, 
-                   avgRating)
-
-        cursor.execute(sqlCommand)
-        conn.commit()
-        conn.close()
+    update [dbo].[GTX_Content]
+    set [title] = stage.[title]
+        , [type] = stage.[type]
+        , [metadataScore] = stage.[metadataScore]
+        , [dateModified] = getdate()
+        , [itemSummary] = stage.[itemSummary]
+        , [itemDescription] = stage.[itemDescription]
+        , [itemTermsofUse] = stage.[itemTermsofUse]
+        , [sharingConfig] = stage.[sharingConfig]
+        , [contentConfig] = stage.[contentConfig]
+        , [contentCredits] = stage.[contentCredits]
+        , [contentProtected] = stage.[contentProtected]
+        , [storageUsed] = stage.[storageUsed]
+        , [totalViews] = stage.[totalViews]
+        , [totalRatings] = stage.[totalRatings]
+        , [avgRating] = stage.[avgRating]
+        , [SysCaptureDate] = getdate()
+    from [dbo].[GTX_ContentStage] as stage
+        where stage.[itemID] = [GTX_Content].[itemID]
+
+    '''
+    cursor.execute(sqlCommand)
+    print ('    Updated:  {}'.format(cursor.rowcount))
+
+    sqlCommand = '''
+
+    insert into [dbo].[GTX_Content] (
+        [itemID]
+        ,[title]
+        ,[type]
+        ,[metadataScore]
+        ,[owner]
+        ,[dateCreated]
+        ,[dateModified]
+        ,[itemSummary]
+        ,[itemDescription]
+        ,[itemTermsofUse]
+        ,[itemTags]
+        ,[itemKeywords]
+        ,[sharingConfig]
+        ,[contentConfig]
+        ,[contentCredits]
+        ,[contentProtected]
+        ,[storageUsed]
+        ,[totalViews]
+        ,[totalRatings]
+        ,[avgRating]
+        ,[archived]
+        ,[SysCaptureDate]
+        ,[GlobalID]
+    )
+        select stage.[itemID], stage.[title], stage.[type], stage.[metadataScore], stage.[owner], getdate(), getdate(),
+            stage.[itemSummary], stage.[itemDescription], stage.[itemTermsofUse], stage.[itemTags], stage.[itemKeywords],
+            stage.[sharingConfig], stage.[contentConfig], stage.[contentCredits], stage.[contentProtected],
+            stage.[storageUsed], stage.[totalViews], stage.[totalRatings], stage.[avgRating], NULL, getdate(), newid()
+        from [dbo].[GTX_ContentStage] as stage
+        where not exists (select 1 from [dbo].[GTX_Content] as content where content.[itemID] = stage.[itemID])
 
+    '''
+    cursor.execute(sqlCommand)
+    print ('    Inserted:  {}'.format(cursor.rowcount))
+
+    cursor.execute('truncate table [dbo].[GTX_ContentStage]')
+    conn.commit()
+    conn.close()
 
     return
 
@@ -389,7 +411,7 @@ def dataCleaning():
 # Purpose:  Cleans up afterwards adding in metadata for fieldmaps, archived, etc.
 #-------------------------------------------------------------------------------
 
-    conn = pyodbc.connect(db_conn)
+    conn = storageBackend.connect(dbBackend, db_conn)
     cursor = conn.cursor()
 
     sqlCommand = '''
@@ -410,96 +432,215 @@ def dataCleaning():
 def queryAnalytics():
 #-------------------------------------------------------------------------------
 # Name:        Function - queryAnalytics
-# Purpose:  Cleans up afterwards adding in metadata for fieldmaps, archived, etc.
+# Purpose:  Gets yesterday's viewer reports out of Geocortex Analytics as CSV
+#           files in gtx_DownloadDir, straight from the export URL when one is
+#           set, otherwise through the dashboard in Chrome.
+#-------------------------------------------------------------------------------
+
+    if gtx_AnalyticsExportURL != None:
+        exportAnalyticsHTTP()
+    else:
+        exportAnalyticsBrowser()
+
+    return
+
+def exportAnalyticsHTTP():
+#-------------------------------------------------------------------------------
+# Name:        Function - exportAnalyticsHTTP
+# Purpose:  Downloads each site's viewer report from the export URL on one
+#           signed in session, several at a time.
+#-------------------------------------------------------------------------------
+
+    reportDate = datetime.date.today() - datetime.timedelta(1)
+
+    print ('Trying Data Capture...')
+    with requests.session() as authSession:
+        authSession.auth = HttpNegotiateAuth()
+        authSession.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=gtxSiteWorkers))
+        authSession.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=gtxSiteWorkers))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=gtxSiteWorkers, thread_name_prefix='GTXExport_') as executor:
+            exportFutures = [executor.submit(downloadReport, authSession, targetPrep, reportDate) for targetPrep in queryForCSV()]
+            reportCount = len([future.result() for future in exportFutures])
+
+    print ('    Reports Downloaded:  {}'.format(reportCount))
+
+    return
+
+def downloadReport(authSession, targetPrep, reportDate):
 #-------------------------------------------------------------------------------
+# Name:        Function - downloadReport
+# Purpose:  Saves one site's report under the name importCSVFiles looks for.
+#-------------------------------------------------------------------------------
+
+    makePath = buildCSVPath(targetPrep, reportDate)
+    exportTarget = gtx_AnalyticsExportURL.format(instance=getAppLoc(targetPrep[1]), site=targetPrep[2],
+                                                 title=urllib.parse.quote(targetPrep[0]),
+                                                 date=reportDate.strftime('%Y-%m-%d'))
+
+    response = authSession.get(exportTarget)
+    response.raise_for_status()
+
+    # Written under a temporary name first so a half written file is never read.
+    with open(makePath + '.part', 'wb') as csv_file:
+        csv_file.write(response.content)
+    os.replace(makePath + '.part', makePath)
+
+    return (makePath)
+
+def exportAnalyticsBrowser():
+#-------------------------------------------------------------------------------
+# Name:        Function - exportAnalyticsBrowser
+# Purpose:  Clicks through the dashboard's export links in Chrome (headless
+#           unless gtx_Headless is 0), waiting on each download to finish
+#           rather than for a fixed time.
+#-------------------------------------------------------------------------------
+
+    chromeOptions = webdriver.ChromeOptions()
+    if gtx_Headless == 1:
+        chromeOptions.add_argument('--headless=new')
+    chromeOptions.add_experimental_option('prefs', {'download.default_directory': gtx_DownloadDir,
+                                                    'download.prompt_for_download': False})
 
     print ('Trying login...')
-    driver = webdriver.Chrome(r'D:\Selenium\chromedriver_win32\chromedriver.exe')
-    driver.get (gtx_AnalyticsBaseURL)
-    wait = WebDriverWait(driver, 15)
-    wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"application-region\"]/div/div/div/div[3]/div[3]/div/div/div/button"))).click()
-    WebDriverWait(driver=driver, timeout=10).until(lambda x: x.execute_script('return document.readyState === \'complete\''))
-
-    print ('Trying Data Capture...')   
-    metricsData = gtx_AnalyticsBaseURL + r'/?feature=Dashboard&dashId=test&relativeDate=Yesterday'
-
-    driver.get (metricsData)
-    wait = WebDriverWait(driver, 15)
-    time.sleep (30)
-    wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"application-region\"]/div/div/div/div[3]/div[3]/div/div/div[2]/div[2]/div[1]/div[1]/div/div[1]/div/a[2]"))).click()
-    WebDriverWait(driver=driver, timeout=10).until(lambda x: x.execute_script('return document.readyState === \'complete\''))
-    time.sleep (10)
-    wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"application-region\"]/div/div/div/div[3]/div[3]/div/div/div[2]/div[2]/div[2]/div[1]/div/div[1]/div/a[2]"))).click()
-    WebDriverWait(driver=driver, timeout=10).until(lambda x: x.execute_script('return document.readyState === \'complete\''))
-    time.sleep (10)
-    wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"application-region\"]/div/div/div/div[3]/div[3]/div/div/div[2]/div[2]/div[3]/div[1]/div/div[1]/div/a[2]"))).click()
-    WebDriverWait(driver=driver, timeout=10).until(lambda x: x.execute_script('return document.readyState === \'complete\''))
-    time.sleep (10)
-    wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"application-region\"]/div/div/div/div[3]/div[3]/div/div/div[2]/div[2]/div[4]/div[1]/div/div[1]/div/a[2]"))).click()
-    WebDriverWait(driver=driver, timeout=10).until(lambda x: x.execute_script('return document.readyState === \'complete\''))
-    time.sleep (10)
-    wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"application-region\"]/div/div/div/div[3]/div[3]/div/div/div[2]/div[2]/div[5]/div[1]/div/div[1]/div/a[2]"))).click()
-    WebDriverWait(driver=driver, timeout=10).until(lambda x: x.execute_script('return document.readyState === \'complete\''))
-    time.sleep (10)
-    wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"application-region\"]/div/div/div/div[3]/div[3]/div/div/div[2]/div[2]/div[6]/div[1]/div/div[1]/div/a[2]"))).click()
-    WebDriverWait(driver=driver, timeout=10).until(lambda x: x.execute_script('return document.readyState === \'complete\''))
-    time.sleep (10)
-    wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"application-region\"]/div/div/div/div[3]/div[3]/div/div/div[2]/div[2]/div[7]/div[1]/div/div[1]/div/a[2]"))).click()
-    WebDriverWait(driver=driver, timeout=10).until(lambda x: x.execute_script('return document.readyState === \'complete\''))
-    time.sleep (30)
-    driver.close()
+    driver = webdriver.Chrome(service=Service(gtx_ChromeDriver), options=chromeOptions)
+    try:
+        driver.get (gtx_AnalyticsBaseURL)
+        wait = WebDriverWait(driver, 15)
+        wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"application-region\"]/div/div/div/div[3]/div[3]/div/div/div/button"))).click()
+        WebDriverWait(driver=driver, timeout=10).until(lambda x: x.execute_script('return document.readyState === \'complete\''))
+
+        print ('Trying Data Capture...')   
+        metricsData = gtx_AnalyticsBaseURL + r'/?feature=Dashboard&dashId=test&relativeDate=Yesterday'
+
+        driver.get (metricsData)
+        wait = WebDriverWait(driver, gtx_DownloadTimeout)
+        WebDriverWait(driver=driver, timeout=gtx_DownloadTimeout).until(lambda x: x.execute_script('return document.readyState === \'complete\''))
+
+        for panelNumber in range(1, 8):
+            knownFiles = set(os.listdir(gtx_DownloadDir))
+            wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@id=\"application-region\"]/div/div/div/div[3]/div[3]/div/div/div[2]/div[2]/div[{}]/div[1]/div/div[1]/div/a[2]".format(panelNumber)))).click()
+            wait.until(lambda x: downloadFinished(knownFiles))
+    finally:
+        # A timed out wait would otherwise leave Chrome running.
+        driver.quit()
 
     return
 
-def importCSVFiles():
+def downloadFinished(knownFiles):
 #-------------------------------------------------------------------------------
-# Name:        Function - queryAnalytics
-# Purpose:  Cleans up afterwards adding in metadata for fieldmaps, archived, etc.
+# Name:        Function - downloadFinished
+# Purpose:  True once a new file is in gtx_DownloadDir & Chrome has finished
+#           writing it.
 #-------------------------------------------------------------------------------
 
-    startDate = datetime.date.today()
-    dayStopWindow = datetime.timedelta(1)
-    searchStopDate = startDate - dayStopWindow
-    timehackDT = searchStopDate.strftime('%Y-%m-%d')
-    searchStopDate = searchStopDate.strftime('%m_%d_%Y')
-
-    getCSVPrecursors = queryForCSV()
-
-    for targetPrep in getCSVPrecursors:
-        appID = targetPrep[0]
-        itemID = targetPrep[2]
-        fkID = targetPrep[3]
-        if targetPrep[1] == 'Essentials External':
-            appLoc = 'EssentialsExternal'
-        elif targetPrep[1] == 'Essentials Internal':
-            appLoc = 'EssentialsInternal'
-        else:
-            print ('New keyword found! Adjust your settings.')
-            quit()
-
-        genfileName = appLoc + ' - ' + appID + ' - Viewers (' + searchStopDate + ').csv'
-        makePath = r'C:\Users\JSpence\Downloads\{}'.format(genfileName)
-        print (makePath)
-
-        with open (makePath) as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            useCount = 0
-            for row in csv_reader:
-                if len(row) > 1 and 'Viewer' in row[1]:
-                    useCount += int(row[2])
-            print (useCount)
-            useageMeter = useCount
-            insertResults(itemID, fkID, timehackDT, useageMeter)
-        
-        # Cleaning Up.
-
-        if os.path.exists(makePath):
-            os.remove(makePath)
-            print ('File Purged.')
+    newFiles = set(os.listdir(gtx_DownloadDir)) - knownFiles
+    if len(newFiles) == 0:
+        return (False)
+
+    return (all(not fileName.endswith(('.crdownload', '.tmp')) for fileName in newFiles))
 
+def importCSVFiles():
+#-------------------------------------------------------------------------------
+# Name:        Function - importCSVFiles
+# Purpose:  Loads every viewer report waiting in gtx_DownloadDir, whatever day
+#           it is for, into GIS_ContentMetrics. Files are read several at a
+#           time, totalled per site & day, written in one batch, then purged.
+#-------------------------------------------------------------------------------
+
+    # Reports are named by instance & title, so two sites sharing both can't be told apart.
+    siteKeys = {}
+    sharedKeys = set()
+    for targetPrep in queryForCSV():
+        keyPrep = (getAppLoc(targetPrep[1]), targetPrep[0])
+        if keyPrep in siteKeys and siteKeys[keyPrep] != (targetPrep[2], targetPrep[3]):
+            print ('    Warning:  {} on {} is the title of more than one site ({} & {}). Its reports will be left in place.'.format(
+                keyPrep[1], keyPrep[0], siteKeys[keyPrep][0], targetPrep[2]))
+            sharedKeys.add(keyPrep)
+            continue
+        siteKeys[keyPrep] = (targetPrep[2], targetPrep[3])
+
+    reportFiles = []
+    for fileName in sorted(os.listdir(gtx_DownloadDir)):
+        fileMatch = reportPattern.match(fileName)
+        if fileMatch == None:
+            continue
+        if (fileMatch.group(1), fileMatch.group(2)) in sharedKeys:
+            print ('    More than one site matches {}. Left in place.'.format(fileName))
+            continue
+        siteKey = siteKeys.get((fileMatch.group(1), fileMatch.group(2)))
+        if siteKey == None:
+            print ('    No site found for {}. Left in place.'.format(fileName))
+            continue
+        reportDate = datetime.date(int(fileMatch.group(5)), int(fileMatch.group(3)), int(fileMatch.group(4)))
+        reportFiles.append((os.path.join(gtx_DownloadDir, fileName), siteKey, reportDate))
+
+    print ('\nImporting {} Viewer Reports...'.format(len(reportFiles)))
+    if len(reportFiles) == 0:
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=gtxSiteWorkers, thread_name_prefix='GTXImport_') as executor:
+        useCounts = list(executor.map(countViewerUse, [reportFile[0] for reportFile in reportFiles]))
+
+    siteUsage = {}
+    for reportFile, useCount in zip(reportFiles, useCounts):
+        usageKey = (reportFile[1][0], reportFile[1][1], reportFile[2].strftime('%Y-%m-%d'))
+        siteUsage[usageKey] = siteUsage.get(usageKey, 0) + useCount
+        if debugBIN == 1:
+            print ('{}:  {}'.format(reportFile[0], useCount))
+
+    insertResults(siteUsage)
+
+    # Cleaning Up.
+    for reportFile in reportFiles:
+        if os.path.exists(reportFile[0]):
+            os.remove(reportFile[0])
+    print ('    Files Purged:  {}'.format(len(reportFiles)))
 
     return
 
+def countViewerUse(makePath):
+#-------------------------------------------------------------------------------
+# Name:        Function - countViewerUse
+# Purpose:  Adds up the viewer rows of one report, a row at a time.
+#-------------------------------------------------------------------------------
+
+    useCount = 0
+    with open (makePath, newline='') as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=',')
+        for row in csv_reader:
+            if len(row) > 1 and 'Viewer' in row[1]:
+                useCount += int(row[2])
+
+    return (useCount)
+
+def getAppLoc(keyword):
+#-------------------------------------------------------------------------------
+# Name:        Function - getAppLoc
+# Purpose:  The Essentials instance folder for a site's first keyword.
+#-------------------------------------------------------------------------------
+
+    if keyword == 'Essentials External':
+        appLoc = 'EssentialsExternal'
+    elif keyword == 'Essentials Internal':
+        appLoc = 'EssentialsInternal'
+    else:
+        print ('New keyword found! Adjust your settings.')
+        quit()
+
+    return (appLoc)
+
+def buildCSVPath(targetPrep, reportDate):
+#-------------------------------------------------------------------------------
+# Name:        Function - buildCSVPath
+# Purpose:  Where a site's viewer report for reportDate lands, named the way
+#           Analytics names its exports.
+#-------------------------------------------------------------------------------
+
+    genfileName = getAppLoc(targetPrep[1]) + ' - ' + targetPrep[0] + ' - Viewers (' + reportDate.strftime('%m_%d_%Y') + ').csv'
+
+    return (os.path.join(gtx_DownloadDir, genfileName))
+
 def queryForCSV():
 #-------------------------------------------------------------------------------
 # Name:        Function - queryAnalytics
@@ -518,7 +659,7 @@ def queryForCSV():
 
     '''
 
-    query_conn = pyodbc.connect(db_conn)
+    query_conn = storageBackend.connect(dbBackend, db_conn)
     query_cursor = query_conn.cursor()
     query_cursor.execute(query_string)
     db_return = query_cursor.fetchall()
@@ -529,53 +670,60 @@ def queryForCSV():
     return (db_return)
 
 
-def insertResults(itemID, fkID, timehackDT, useageMeter):
+def insertResults(siteUsage):
 #-------------------------------------------------------------------------------
-# Name:        Function - queryAnalytics
-# Purpose:  Cleans up afterwards adding in metadata for fieldmaps, archived, etc.
+# Name:        Function - insertResults
+# Purpose:  Writes the day totals to GIS_ContentMetrics over one connection &
+#           commit. A day already stored is updated rather than doubled, so
+#           a report can be loaded again safely.
 #-------------------------------------------------------------------------------
 
-    #Check if it exists...
-    query_string = '''
+    # Only a changed count touches the row. SysCaptureDate drives the Parquet
+    # export, so a changed day is exported again as a newer copy of the row,
+    # while reloading the same report exports nothing.
+    conn = storageBackend.connect(dbBackend, db_conn)
+    cursor = conn.cursor()
 
-    select [GlobalID] from dbo.GIS_ContentMetrics 
-    where [itemID] = '{}' and
-    [FkID] = '{}' and
-    [periodDate] = '{}'
+    # pyodbc sends each batch in one round trip with this on.
+    if hasattr(cursor, 'fast_executemany'):
+        cursor.fast_executemany = True
 
-    '''.format(itemID, fkID, timehackDT)
+    sqlCommand = '''
 
-    query_conn = pyodbc.connect(db_conn)
-    query_cursor = query_conn.cursor()
-    query_cursor.execute(query_string)
-    db_return = query_cursor.fetchone()
-    query_cursor.close()
-    query_conn.close()
+    update [dbo].[GIS_ContentMetrics]
+    set [requests] = ?
+        , [SysCaptureDate] = getdate()
+    where [itemID] = ?
+        and [FkID] = ?
+        and [periodDate] = ?
+        and ([requests] <> ? or [requests] is null)
 
-    if db_return == None:
-        print ('Inserting Metrics-- ItemID: {} | Date: {} | Usage: {}'.format(itemID, timehackDT, useageMeter))
+    '''
+    cursor.executemany(sqlCommand, [(useageMeter, itemID, fkID, timehackDT, useageMeter)
+                                    for (itemID, fkID, timehackDT), useageMeter in siteUsage.items()])
 
-        conn = pyodbc.connect(db_conn)
-        cursor = conn.cursor()
-        sqlCommand = '''
+    sqlCommand = '''
 
-        insert into [dbo].[GIS_ContentMetrics] (
-            [itemID]
-            ,[periodDate]
-            ,[requests]
-            ,[archived]
-            ,[SysCaptureDate]
-            ,[FkID]
-            ,[GlobalID]
-        )
-            Values ('{}', '{}', {}, NULL, getdate(), '{}', newid())
+    insert into [dbo].[GIS_ContentMetrics] (
+        [itemID]
+        ,[periodDate]
+        ,[requests]
+        ,[archived]
+        ,[SysCaptureDate]
+        ,[FkID]
+        ,[GlobalID]
+    )
+        select ?, ?, ?, NULL, getdate(), ?, newid()
+        where not exists (select 1 from [dbo].[GIS_ContentMetrics]
+                          where [itemID] = ? and [FkID] = ? and [periodDate] = ?)
 
-        '''.format(itemID, timehackDT, useageMeter, fkID)
+    '''
+    cursor.executemany(sqlCommand, [(itemID, timehackDT, useageMeter, fkID, itemID, fkID, timehackDT)
+                                    for (itemID, fkID, timehackDT), useageMeter in siteUsage.items()])
 
-        cursor.execute(sqlCommand)
-        conn.commit()
-        conn.close()
-        print ('    Committed....\n')
+    conn.commit()
+    conn.close()
+    print ('    Metrics Stored:  {} site days'.format(len(siteUsage)))
 
     return ()
 
@@ -590,4 +738,11 @@ def insertResults(itemID, fkID, timehackDT, useageMeter):
 #-------------------------------------------------------------------------------
 
 if __name__ == "__main__":
-    main()
+    if '--ingest' in sys.argv:
+        importCSVFiles()
+    elif '--watch' in sys.argv:
+        while True:
+            importCSVFiles()
+            time.sleep (gtx_WatchSeconds)
+    else:
+        main()
@@ -0,0 +1,256 @@
+#-------------------------------------------------------------------------------
+# Name:        Geocortex Stub Server
+# Purpose:  Stands in for Geocortex Essentials REST so collectGTX can be run
+#           and timed without the real servers. Serves the sites list, the
+#           sign in handshake & site details for a synthetic set of sites,
+#           with adjustable latency. Site details need the session cookie
+#           handed out by sign in, like the real thing. Also serves each
+#           site's Analytics viewer report CSV at
+#           /AnalyticsReports/export/<instance>/<site>?date=YYYY-MM-DD
+#
+#           Run on its own:  python gtxStub.py --sites 500 --latency 100
+#           then point gtx_RESTURLs in collectGTX.py at
+#           http://127.0.0.1:8471/EssentialsInternal/REST and
+#           gtx_AnalyticsExportURL at
+#           http://127.0.0.1:8471/AnalyticsReports/export/{instance}/{site}?date={date}
+#
+# Author:      John Spence
+#
+#
+#
+# Created:  10/19/2026
+# Modified:
+# Modification Purpose:
+#
+#
+#-------------------------------------------------------------------------------
+
+# 888888888888888888888888888888888888888888888888888888888888888888888888888888
+# ------------------------------- Configuration --------------------------------
+
+stubHost = '127.0.0.1'
+stubPort = 8471
+stubSites = 300 #Sites per Essentials instance.
+stubSeed = 1 #Same seed, same sites.
+stubLatencyMS = 100 #Average delay added to every response.
+stubJitterMS = 20 #Random spread around the average delay.
+stubSignInMS = 400 #Extra delay on sign in, for the Negotiate handshake.
+
+# ------------------------------------------------------------------------------
+# DO NOT UPDATE BELOW THIS LINE OR RISK DOOM AND DISPAIR!  Have a nice day!
+# ------------------------------------------------------------------------------
+
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+#-------------------------------------------------------------------------------
+#
+#
+#                                 Functions
+#
+#
+#-------------------------------------------------------------------------------
+
+def buildSites(siteCount, seed):
+#-------------------------------------------------------------------------------
+# Name:        Function - buildSites
+# Purpose:  The synthetic sites, the same for every instance.
+#-------------------------------------------------------------------------------
+
+    siteRandom = random.Random(seed)
+
+    sites = []
+    for siteNumber in range(siteCount):
+        sites.append({'id': 'site{:04d}'.format(siteNumber),
+                      'displayName': 'Stub Site {}'.format(siteNumber),
+                      'description': '<p>Viewer for <b>department {}</b>.</p><script>x()</script>'.format(siteNumber % 12),
+                      'signInEnabled': siteRandom.random() < 0.5})
+
+    return (sites)
+
+def viewerReport(siteID, reportDate):
+#-------------------------------------------------------------------------------
+# Name:        Function - viewerReport
+# Purpose:  A site's viewer report CSV, laid out like the Analytics export.
+#           The counts are fixed for a given site & date.
+#-------------------------------------------------------------------------------
+
+    reportRandom = random.Random('{}:{}'.format(siteID, reportDate))
+
+    reportLines = ['Application,Client,Views']
+    for clientName in ['HTML5 Viewer', 'Mobile Viewer', 'Workflow Runner']:
+        reportLines.append('{},{},{}'.format(siteID, clientName, reportRandom.randint(0, 500)))
+
+    return ('\r\n'.join(reportLines) + '\r\n')
+
+class StubState():
+#-------------------------------------------------------------------------------
+# Name:        Class - StubState
+# Purpose:  The sites plus the sessions handed out & request counters, shared
+#           by every handler thread.
+#-------------------------------------------------------------------------------
+
+    def __init__(self, siteCount, seed, latencyMS, jitterMS, signInMS):
+        self.sites = buildSites(siteCount, seed)
+        self.siteIndex = {site['id']: site for site in self.sites}
+        self.latencyMS = latencyMS
+        self.jitterMS = jitterMS
+        self.signInMS = signInMS
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.sessions = set()
+        self.stats = {}
+
+    def delay(self, extraMS=0):
+        with self.lock:
+            delayMS = max(0, self.latencyMS + extraMS + self.random.uniform(-self.jitterMS, self.jitterMS))
+        if delayMS > 0:
+            time.sleep (delayMS / 1000.0)
+
+    def newSession(self):
+        with self.lock:
+            sessionID = 'gtx{}'.format(len(self.sessions) + 1)
+            self.sessions.add(sessionID)
+            return (sessionID)
+
+    def count(self, endpoint, status, elapsed):
+        with self.lock:
+            endpointStats = self.stats.setdefault(endpoint, {'requests': 0, 'denied': 0, 'seconds': 0.0})
+            endpointStats['requests'] += 1
+            endpointStats['seconds'] += elapsed
+            if status == 401:
+                endpointStats['denied'] += 1
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+#-------------------------------------------------------------------------------
+# Name:        Class - StubHandler
+# Purpose:  Routes Essentials REST requests to the synthetic sites.
+#-------------------------------------------------------------------------------
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        return
+
+    def do_GET(self):
+        requestStart = time.time()
+        state = self.server.state
+        pathParts = [part for part in urllib.parse.urlsplit(self.path).path.split('/') if part != '']
+        cookies = dict(cookie.strip().split('=', 1) for cookie in self.headers.get('Cookie', '').split(';') if '=' in cookie)
+        signedIn = cookies.get('gtxSession') in state.sessions
+        setCookie = None
+
+        # The instance name in front of /REST is ignored, every instance has the same sites.
+        if pathParts[:2] == ['stub', 'stats']:
+            with state.lock:
+                payload = {'stats': {endpoint: dict(endpointStats) for endpoint, endpointStats in state.stats.items()},
+                           'sessions': len(state.sessions)}
+            endpoint, status = 'stub/stats', 200
+        else:
+            if 'REST' in pathParts:
+                pathParts = pathParts[pathParts.index('REST') + 1:]
+
+            if len(pathParts) == 4 and pathParts[:2] == ['AnalyticsReports', 'export']:
+                endpoint, status = 'AnalyticsReports/export', 200
+                params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+                payload = viewerReport(pathParts[3], params.get('date', ''))
+                state.delay()
+            elif pathParts == ['sites']:
+                endpoint, status = 'sites', 200
+                payload = {'sites': [{'id': site['id'], 'displayName': site['displayName']} for site in state.sites]}
+                state.delay()
+            elif pathParts == ['security', 'signIn']:
+                endpoint, status = 'security/signIn', 200
+                setCookie = state.newSession()
+                payload = {'signedIn': True}
+                state.delay(state.signInMS)
+            elif len(pathParts) == 2 and pathParts[0] == 'sites':
+                endpoint = 'sites/{id}'
+                site = state.siteIndex.get(pathParts[1])
+                if signedIn == False:
+                    status, payload = 401, {'error': {'code': 401, 'message': 'Sign in required.'}}
+                elif site == None:
+                    status, payload = 404, {'error': {'code': 404, 'message': 'Not found.'}}
+                else:
+                    status, payload = 200, dict(site)
+                state.delay()
+            else:
+                endpoint, status = 'unknown', 404
+                payload = {'error': {'code': 404, 'message': 'Not found.'}}
+
+        if isinstance(payload, str):
+            responseBody = payload.encode('utf-8')
+            contentType = 'text/csv; charset=utf-8'
+        else:
+            responseBody = json.dumps(payload).encode('utf-8')
+            contentType = 'application/json; charset=utf-8'
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(responseBody)))
+        if setCookie != None:
+            self.send_header('Set-Cookie', 'gtxSession={}; Path=/'.format(setCookie))
+        self.end_headers()
+        self.wfile.write(responseBody)
+
+        if endpoint != 'stub/stats':
+            state.count(endpoint, status, time.time() - requestStart)
+
+def startStub(siteCount=None, port=None, latencyMS=None):
+#-------------------------------------------------------------------------------
+# Name:        Function - startStub
+# Purpose:  Starts the stub on a background thread & hands back the server.
+#           Anything not passed falls back to the configuration above. Port 0
+#           picks a free port.
+#-------------------------------------------------------------------------------
+
+    state = StubState(siteCount if siteCount != None else stubSites,
+                      stubSeed,
+                      latencyMS if latencyMS != None else stubLatencyMS,
+                      stubJitterMS,
+                      stubSignInMS)
+
+    server = http.server.ThreadingHTTPServer((stubHost, port if port != None else stubPort), StubHandler)
+    server.daemon_threads = True
+    server.state = state
+
+    serverThread = threading.Thread(target=server.serve_forever, daemon=True)
+    serverThread.start()
+
+    return (server)
+
+def readArgument(flag, default, convert):
+#-------------------------------------------------------------------------------
+# Name:        Function - readArgument
+# Purpose:  Reads the value following a command line flag.
+#-------------------------------------------------------------------------------
+
+    if flag in sys.argv:
+        return (convert(sys.argv[sys.argv.index(flag) + 1]))
+
+    return (default)
+
+#-------------------------------------------------------------------------------
+#
+#
+#                                 MAIN SCRIPT
+#
+#
+#-------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    server = startStub(readArgument('--sites', stubSites, int),
+                       readArgument('--port', stubPort, int),
+                       readArgument('--latency', stubLatencyMS, float))
+
+    print ('GTX stub serving {} sites on http://{}:{}/<instance>/REST'.format(len(server.state.sites), stubHost, server.server_address[1]))
+    print ('Counters at http://{}:{}/stub/stats.  Ctrl+C to stop.'.format(stubHost, server.server_address[1]))
+    try:
+        while True:
+            time.sleep (1)
+    except KeyboardInterrupt:
+        server.shutdown()
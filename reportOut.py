@@ -37,12 +37,24 @@ db_conn = ('Driver={ODBC Driver 17 for SQL Server};'  # This will require adjust
                       #r'PWD='     # Comment out if you are using AD authentication.
                       )
 
+# Storage Backend
+dbBackend = 'sqlserver' #Set to 'sqlite' and point db_conn at a file path to run without SQL Server.
+
 # Send confirmation of rebuild to
 adminNotify = 'john@gis.dev'
 
 # Configure the e-mail server and other info here.
 mail_server = 'smtprelay.yourserver.com'
+mail_port = 25 #Point mail_server & mail_port at a local sink (e.g. python -m aiosmtpd -n -l localhost:1025) to test.
 mail_from = 'GIS Applications Report<noreply@gis.dev>'
+mailSessions = 4 #SMTP connections kept open & shared while sending.
+mailPerSecond = 10 #Messages sent per second across all connections. None for no limit.
+mailRetries = 3 #Resends after a dropped connection or temporary failure.
+reportWorkers = 8 #Threads rendering owner reports.
+
+# Report Cache
+reportCacheDir = None #Folder for each owner's last sent report. None to always render.
+reportCachePolicy = 'reuse' #'reuse' resends an unchanged report without rendering it, 'skip' sends nothing to owners with no change.
 
 # Test User Override
 testUser = ['']
@@ -53,13 +65,142 @@ testUser = ['']
 
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-import pyodbc
+import storageBackend
 import datetime
 import time
 import smtplib
 import concurrent.futures
+import hashlib
+import html
+import json
+import os
+import re
+import threading
 from bs4 import BeautifulSoup
 
+# Shared SMTP sessions, one per sending thread.
+mailLock = threading.Lock()
+mailLocal = threading.local()
+mailOpen = []
+mailNext = [0]
+
+# Report pieces, built once & filled in per owner.
+reportHead = '''
+
+    <html>
+    <head>
+    <style>
+
+    table {
+      font-family: arial, sans-serif;
+      border-collapse: collapse;
+      width: 100%;
+    }
+
+    td, th {
+      border: 1px solid #dddddd;
+      text-align: left;
+      padding: 8px;
+    }
+
+    tr:nth-child(even) {
+      background-color: #dddddd;
+    }
+
+    </style>
+    <!--<h1 style="font-family:verdana;"><b>Your Map Applications</b></h1>-->
+    </head>
+
+    <body>
+   '''
+
+reportTableHeader = '''
+    <table>
+      <tr>
+        <th>Application</th>
+        <th>Type</th>
+        <th>Sharing</th>
+        <th>Date Created</th>
+        <th>Total Usage (Last Week)</th>
+      </tr>'''
+
+reportTemplates = {
+    'inventoryFront': reportHead + '''
+    <div>
+    <h3 style="font-family:verdana;">Your Application Inventory (Sorted by Use)</h3>''' + reportTableHeader,
+
+    'inventoryRow': '''
+          <tr>
+            <td>{}</td>
+            <td>{}</td>
+            <td>{}</td>
+            <td>{}</td>
+            <td>{}</td>
+          </tr>''',
+
+    'inventoryEnd': '''
+    </table>
+    </div>
+
+    ''',
+
+    'inventoryEmpty': reportHead + '''
+    <h3 style="font-family:verdana;">Your Application Inventory</h3>''' + reportTableHeader + '''
+	</table>
+    <h5 style="font-family:verdana;"><center>You have created no applications</center></h5>
+    
+      ''',
+
+    'details': '''
+    <div>
+    <h3 style="font-family:verdana;">Additional Details</h3>
+    <table style="width: 50%;">
+      <tr>
+        <td><b># of Items (AGOL/Portal)</b></td>
+        <td>{}</td>
+      </tr>
+      <tr>
+        <td><b>Average Metadata Score</b></td>
+        <td>{}%</td>
+      </tr>
+      <tr>
+        <td><b>Total Storage</b></td>
+        <td>{} MB</td>
+      </tr>
+      <tr>
+        <td><b>Oldest Item</b></td>
+        <td>{}</td>
+      </tr>
+      <tr>
+        <td><b>Newest Item</b></td>
+        <td>{}</td>
+      </tr>
+      <tr>
+        <td><b>Last Updated</b></td>
+        <td>{}</td>
+      </tr>
+      <tr>
+        <td><b>Last Deleted</b></td>
+        <td>{}</td>
+      </tr>    
+    </table>
+    </div>
+    <br>
+    <div>
+    [This is an automated system message. Please contact john@gis.dev for all questions.]
+    </div>
+
+    </body>
+    </html>
+
+    '''}
+
+# Only text holding one of these needs html.escape.
+escapeNeeded = re.compile(r'[&<>"\']')
+
+# Editing a template changes every report, so it counts toward each fingerprint.
+reportTemplateHash = hashlib.sha256(repr(sorted(reportTemplates.items())).encode('utf-8')).hexdigest()
+
 #-------------------------------------------------------------------------------
 #
 #
@@ -85,7 +226,7 @@ def runQuery(query_string):
 # Purpose:  Pull targets from the Database.
 #-------------------------------------------------------------------------------
 
-    query_conn = pyodbc.connect(db_conn)
+    query_conn = storageBackend.connect(dbBackend, db_conn)
     query_cursor = query_conn.cursor()
     query_cursor.execute(query_string)
     db_return = query_cursor.fetchall()
@@ -94,6 +235,28 @@ def runQuery(query_string):
 
     return(db_return)
 
+def streamQuery(query_string, fetchSize=500):
+#-------------------------------------------------------------------------------
+# Name:        Function - streamQuery
+# Purpose:  Yields rows as they are fetched instead of loading them all.
+#-------------------------------------------------------------------------------
+
+    query_conn = storageBackend.connect(dbBackend, db_conn)
+    query_cursor = query_conn.cursor()
+    try:
+        query_cursor.execute(query_string)
+        while True:
+            db_return = query_cursor.fetchmany(fetchSize)
+            if len(db_return) == 0:
+                break
+            for row in db_return:
+                yield row
+    finally:
+        query_cursor.close()
+        query_conn.close()
+
+    return
+
 
 def getContentOwners():
 #-------------------------------------------------------------------------------
@@ -101,28 +264,82 @@ def getContentOwners():
 # Purpose:  Starts the whole thing.
 #-------------------------------------------------------------------------------
 
+    # One pass over each table. Counts come from a GROUP BY, and the oldest,
+    # newest, last modified & last deleted items from ROW_NUMBER() rankings.
+    # notGTX mirrors the old [type] != 'Geocortex Essentials Site' filters,
+    # which also left out items with no type.
     query_string = '''
 
-    SELECT 
-	    distinct(metRes.[owner]) as [Ownership]
-	    , case	
-		    when metRes.[owner] not like '%@gis.dev%' and metRes.[owner] in ('gisdba') then LOWER(metRes.[owner])+'@gis.dev'
-		    when metRes.[owner] not like '%@gis.dev%' then NULL
-		    else LOWER(metRes.[owner]) 
-	    end as [emailContact]
-	    , (select count(*) from [dbo].[GIS_Content] where [owner] = metRes.[owner]) as [Items]
-	    , (select avg([metaDataScore]) from [dbo].[GIS_Content] where [owner] = metRes.[owner]) as [AvgMetadataScore]
-	    , (select (sum([storageUsed]) * 0.000001) from [dbo].[GIS_Content] where [owner] = metRes.[owner]) as [TotalStorageUse MB]
-	    , (select top 1 ([itemID]) from [dbo].[MV_SVC_GISContent] where [owner] = metRes.[owner] and [type] != 'Geocortex Essentials Site' order by dateCreated asc) as [ItemIDOldest]
-	    , (select top 1 ([title]) from [dbo].[MV_SVC_GISContent] where [owner] = metRes.[owner] order by dateCreated asc) as [ItemTitleOldest]
-	    , (select top 1 ([itemID]) from [dbo].[MV_SVC_GISContent] where [owner] = metRes.[owner] and [type] != 'Geocortex Essentials Site' order by dateCreated desc) as [ItemIDNewest]
-	    , (select top 1 ([title]) from [dbo].[MV_SVC_GISContent] where [owner] = metRes.[owner] order by dateCreated desc) as [ItemTitleNewest]
-	    , (select top 1 ([itemID]) from [dbo].[MV_SVC_GISContent] where [owner] = metRes.[owner] and [type] != 'Geocortex Essentials Site' order by dateModified desc) as [ItemIDLastModified]
-	    , (select top 1 ([title]) from [dbo].[MV_SVC_GISContent] where [owner] = metRes.[owner] and [type] != 'Geocortex Essentials Site' order by dateModified desc) as [ItemTitleLastModified]
-	    , (select top 1 ([itemID]) from [dbo].[MV_SVC_GISContent] where [owner] = metRes.[owner] and [type] != 'Geocortex Essentials Site' and [archived] = 'TRUE' order by [SysCaptureDate] desc) as [ItemIDLastDeleted]
-	    , (select top 1 ([title]) from [dbo].[MV_SVC_GISContent] where [owner] = metRes.[owner] and [type] != 'Geocortex Essentials Site' and [archived] = 'TRUE' order by [SysCaptureDate] desc) as [ItemTitleLastDeleted]
-	    , (select top 1 (cast(DATEADD(day, -1, [SysCaptureDate]) as date)) from [dbo].[MV_SVC_GISContent] where [owner] = metRes.[owner] and [type] != 'Geocortex Essentials Site' and [archived] = 'TRUE' order by [SysCaptureDate] desc) as [ItemLastSeen]
-    FROM [dbo].[MV_SVC_GISMetrics] metRes
+    with ownerList as (
+        select distinct [owner] from [dbo].[MV_SVC_GISMetrics]
+    ),
+    ownerStats as (
+        select
+            [owner]
+            , count(*) as [Items]
+            , avg([metaDataScore]) as [AvgMetadataScore]
+            , (sum([storageUsed]) * 0.000001) as [TotalStorageUseMB]
+        from [dbo].[GIS_Content]
+        group by [owner]
+    ),
+    rankedContent as (
+        select
+            [owner]
+            , [itemID]
+            , [title]
+            , [SysCaptureDate]
+            , case when [type] != 'Geocortex Essentials Site' then 1 else 0 end as [notGTX]
+            , case when [type] != 'Geocortex Essentials Site' and [archived] = 'TRUE' then 1 else 0 end as [deletedNotGTX]
+            , row_number() over (partition by [owner] order by [dateCreated] asc) as [oldestRank]
+            , row_number() over (partition by [owner] order by [dateCreated] desc) as [newestRank]
+            , row_number() over (partition by [owner], case when [type] != 'Geocortex Essentials Site' then 1 else 0 end
+                                 order by [dateCreated] asc) as [oldestRankNotGTX]
+            , row_number() over (partition by [owner], case when [type] != 'Geocortex Essentials Site' then 1 else 0 end
+                                 order by [dateCreated] desc) as [newestRankNotGTX]
+            , row_number() over (partition by [owner], case when [type] != 'Geocortex Essentials Site' then 1 else 0 end
+                                 order by [dateModified] desc) as [modifiedRankNotGTX]
+            , row_number() over (partition by [owner], case when [type] != 'Geocortex Essentials Site' and [archived] = 'TRUE' then 1 else 0 end
+                                 order by [SysCaptureDate] desc) as [deletedRankNotGTX]
+        from [dbo].[MV_SVC_GISContent]
+    ),
+    ownerPicks as (
+        select
+            [owner]
+            , max(case when [oldestRankNotGTX] = 1 and [notGTX] = 1 then [itemID] end) as [ItemIDOldest]
+            , max(case when [oldestRank] = 1 then [title] end) as [ItemTitleOldest]
+            , max(case when [newestRankNotGTX] = 1 and [notGTX] = 1 then [itemID] end) as [ItemIDNewest]
+            , max(case when [newestRank] = 1 then [title] end) as [ItemTitleNewest]
+            , max(case when [modifiedRankNotGTX] = 1 and [notGTX] = 1 then [itemID] end) as [ItemIDLastModified]
+            , max(case when [modifiedRankNotGTX] = 1 and [notGTX] = 1 then [title] end) as [ItemTitleLastModified]
+            , max(case when [deletedRankNotGTX] = 1 and [deletedNotGTX] = 1 then [itemID] end) as [ItemIDLastDeleted]
+            , max(case when [deletedRankNotGTX] = 1 and [deletedNotGTX] = 1 then [title] end) as [ItemTitleLastDeleted]
+            , max(case when [deletedRankNotGTX] = 1 and [deletedNotGTX] = 1 then cast(DATEADD(day, -1, [SysCaptureDate]) as date) end) as [ItemLastSeen]
+        from rankedContent
+        group by [owner]
+    )
+
+    SELECT
+        ownerList.[owner] as [Ownership]
+        , case
+            when ownerList.[owner] not like '%@gis.dev%' and ownerList.[owner] in ('gisdba') then CONCAT(LOWER(ownerList.[owner]), '@gis.dev')
+            when ownerList.[owner] not like '%@gis.dev%' then NULL
+            else LOWER(ownerList.[owner])
+        end as [emailContact]
+        , coalesce(ownerStats.[Items], 0) as [Items]
+        , ownerStats.[AvgMetadataScore]
+        , ownerStats.[TotalStorageUseMB] as [TotalStorageUse MB]
+        , ownerPicks.[ItemIDOldest]
+        , ownerPicks.[ItemTitleOldest]
+        , ownerPicks.[ItemIDNewest]
+        , ownerPicks.[ItemTitleNewest]
+        , ownerPicks.[ItemIDLastModified]
+        , ownerPicks.[ItemTitleLastModified]
+        , ownerPicks.[ItemIDLastDeleted]
+        , ownerPicks.[ItemTitleLastDeleted]
+        , ownerPicks.[ItemLastSeen]
+    FROM ownerList
+    left join ownerStats on ownerStats.[owner] = ownerList.[owner]
+    left join ownerPicks on ownerPicks.[owner] = ownerList.[owner]
     order by [Ownership] ASC
 
     '''
@@ -131,15 +348,16 @@ def getContentOwners():
 
     return (ownerReturn)
 
-def getOwnerData(userID):
+def getAllOwnerData():
 #-------------------------------------------------------------------------------
-# Name:        Function - main
-# Purpose:  Starts the whole thing.
+# Name:        Function - getAllOwnerData
+# Purpose:  Reads every owner's report rows in one query, grouped by owner
+#           and sorted by use. Yields (owner, rows) per owner.
 #-------------------------------------------------------------------------------
 
     query_string = '''
 
-    select * from (
+    select dataPull.[owner] as [reportOwner], dataPull.* from (
         select * from [dbo].[MV_SVC_GISMetrics] 
         where [type] in ('Web Mapping Application', 'Geocortex Essentials Site', 
         'Hub Initiative', 'Hub Site Application', 'Application', 'Dashboard', 'Web Experience') 
@@ -155,54 +373,158 @@ def getOwnerData(userID):
 	        itemTags not like 'gcx-user-preferences'
 	        and 
 	        itemTags not like 'Geocortex Workflow'
-            and
-            dataPull.[owner] = '{}'
-
-        order by dataPull.[TotalUsage_ThisWeek] DESC
 
-    '''.format(userID)
+        order by dataPull.[owner], dataPull.[TotalUsage_ThisWeek] DESC
 
-    ownerDataReturn = runQuery(query_string)
+    '''
 
-    return (ownerDataReturn)
+    # The owner is pulled out front so the rest of each row is exactly what
+    # the per owner query used to return. Rows are keyed by owner rather than
+    # trusting the collation to keep each owner's rows together.
+    ownerRows = {}
+    splitOwners = set()
+    lastOwner = None
+    for row in streamQuery(query_string):
+        if row[0] != lastOwner and row[0] in ownerRows:
+            splitOwners.add(row[0])
+        ownerRows.setdefault(row[0], []).append(row[1:])
+        lastOwner = row[0]
+
+    # An owner that came back in pieces is put back in order of this week's use.
+    for userID in splitOwners:
+        ownerRows[userID].sort(key=lambda od: od[14] or 0, reverse=True)
+
+    for userID, ownerDataReturn in ownerRows.items():
+        yield (userID, ownerDataReturn)
 
+    return
 
 def processOwnerData(resultUserList):
 #-------------------------------------------------------------------------------
-# Name:        Function - main
-# Purpose:  Starts the whole thing.
+# Name:        Function - processOwnerData
+# Purpose:  Matches the report rows to each owner & sends their report.
 #-------------------------------------------------------------------------------
 
+    ownerSummaries = {}
     for userDATA in resultUserList:
-        userID = userDATA[0]
-        emailContact = userDATA[1]
-        items = userDATA[2]
-        avgMetadataScore = userDATA[3]
-        totalStorage = userDATA[4]
-        itemIDOldest = userDATA[5]
-        itemTitleOldest = userDATA[6]
-        itemIDNewest = userDATA[7]
-        itemTitleNewest = userDATA[8]
-        itemIDLastModified = userDATA[9]
-        itemTitleLastModified = userDATA[10]
-        itemIDLastDeleted = userDATA[11]
-        itemTitleLastDeleted = userDATA[12]
-        itemLastDeletedLastSeen = userDATA[13]
-
-        ownerDataReturn = getOwnerData(userID)
-        shippingFormat(userDATA, ownerDataReturn)
+        ownerSummaries[userDATA[0]] = userDATA
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=reportWorkers, thread_name_prefix='Report_') as executor:
+        renderJobs = []
+        for userID, ownerDataReturn in getAllOwnerData():
+            userDATA = ownerSummaries.pop(userID, None)
+            if userDATA != None:
+                renderJobs.append(executor.submit(shippingFormat, userDATA, ownerDataReturn))
+
+        # Owners with nothing to list still get their summary.
+        for userDATA in resultUserList:
+            if userDATA[0] in ownerSummaries:
+                renderJobs.append(executor.submit(shippingFormat, userDATA, []))
 
+        reportMessages = [job.result() for job in renderJobs]
+
+    dispatchReports([message for message in reportMessages if message != None])
 
     return
 
 def shippingFormat(userDATA, ownerDataReturn):
 #-------------------------------------------------------------------------------
-# Name:        Function - main
-# Purpose:  Starts the whole thing.
+# Name:        Function - shippingFormat
+# Purpose:  Builds an owner's report, reusing the cached one when nothing in
+#           it changed. Hands back (html, text, email, cache entry) or None
+#           when it should not be sent.
 #-------------------------------------------------------------------------------
 
-    userID = userDATA[0]
     emailContact = userDATA[1]
+
+    if emailContact == None:
+        return (None)
+
+    if len(testUser) > 0 and emailContact not in testUser:
+        return (None)
+
+    reportFingerprint = fingerprintReport(userDATA, ownerDataReturn)
+    cachedReport = loadReportCache(userDATA[0])
+
+    if cachedReport != None and cachedReport['fingerprint'] == reportFingerprint:
+        if reportCachePolicy == 'skip':
+            return (None)
+        payLoadHTML = cachedReport['html']
+    else:
+        payLoadHTML = renderReport(userDATA, ownerDataReturn)
+
+    payLoadTXT = 'Test Text'
+    cacheEntry = {'owner': userDATA[0], 'fingerprint': reportFingerprint, 'html': payLoadHTML}
+
+    return ((payLoadHTML, payLoadTXT, emailContact, cacheEntry))
+
+def fingerprintReport(userDATA, ownerDataReturn):
+#-------------------------------------------------------------------------------
+# Name:        Function - fingerprintReport
+# Purpose:  Hashes only the values that end up in the report, so capture dates
+#           & other unused columns don't count as a change. The templates are
+#           hashed in too.
+#-------------------------------------------------------------------------------
+
+    reportInputs = [reportTemplateHash, userDATA[1], userDATA[2], userDATA[3], userDATA[4], userDATA[6], userDATA[8], userDATA[10], userDATA[12]]
+    for od in ownerDataReturn:
+        reportInputs.append((od[2], od[3], od[5], od[9], od[10], od[15]))
+
+    return (hashlib.sha256(repr(reportInputs).encode('utf-8')).hexdigest())
+
+def reportCachePath(userID):
+#-------------------------------------------------------------------------------
+# Name:        Function - reportCachePath
+# Purpose:  Cache file for an owner. Named by hash since owners are emails.
+#-------------------------------------------------------------------------------
+
+    return (os.path.join(reportCacheDir, '{}.json'.format(hashlib.sha1('{}'.format(userID).encode('utf-8')).hexdigest())))
+
+def loadReportCache(userID):
+#-------------------------------------------------------------------------------
+# Name:        Function - loadReportCache
+# Purpose:  The owner's last sent report, or None.
+#-------------------------------------------------------------------------------
+
+    if reportCacheDir == None:
+        return (None)
+
+    try:
+        with open(reportCachePath(userID)) as cacheFile:
+            cachedReport = json.load(cacheFile)
+    except (OSError, ValueError):
+        return (None)
+
+    if cachedReport.get('owner') != userID:
+        return (None)
+
+    return (cachedReport)
+
+def saveReportCache(cacheEntry):
+#-------------------------------------------------------------------------------
+# Name:        Function - saveReportCache
+# Purpose:  Keeps a report once it has been sent.
+#-------------------------------------------------------------------------------
+
+    if reportCacheDir == None:
+        return
+
+    os.makedirs(reportCacheDir, exist_ok=True)
+    cachePath = reportCachePath(cacheEntry['owner'])
+    cacheEntry = dict(cacheEntry, sent=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    with open(cachePath + '.tmp', 'w') as cacheFile:
+        json.dump(cacheEntry, cacheFile)
+    os.replace(cachePath + '.tmp', cachePath)
+
+    return
+
+def renderReport(userDATA, ownerDataReturn):
+#-------------------------------------------------------------------------------
+# Name:        Function - renderReport
+# Purpose:  Fills the report templates for one owner. Rows are collected in a
+#           list & joined once, and every value is HTML escaped.
+#-------------------------------------------------------------------------------
+
     items = userDATA[2]
     avgMetadataScore = userDATA[3]
     if avgMetadataScore == None:
@@ -210,234 +532,214 @@ def shippingFormat(userDATA, ownerDataReturn):
     totalStorage = userDATA[4]
     if totalStorage == None:
         totalStorage = 0
-    itemIDOldest = userDATA[5]
     itemTitleOldest = userDATA[6]
-    itemIDNewest = userDATA[7]
     itemTitleNewest = userDATA[8]
-    itemIDLastModified = userDATA[9]
     itemTitleLastModified = userDATA[10]
     if itemTitleLastModified == None:
         itemTitleLastModified = 'N/A'
-    itemIDLastDeleted = userDATA[11]
     itemTitleLastDeleted = userDATA[12]
     if itemTitleLastDeleted == None:
         itemTitleLastDeleted = 'N/A'
-    itemLastDeletedLastSeen = userDATA[13]
-
-    rowOutput = ''
 
-    for od in ownerDataReturn:
-        itemID = od[1]
-        title = od[2]
-        type = od[3]
-        dateCreated = od[5]
-        sharingConfig = od[9]
-        totalUse_Lastweek = od[15]
-        fieldMapsDisabled = od[10]
-
-        if type == 'Web Map':
-            if fieldMapsDisabled == 'FALSE':
+    reportParts = []
+    if len(ownerDataReturn) > 0:
+        reportParts.append(reportTemplates['inventoryFront'])
+
+        # The row template is split once & every piece joined at the end. Type,
+        # sharing & created date repeat a lot, so their escaped cells are reused.
+        rowStart, titleEnd, typeEnd, sharingEnd, createdEnd, rowEnd = reportTemplates['inventoryRow'].split('{}')
+        rowMiddles = {}
+        for od in ownerDataReturn:
+            type = od[3]
+            if type == 'Web Map' and od[10] == 'FALSE':
                 type = 'Field Map'
 
-        rowLine = '''
-
-          <tr>
-            <td>{}</td>
-            <td>{}</td>
-            <td>{}</td>
-            <td>{}</td>
-            <td>{}</td>
-          </tr>
-
-        '''.format(title, type, sharingConfig, dateCreated, totalUse_Lastweek)
-        rowOutput = rowOutput + rowLine
+            middleKey = (type, od[9], od[5])
+            rowMiddle = rowMiddles.get(middleKey)
+            if rowMiddle == None:
+                rowMiddle = titleEnd + htmlEscape(type) + typeEnd + htmlEscape(od[9]) + sharingEnd + htmlEscape(od[5]) + createdEnd
+                rowMiddles[middleKey] = rowMiddle
 
-    payLoadHTMLFront = '''
+            reportParts.extend((rowStart, htmlEscape(od[2]), rowMiddle, htmlEscape(od[15]), rowEnd))
+        reportParts.append(reportTemplates['inventoryEnd'])
+    else:
+        reportParts.append(reportTemplates['inventoryEmpty'])
 
-    <html>
-    <head>
-    <style>
+    reportParts.append(reportTemplates['details'].format(htmlEscape(items), htmlEscape(avgMetadataScore), htmlEscape(totalStorage),
+                                                         htmlEscape(itemTitleOldest), htmlEscape(itemTitleNewest),
+                                                         htmlEscape(itemTitleLastModified), htmlEscape(itemTitleLastDeleted)))
 
-    table {
-      font-family: arial, sans-serif;
-      border-collapse: collapse;
-      width: 100%;
-    }
+    return (''.join(reportParts))
 
-    td, th {
-      border: 1px solid #dddddd;
-      text-align: left;
-      padding: 8px;
-    }
+def htmlEscape(value):
+#-------------------------------------------------------------------------------
+# Name:        Function - htmlEscape
+# Purpose:  Escapes a value for the report, showing None as it always has.
+#-------------------------------------------------------------------------------
 
-    tr:nth-child(even) {
-      background-color: #dddddd;
-    }
+    # Numbers & dates never hold markup, so only text needs the escape pass.
+    if isinstance(value, str):
+        if escapeNeeded.search(value) == None:
+            return (value)
+        return (html.escape(value))
 
-    </style>
-    <!--<h1 style="font-family:verdana;"><b>Your Map Applications</b></h1>-->
-    </head>
+    return ('{}'.format(value))
 
-    <body>
-   
-    <div>
-    <h3 style="font-family:verdana;">Your Application Inventory (Sorted by Use)</h3>
-    <table>
-      <tr>
-        <th>Application</th>
-        <th>Type</th>
-        <th>Sharing</th>
-        <th>Date Created</th>
-        <th>Total Usage (Last Week)</th>
-      </tr>'''
-
-    payLoadHTMLmid = '''
-    </table>
-    </div>
-
-    '''
+def dispatchReports(reportMessages):
+#-------------------------------------------------------------------------------
+# Name:        Function - dispatchReports
+# Purpose:  Sends the rendered reports over mailSessions persistent SMTP
+#           connections.
+#-------------------------------------------------------------------------------
 
-    payLoadHTMLend = '''
-    <div>
-    <h3 style="font-family:verdana;">Additional Details</h3>
-    <table style="width: 50%;">
-      <tr>
-        <td><b># of Items (AGOL/Portal)</b></td>
-        <td>{}</td>
-      </tr>
-      <tr>
-        <td><b>Average Metadata Score</b></td>
-        <td>{}%</td>
-      </tr>
-      <tr>
-        <td><b>Total Storage</b></td>
-        <td>{} MB</td>
-      </tr>
-      <tr>
-        <td><b>Oldest Item</b></td>
-        <td>{}</td>
-      </tr>
-      <tr>
-        <td><b>Newest Item</b></td>
-        <td>{}</td>
-      </tr>
-      <tr>
-        <td><b>Last Updated</b></td>
-        <td>{}</td>
-      </tr>
-      <tr>
-        <td><b>Last Deleted</b></td>
-        <td>{}</td>
-      </tr>    
-    </table>
-    </div>
-    <br>
-    <div>
-    [This is an automated system message. Please contact john@gis.dev for all questions.]
-    </div>
+    print ('Sending {} Reports....'.format(len(reportMessages)))
 
-    </body>
-    </html>
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=mailSessions, thread_name_prefix='Mail_') as executor:
+            sendResults = list(executor.map(sendReport, reportMessages))
+    finally:
+        closeMailSessions()
 
-    '''.format(items, avgMetadataScore, totalStorage, itemTitleOldest , itemTitleNewest, itemTitleLastModified, itemTitleLastDeleted)
+    print ('    Sent:  {}  Failed:  {}'.format(sendResults.count(True), sendResults.count(False)))
 
-    payLoadHTMLALTfront = '''
+    return
 
-    <html>
-    <head>
-    <style>
+def sendReport(reportMessage):
+#-------------------------------------------------------------------------------
+# Name:        Function - sendReport
+# Purpose:  Sends one report & caches it only once it went out, so a failed
+#           send is tried again next time. Never raises, so one bad message
+#           can't stop the rest of the batch.
+#-------------------------------------------------------------------------------
 
-    table {
-      font-family: arial, sans-serif;
-      border-collapse: collapse;
-      width: 100%;
-    }
+    payLoadHTML, payLoadTXT, emailContact, cacheEntry = reportMessage
 
-    td, th {
-      border: 1px solid #dddddd;
-      text-align: left;
-      padding: 8px;
-    }
+    try:
+        sendResult = sendNotification(payLoadHTML, payLoadTXT, emailContact)
+    except Exception as errorResponse:
+        print ('    Send to {} failed:  {!r}'.format(emailContact, errorResponse))
+        return (False)
 
-    tr:nth-child(even) {
-      background-color: #dddddd;
-    }
+    if sendResult == True:
+        try:
+            saveReportCache(cacheEntry)
+        except Exception as errorResponse:
+            print ('    Could not cache the report for {}:  {!r}'.format(emailContact, errorResponse))
 
-    </style>
-    <!--<h1 style="font-family:verdana;"><b>Your Map Applications</b></h1>-->
-    </head>
+    return (sendResult)
 
-    <body>
-   
-    <h3 style="font-family:verdana;">Your Application Inventory</h3>
-    <table>
-      <tr>
-        <th>Application</th>
-        <th>Type</th>
-        <th>Sharing</th>
-        <th>Date Created</th>
-        <th>Total Usage (Last Week)</th>
-      </tr>
-	</table>
-    <h5 style="font-family:verdana;"><center>You have created no applications</center></h5>
-    
-      '''
+def waitForMail():
+#-------------------------------------------------------------------------------
+# Name:        Function - waitForMail
+# Purpose:  Holds a message back until it fits under mailPerSecond.
+#-------------------------------------------------------------------------------
 
-    if len (ownerDataReturn) > 0:
-        payLoadHTML = payLoadHTMLFront + '{}'.format(rowOutput) + payLoadHTMLmid + payLoadHTMLend
-    else:
-        payLoadHTML = payLoadHTMLALTfront + payLoadHTMLend
+    if mailPerSecond == None:
+        return
 
-    payLoadTXT = 'Test Text'
+    with mailLock:
+        sendAt = max(mailNext[0], time.time())
+        mailNext[0] = sendAt + (1.0 / mailPerSecond)
 
-    if emailContact != None:
-        sendNotification (payLoadHTML, payLoadTXT, emailContact)
+    waitTime = sendAt - time.time()
+    if waitTime > 0:
+        time.sleep (waitTime)
 
-    return ()
+    return
 
-def sendNotification (payLoadHTML, payLoadTXT, emailContact):
+def getMailSession():
 #-------------------------------------------------------------------------------
-# Name:        Function - main
-# Purpose:  Starts the whole thing.
+# Name:        Function - getMailSession
+# Purpose:  This thread's SMTP connection, opened on first use.
 #-------------------------------------------------------------------------------
 
-    partTXT = MIMEText(payLoadTXT, 'plain')
-    partHTML = MIMEText(payLoadHTML, 'html')
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = 'Weekly Applications Report'
-    msg['From'] = mail_from
-
-    if len(testUser) > 0:
-
-        if emailContact in testUser:
+    server = getattr(mailLocal, 'server', None)
+    if server == None:
+        server = smtplib.SMTP(mail_server, mail_port, timeout=60)
+        mailLocal.server = server
+        with mailLock:
+            mailOpen.append(server)
 
-            print ('Sending data to {}'.format(emailContact))
-        
-            msg['To'] = emailContact
+    return (server)
 
-            msg.attach(partTXT)
-            msg.attach(partHTML)
+def dropMailSession():
+#-------------------------------------------------------------------------------
+# Name:        Function - dropMailSession
+# Purpose:  Throws away this thread's connection after a failure.
+#-------------------------------------------------------------------------------
 
-            server = smtplib.SMTP(mail_server)
+    server = getattr(mailLocal, 'server', None)
+    mailLocal.server = None
+    if server == None:
+        return
 
-            server.sendmail(mail_from, emailContact, msg.as_string())
-            server.quit()
+    with mailLock:
+        if server in mailOpen:
+            mailOpen.remove(server)
+    try:
+        server.close()
+    except:
+        pass
 
-    else:
+    return
 
-        print ('Sending data to {}'.format(emailContact))
+def closeMailSessions():
+#-------------------------------------------------------------------------------
+# Name:        Function - closeMailSessions
+# Purpose:  Signs off every open SMTP connection.
+#-------------------------------------------------------------------------------
 
-        msg['To'] = emailContact
+    with mailLock:
+        while len(mailOpen) > 0:
+            server = mailOpen.pop()
+            try:
+                server.quit()
+            except:
+                try:
+                    server.close()
+                except:
+                    pass
 
-        msg.attach(partTXT)
-        msg.attach(partHTML)
+    return
 
-        server = smtplib.SMTP(mail_server)
+def sendNotification (payLoadHTML, payLoadTXT, emailContact):
+#-------------------------------------------------------------------------------
+# Name:        Function - sendNotification
+# Purpose:  Sends one report on this thread's connection, reconnecting &
+#           retrying with back off when the server drops or defers it.
+#-------------------------------------------------------------------------------
 
-        server.sendmail(mail_from, emailContact, msg.as_string())
-        server.quit()
+    if not isinstance(emailContact, str) or emailContact.strip() == '':
+        print ('    Skipping a report with no usable address:  {!r}'.format(emailContact))
+        return (False)
 
-    return
+    partTXT = MIMEText(payLoadTXT, 'plain')
+    partHTML = MIMEText(payLoadHTML, 'html')
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = 'Weekly Applications Report'
+    msg['From'] = mail_from
+    msg['To'] = emailContact
+
+    msg.attach(partTXT)
+    msg.attach(partHTML)
+
+    print ('Sending data to {}'.format(emailContact))
+
+    for attempt in range(mailRetries + 1):
+        waitForMail()
+        try:
+            getMailSession().sendmail(mail_from, emailContact, msg.as_string())
+            return (True)
+        except smtplib.SMTPRecipientsRefused as errorResponse:
+            print ('    Refused {}:  {}'.format(emailContact, errorResponse))
+            return (False)
+        except (smtplib.SMTPException, OSError) as errorResponse:
+            print ('    Send to {} failed ({}), attempt {} of {}'.format(emailContact, errorResponse, attempt + 1, mailRetries + 1))
+            dropMailSession()
+            if attempt < mailRetries:
+                time.sleep (2 ** attempt)
+
+    return (False)
 
 #-------------------------------------------------------------------------------
 #
@@ -0,0 +1,131 @@
+#-------------------------------------------------------------------------------
+# Name:        Run Profile
+# Purpose:  Sampling profiler for --profile runs. A background thread takes the
+#           stack of every thread at a fixed interval and tags it with the phase
+#           the thread is working for. The result is written in the folded
+#           stack format read by flamegraph.pl, speedscope & most flamegraph
+#           tools, along with a Chrome trace file of the phase spans.
+#
+# Author:      John Spence
+#
+#
+#
+# Created:  10/19/2026
+# Modified:
+# Modification Purpose:
+#
+#
+#-------------------------------------------------------------------------------
+
+import json
+import os
+import sys
+import threading
+import time
+
+import runStats
+
+profileLock = threading.Lock()
+profileSamples = {}
+profileState = {'thread': None, 'stop': None, 'started': None, 'sampleCount': 0}
+
+#-------------------------------------------------------------------------------
+#
+#
+#                                 Functions
+#
+#
+#-------------------------------------------------------------------------------
+
+def startProfile(sampleSeconds):
+#-------------------------------------------------------------------------------
+# Name:        Function - startProfile
+# Purpose:  Starts sampling every thread's stack every sampleSeconds.
+#-------------------------------------------------------------------------------
+
+    profileState['stop'] = threading.Event()
+    profileState['started'] = time.time()
+    profileState['thread'] = threading.Thread(target=sampleStacks, args=(sampleSeconds, profileState['stop']),
+                                              name='Profiler', daemon=True)
+    profileState['thread'].start()
+
+    return
+
+def stopProfile():
+#-------------------------------------------------------------------------------
+# Name:        Function - stopProfile
+# Purpose:  Stops the sampler thread.
+#-------------------------------------------------------------------------------
+
+    if profileState['thread'] == None:
+        return
+
+    profileState['stop'].set()
+    profileState['thread'].join()
+    profileState['thread'] = None
+
+    return
+
+def sampleStacks(sampleSeconds, stopEvent):
+#-------------------------------------------------------------------------------
+# Name:        Function - sampleStacks
+# Purpose:  The sampler loop. Wall clock sampling, so threads blocked on HTTP
+#           or the database show up as much as threads burning CPU.
+#-------------------------------------------------------------------------------
+
+    samplerID = threading.get_ident()
+    threadNames = {}
+
+    while not stopEvent.wait(sampleSeconds):
+        for thread in threading.enumerate():
+            threadNames[thread.ident] = thread.name
+
+        for threadID, frame in sys._current_frames().items():
+            if threadID == samplerID:
+                continue
+
+            stackFrames = []
+            while frame != None:
+                stackFrames.append('{} ({}:{})'.format(frame.f_code.co_name, os.path.basename(frame.f_code.co_filename),
+                                                       frame.f_code.co_firstlineno).replace(';', ','))
+                frame = frame.f_back
+            stackFrames.reverse()
+
+            # Pool threads are numbered; group them by pool rather than one row each.
+            threadName = threadNames.get(threadID, 'thread').rsplit('_', 1)[0]
+            stackKey = ';'.join(['phase {}'.format(runStats.getThreadPhase(threadID)), threadName] + stackFrames)
+
+            with profileLock:
+                profileSamples[stackKey] = profileSamples.get(stackKey, 0) + 1
+
+        profileState['sampleCount'] += 1
+
+    return
+
+def writeProfile(profilePath, spanCopy):
+#-------------------------------------------------------------------------------
+# Name:        Function - writeProfile
+# Purpose:  Writes the folded stacks to profilePath & the phase spans next to
+#           it as a Chrome trace (open in chrome://tracing or Perfetto).
+#-------------------------------------------------------------------------------
+
+    with profileLock:
+        sampleCopy = dict(profileSamples)
+
+    with open(profilePath, 'w') as profileFile:
+        for stackKey, sampleCount in sorted(sampleCopy.items()):
+            profileFile.write('{} {}\n'.format(stackKey, sampleCount))
+
+    traceEvents = []
+    for phaseName, phaseSpan in sorted(spanCopy.items(), key=lambda span: span[1][0]):
+        traceEvents.append({'name': phaseName, 'ph': 'X', 'pid': os.getpid(), 'tid': phaseName,
+                            'ts': int((phaseSpan[0] - profileState['started']) * 1000000),
+                            'dur': int((phaseSpan[1] - phaseSpan[0]) * 1000000)})
+
+    tracePath = os.path.splitext(profilePath)[0] + '.trace.json'
+    with open(tracePath, 'w') as traceFile:
+        json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}, traceFile)
+
+    print ('\nProfile written to {} ({} samples) & {}'.format(profilePath, profileState['sampleCount'], tracePath))
+
+    return
@@ -0,0 +1,264 @@
+#-------------------------------------------------------------------------------
+# Name:        Run Stats
+# Purpose:  Timers & counters for a capture run. Every HTTP endpoint, SQL
+#           statement class & rate limit wait is recorded against the phase it
+#           ran in, with a latency histogram, so a run can be summarized at the
+#           end, stored in the run log table or written out for Prometheus.
+#
+# Author:      John Spence
+#
+#
+#
+# Created:  10/19/2026
+# Modified:
+# Modification Purpose:
+#
+#
+#-------------------------------------------------------------------------------
+
+import threading
+
+# Upper bounds (seconds) of the latency histogram buckets.
+statBuckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+statLock = threading.Lock()
+statTable = {}
+statCounts = {}
+phaseSpans = {}
+statPhase = threading.local()
+threadPhases = {}
+
+#-------------------------------------------------------------------------------
+#
+#
+#                                 Functions
+#
+#
+#-------------------------------------------------------------------------------
+
+def setPhase(phaseName):
+#-------------------------------------------------------------------------------
+# Name:        Function - setPhase
+# Purpose:  Tags everything recorded on this thread with the phase name.
+#-------------------------------------------------------------------------------
+
+    statPhase.name = phaseName
+    threadPhases[threading.get_ident()] = phaseName
+
+    return
+
+def getPhase():
+#-------------------------------------------------------------------------------
+# Name:        Function - getPhase
+# Purpose:  The phase this thread is working for.
+#-------------------------------------------------------------------------------
+
+    return (getattr(statPhase, 'name', 'none'))
+
+def getThreadPhase(threadID):
+#-------------------------------------------------------------------------------
+# Name:        Function - getThreadPhase
+# Purpose:  The phase another thread last worked for, for the profiler.
+#-------------------------------------------------------------------------------
+
+    return (threadPhases.get(threadID, 'none'))
+
+def inPhase(phaseName, workerFunction, *workerArgs):
+#-------------------------------------------------------------------------------
+# Name:        Function - inPhase
+# Purpose:  Runs a function on a pool thread under its parent's phase.
+#-------------------------------------------------------------------------------
+
+    setPhase(phaseName)
+
+    return (workerFunction(*workerArgs))
+
+def recordStat(statKind, statName, elapsed, failed=0, retries=0):
+#-------------------------------------------------------------------------------
+# Name:        Function - recordStat
+# Purpose:  Adds one timed call to the stats for this thread's phase.
+#-------------------------------------------------------------------------------
+
+    statKey = (getPhase(), statKind, statName)
+
+    with statLock:
+        stat = statTable.get(statKey)
+        if stat == None:
+            stat = {'calls': 0, 'errors': 0, 'retries': 0, 'seconds': 0.0, 'max': 0.0,
+                    'buckets': [0] * (len(statBuckets) + 1)}
+            statTable[statKey] = stat
+
+        stat['calls'] += 1
+        stat['errors'] += failed
+        stat['retries'] += retries
+        stat['seconds'] += elapsed
+        stat['max'] = max(stat['max'], elapsed)
+
+        bucketIndex = 0
+        while bucketIndex < len(statBuckets) and elapsed > statBuckets[bucketIndex]:
+            bucketIndex += 1
+        stat['buckets'][bucketIndex] += 1
+
+    return
+
+def addCount(countName, amount=1):
+#-------------------------------------------------------------------------------
+# Name:        Function - addCount
+# Purpose:  Adds to a plain counter (items, metric rows) for this thread's phase.
+#-------------------------------------------------------------------------------
+
+    countKey = (getPhase(), countName)
+
+    with statLock:
+        statCounts[countKey] = statCounts.get(countKey, 0) + amount
+
+    return
+
+def recordSpan(phaseName, spanStart, spanEnd):
+#-------------------------------------------------------------------------------
+# Name:        Function - recordSpan
+# Purpose:  Keeps the wall clock start & end of a phase.
+#-------------------------------------------------------------------------------
+
+    with statLock:
+        phaseSpans[phaseName] = (spanStart, spanEnd)
+
+    return
+
+def bucketQuantile(stat, quantile):
+#-------------------------------------------------------------------------------
+# Name:        Function - bucketQuantile
+# Purpose:  Estimates a latency quantile from the histogram. Hands back the
+#           bucket's upper bound (or the max for the overflow bucket).
+#-------------------------------------------------------------------------------
+
+    if stat['calls'] == 0:
+        return (0.0)
+
+    target = quantile * stat['calls']
+    seen = 0
+    for bucketIndex, bucketCount in enumerate(stat['buckets']):
+        seen += bucketCount
+        if seen >= target:
+            if bucketIndex < len(statBuckets):
+                return (min(statBuckets[bucketIndex], stat['max']))
+            return (stat['max'])
+
+    return (stat['max'])
+
+def takeStats():
+#-------------------------------------------------------------------------------
+# Name:        Function - takeStats
+# Purpose:  Copies the stats out so they can be reported while work carries on.
+#-------------------------------------------------------------------------------
+
+    with statLock:
+        statCopy = {statKey: dict(stat, buckets=list(stat['buckets'])) for statKey, stat in statTable.items()}
+
+    return (statCopy)
+
+def takeCounts():
+#-------------------------------------------------------------------------------
+# Name:        Function - takeCounts
+# Purpose:  Copies out the counters & phase spans.
+#-------------------------------------------------------------------------------
+
+    with statLock:
+        countCopy = dict(statCounts)
+        spanCopy = dict(phaseSpans)
+
+    return (countCopy, spanCopy)
+
+def resetStats():
+#-------------------------------------------------------------------------------
+# Name:        Function - resetStats
+# Purpose:  Clears the stats ahead of a new run in the same process.
+#-------------------------------------------------------------------------------
+
+    with statLock:
+        statTable.clear()
+        statCounts.clear()
+        phaseSpans.clear()
+
+    return
+
+def printSummary(statCopy):
+#-------------------------------------------------------------------------------
+# Name:        Function - printSummary
+# Purpose:  Per phase breakdown of HTTP, SQL & waiting time with latencies.
+#-------------------------------------------------------------------------------
+
+    print ('\nRun Stats....')
+    for phaseName in sorted(set(statKey[0] for statKey in statCopy)):
+        kindSeconds = {}
+        for statKey, stat in statCopy.items():
+            if statKey[0] == phaseName:
+                kindSeconds[statKey[1]] = kindSeconds.get(statKey[1], 0.0) + stat['seconds']
+        print ('  {}  ({})'.format(phaseName, ', '.join(['{} {:.1f}s'.format(kind, seconds) for kind, seconds in sorted(kindSeconds.items())])))
+
+        for statKey in sorted(statKey for statKey in statCopy if statKey[0] == phaseName):
+            stat = statCopy[statKey]
+            print ('    {:<6} {:<40} {:>8} calls {:>9.1f}s  p50 {:>6.3f}s  p95 {:>6.3f}s  max {:>6.3f}s  {} errors  {} retries'.format(
+                statKey[1], statKey[2][:40], stat['calls'], stat['seconds'], bucketQuantile(stat, 0.5),
+                bucketQuantile(stat, 0.95), stat['max'], stat['errors'], stat['retries']))
+
+    return
+
+def promLabels(runLabels, extraLabels):
+#-------------------------------------------------------------------------------
+# Name:        Function - promLabels
+# Purpose:  Builds an escaped Prometheus label set.
+#-------------------------------------------------------------------------------
+
+    allLabels = dict(runLabels)
+    allLabels.update(extraLabels)
+
+    return (','.join(['{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                      for key, value in sorted(allLabels.items())]))
+
+def prometheusText(statCopy, runSeconds, runLabels):
+#-------------------------------------------------------------------------------
+# Name:        Function - prometheusText
+# Purpose:  The stats in Prometheus text exposition format, for the node
+#           exporter textfile collector or a pushgateway.
+#-------------------------------------------------------------------------------
+
+    promLines = ['# HELP metasnagger_run_seconds Wall time of the last capture run.',
+                 '# TYPE metasnagger_run_seconds gauge',
+                 'metasnagger_run_seconds{{{}}} {:.3f}'.format(promLabels(runLabels, {}), runSeconds),
+                 '# HELP metasnagger_calls_total Calls made, by phase, kind & endpoint or statement.',
+                 '# TYPE metasnagger_calls_total counter']
+
+    for statKey, stat in sorted(statCopy.items()):
+        promLines.append('metasnagger_calls_total{{{}}} {}'.format(promLabels(runLabels, {'phase': statKey[0], 'kind': statKey[1], 'name': statKey[2]}), stat['calls']))
+
+    promLines += ['# HELP metasnagger_errors_total Calls that failed.', '# TYPE metasnagger_errors_total counter']
+    for statKey, stat in sorted(statCopy.items()):
+        promLines.append('metasnagger_errors_total{{{}}} {}'.format(promLabels(runLabels, {'phase': statKey[0], 'kind': statKey[1], 'name': statKey[2]}), stat['errors']))
+
+    promLines += ['# HELP metasnagger_retries_total Retries before a call went through.', '# TYPE metasnagger_retries_total counter']
+    for statKey, stat in sorted(statCopy.items()):
+        promLines.append('metasnagger_retries_total{{{}}} {}'.format(promLabels(runLabels, {'phase': statKey[0], 'kind': statKey[1], 'name': statKey[2]}), stat['retries']))
+
+    promLines += ['# HELP metasnagger_call_seconds Call latency.', '# TYPE metasnagger_call_seconds histogram']
+    for statKey, stat in sorted(statCopy.items()):
+        statLabels = {'phase': statKey[0], 'kind': statKey[1], 'name': statKey[2]}
+        runningCount = 0
+        for bucketIndex, bucketBound in enumerate(statBuckets):
+            runningCount += stat['buckets'][bucketIndex]
+            promLines.append('metasnagger_call_seconds_bucket{{{}}} {}'.format(promLabels(runLabels, dict(statLabels, le=bucketBound)), runningCount))
+        promLines.append('metasnagger_call_seconds_bucket{{{}}} {}'.format(promLabels(runLabels, dict(statLabels, le='+Inf')), stat['calls']))
+        promLines.append('metasnagger_call_seconds_sum{{{}}} {:.6f}'.format(promLabels(runLabels, statLabels), stat['seconds']))
+        promLines.append('metasnagger_call_seconds_count{{{}}} {}'.format(promLabels(runLabels, statLabels), stat['calls']))
+
+    return ('\n'.join(promLines) + '\n')
+
+def recordSQL(statementName, elapsed, failed):
+#-------------------------------------------------------------------------------
+# Name:        Function - recordSQL
+# Purpose:  Statement timer handed to the storage backend.
+#-------------------------------------------------------------------------------
+
+    recordStat('sql', statementName, elapsed, failed)
+
+    return
@@ -0,0 +1,469 @@
+#-------------------------------------------------------------------------------
+# Name:        Storage Backend
+# Purpose:  Connects the capture & report scripts to their database. SQL Server
+#           is the default. An embedded SQLite file can be used instead for
+#           small deployments or for testing offline against the same schema.
+#
+#           The scripts are written in T-SQL. For SQLite, the handful of T-SQL
+#           constructs they use are rewritten on the way through.
+#
+# Author:      John Spence
+#
+#
+#
+# Created:  10/19/2026
+# Modified:
+# Modification Purpose:
+#
+#
+#-------------------------------------------------------------------------------
+
+import datetime
+import re
+import sqlite3
+import time
+import uuid
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
+# Catch these when an insert can lose a race on a key.
+if pyodbc != None:
+    IntegrityError = (sqlite3.IntegrityError, pyodbc.IntegrityError)
+else:
+    IntegrityError = (sqlite3.IntegrityError,)
+
+statementPattern = re.compile(r'^\s*(\w+)\b.*?\[?((?:GIS|GTX|MV|View)_\w+)', re.IGNORECASE | re.DOTALL)
+dateOnly = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+dateTime = re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d+)?$')
+
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda value: value.strftime('%Y-%m-%d %H:%M:%S.%f'))
+
+#-------------------------------------------------------------------------------
+#
+#
+#                                 Functions
+#
+#
+#-------------------------------------------------------------------------------
+
+def connect(dbBackend, db_conn, statementTimer=None):
+#-------------------------------------------------------------------------------
+# Name:        Function - connect
+# Purpose:  Opens a connection. db_conn is an ODBC string for 'sqlserver' or a
+#           file path for 'sqlite'. When statementTimer is passed it is called
+#           with (statement class, seconds, failed) after every statement.
+#-------------------------------------------------------------------------------
+
+    if statementTimer != None:
+        return (TimedConnection(connect(dbBackend, db_conn), statementTimer))
+
+    if dbBackend == 'sqlserver':
+        if pyodbc == None:
+            raise ImportError('pyodbc is needed for the sqlserver backend.')
+        return (pyodbc.connect(db_conn))
+
+    elif dbBackend == 'sqlite':
+        conn = sqlite3.connect(db_conn, timeout=60, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.create_function('getdate', 0, sqliteGetDate)
+        conn.create_function('newid', 0, sqliteNewID)
+        conn.create_function('dateadd', 3, sqliteDateAdd)
+        conn.create_function('datepart', 2, sqliteDatePart)
+        conn.create_function('charindex', 2, sqliteCharIndex)
+        conn.create_function('tsql_left', 2, sqliteLeft)
+        conn.create_function('concat', -1, sqliteConcat)
+        return (SQLiteConnection(conn))
+
+    raise ValueError('Unknown storage backend:  {}'.format(dbBackend))
+
+def bulkInsert(cursor, tableName, columnNames, rows):
+#-------------------------------------------------------------------------------
+# Name:        Function - bulkInsert
+# Purpose:  Appends many rows with one parameterized statement. Caller commits.
+#-------------------------------------------------------------------------------
+
+    if len(rows) == 0:
+        return
+
+    sqlCommand = 'insert into {} ({}) values ({})'.format(tableName, ', '.join(columnNames),
+                                                          ', '.join(['?'] * len(columnNames)))
+
+    # pyodbc sends the whole batch in one round trip with this on.
+    if hasattr(cursor, 'fast_executemany'):
+        cursor.fast_executemany = True
+
+    cursor.executemany(sqlCommand, rows)
+
+    return
+
+def statementClass(sqlCommand):
+#-------------------------------------------------------------------------------
+# Name:        Function - statementClass
+# Purpose:  Names a statement by its verb & the first table it touches, e.g.
+#           'insert GIS_ContentMetrics', so timings group sensibly.
+#-------------------------------------------------------------------------------
+
+    statementMatch = statementPattern.match(sqlCommand)
+    if statementMatch == None:
+        firstWord = sqlCommand.split(None, 1)
+        if len(firstWord) == 0:
+            return ('empty')
+        return (firstWord[0].lower())
+
+    statementVerb = statementMatch.group(1).lower()
+    if statementVerb == 'if':
+        statementVerb = 'ddl'
+
+    return ('{} {}'.format(statementVerb, statementMatch.group(2)))
+
+def translateSQL(sqlCommand):
+#-------------------------------------------------------------------------------
+# Name:        Function - translateSQL
+# Purpose:  Rewrites the T-SQL used by these scripts into SQLite.
+#-------------------------------------------------------------------------------
+
+    # IF OBJECT_ID (...) IS NULL Begin CREATE ... End
+    ifBlock = re.match(r'^\s*IF\s+OBJECT_ID\s*\(.*?\)\s*IS\s+NULL\s*Begin\s*(.*)\bEnd\s*$', sqlCommand, re.S | re.I)
+    if ifBlock != None:
+        sqlCommand = ifBlock.group(1)
+        executeBlock = re.match(r"^\s*EXECUTE\s*\(\s*'(.*)'\s*\)\s*$", sqlCommand, re.S | re.I)
+        if executeBlock != None:
+            sqlCommand = executeBlock.group(1).replace("''", "'")
+        sqlCommand = re.sub(r'\bCREATE\s+TABLE\b', 'CREATE TABLE IF NOT EXISTS', sqlCommand, flags=re.I)
+        sqlCommand = re.sub(r'\bCREATE\s+VIEW\b', 'CREATE VIEW IF NOT EXISTS', sqlCommand, flags=re.I)
+
+    sqlCommand = re.sub(r'(\[dbo\]|\bdbo)\s*\.\s*', '', sqlCommand, flags=re.I)
+    sqlCommand = re.sub(r'\(\s*max\s*\)', '', sqlCommand, flags=re.I)
+    sqlCommand = re.sub(r'^\s*truncate\s+table\b', 'delete from', sqlCommand, flags=re.I)
+    sqlCommand = re.sub(r'\bgetdate\(\)\s*-\s*(\d+)', r"dateadd('day', -\1, getdate())", sqlCommand, flags=re.I)
+    sqlCommand = re.sub(r'\b(dateadd|datepart)\s*\(\s*(\w+)\s*,', r"\1('\2',", sqlCommand, flags=re.I)
+    sqlCommand = re.sub(r'\bLEFT\s*\(', 'tsql_left(', sqlCommand, flags=re.I)
+    sqlCommand = translateCasts(sqlCommand)
+    sqlCommand = translateTop(sqlCommand)
+
+    return (sqlCommand)
+
+def findClose(sqlCommand, openAt):
+#-------------------------------------------------------------------------------
+# Name:        Function - findClose
+# Purpose:  Finds the paren closing the one at openAt, skipping quoted text.
+#-------------------------------------------------------------------------------
+
+    depth = 0
+    inQuote = False
+    for position in range(openAt + 1, len(sqlCommand)):
+        character = sqlCommand[position]
+        if character == "'":
+            inQuote = not inQuote
+        elif inQuote:
+            continue
+        elif character == '(':
+            depth += 1
+        elif character == ')':
+            if depth == 0:
+                return (position)
+            depth -= 1
+
+    return (len(sqlCommand))
+
+def translateCasts(sqlCommand):
+#-------------------------------------------------------------------------------
+# Name:        Function - translateCasts
+# Purpose:  cast (x as date) becomes date(x). Other casts are left alone.
+#-------------------------------------------------------------------------------
+
+    searchFrom = 0
+    castMatch = re.compile(r'\bcast\s*\(', re.I)
+    while True:
+        found = castMatch.search(sqlCommand, searchFrom)
+        if found == None:
+            break
+        openAt = found.end() - 1
+        closeAt = findClose(sqlCommand, openAt)
+        castBody = re.match(r'^(.*)\s+as\s+date\s*$', sqlCommand[openAt + 1:closeAt], re.S | re.I)
+        if castBody != None:
+            sqlCommand = sqlCommand[:found.start()] + 'date(' + castBody.group(1) + ')' + sqlCommand[closeAt + 1:]
+        searchFrom = found.start() + 1
+
+    return (sqlCommand)
+
+def translateTop(sqlCommand):
+#-------------------------------------------------------------------------------
+# Name:        Function - translateTop
+# Purpose:  select top N ... becomes select ... limit N, subqueries included.
+#-------------------------------------------------------------------------------
+
+    topMatch = re.compile(r'\bselect\s+top\s*\(?\s*(\d+)\s*\)?\s', re.I)
+    while True:
+        found = topMatch.search(sqlCommand)
+        if found == None:
+            break
+
+        # Walk back to the paren that opens this select, if there is one.
+        depth = 0
+        openAt = -1
+        for position in range(found.start() - 1, -1, -1):
+            if sqlCommand[position] == ')':
+                depth += 1
+            elif sqlCommand[position] == '(':
+                if depth == 0:
+                    openAt = position
+                    break
+                depth -= 1
+
+        closeAt = findClose(sqlCommand, openAt) if openAt >= 0 else len(sqlCommand.rstrip())
+        sqlCommand = (sqlCommand[:found.start()] + 'select ' + sqlCommand[found.end():closeAt]
+                      + ' limit {}'.format(found.group(1)) + sqlCommand[closeAt:])
+
+    return (sqlCommand)
+
+def convertValue(value):
+#-------------------------------------------------------------------------------
+# Name:        Function - convertValue
+# Purpose:  SQLite hands dates back as text. Turn them back into dates.
+#-------------------------------------------------------------------------------
+
+    if isinstance(value, str):
+        if dateOnly.match(value):
+            return (datetime.date.fromisoformat(value))
+        if dateTime.match(value):
+            return (datetime.datetime.fromisoformat(value))
+
+    return (value)
+
+def sqliteToDatetime(value):
+#-------------------------------------------------------------------------------
+# Name:        Function - sqliteToDatetime
+# Purpose:  Reads a stored date or datetime string.
+#-------------------------------------------------------------------------------
+
+    if value == None:
+        return (None)
+
+    return (datetime.datetime.fromisoformat('{}'.format(value)))
+
+def sqliteGetDate():
+#-------------------------------------------------------------------------------
+# Name:        Function - sqliteGetDate
+# Purpose:  T-SQL getdate.
+#-------------------------------------------------------------------------------
+
+    return (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'))
+
+def sqliteNewID():
+#-------------------------------------------------------------------------------
+# Name:        Function - sqliteNewID
+# Purpose:  T-SQL newid.
+#-------------------------------------------------------------------------------
+
+    return (str(uuid.uuid4()).upper())
+
+def sqliteDateAdd(datePart, number, value):
+#-------------------------------------------------------------------------------
+# Name:        Function - sqliteDateAdd
+# Purpose:  T-SQL dateadd for the parts these scripts use.
+#-------------------------------------------------------------------------------
+
+    value = sqliteToDatetime(value)
+    if value == None:
+        return (None)
+
+    datePart = datePart.lower()
+    if datePart in ('day', 'dd', 'd'):
+        value = value + datetime.timedelta(days=number)
+    elif datePart in ('week', 'wk', 'ww'):
+        value = value + datetime.timedelta(weeks=number)
+    elif datePart in ('hour', 'hh'):
+        value = value + datetime.timedelta(hours=number)
+    elif datePart in ('minute', 'mi', 'n'):
+        value = value + datetime.timedelta(minutes=number)
+    elif datePart in ('second', 'ss', 's'):
+        value = value + datetime.timedelta(seconds=number)
+    else:
+        raise ValueError('dateadd part not supported:  {}'.format(datePart))
+
+    return (value.strftime('%Y-%m-%d %H:%M:%S.%f'))
+
+def sqliteDatePart(datePart, value):
+#-------------------------------------------------------------------------------
+# Name:        Function - sqliteDatePart
+# Purpose:  T-SQL datepart. Weeks start Sunday with Jan 1st in week 1.
+#-------------------------------------------------------------------------------
+
+    value = sqliteToDatetime(value)
+    if value == None:
+        return (None)
+
+    datePart = datePart.lower()
+    if datePart in ('year', 'yy', 'yyyy'):
+        return (value.year)
+    elif datePart in ('month', 'mm', 'm'):
+        return (value.month)
+    elif datePart in ('week', 'wk', 'ww'):
+        return (int(value.strftime('%U')) + 1)
+    elif datePart in ('day', 'dd', 'd'):
+        return (value.day)
+
+    raise ValueError('datepart part not supported:  {}'.format(datePart))
+
+def sqliteCharIndex(findText, searchText):
+#-------------------------------------------------------------------------------
+# Name:        Function - sqliteCharIndex
+# Purpose:  T-SQL charindex, 1 based and 0 when not found.
+#-------------------------------------------------------------------------------
+
+    if findText == None or searchText == None:
+        return (None)
+
+    return (searchText.find(findText) + 1)
+
+def sqliteLeft(text, length):
+#-------------------------------------------------------------------------------
+# Name:        Function - sqliteLeft
+# Purpose:  T-SQL left.
+#-------------------------------------------------------------------------------
+
+    if text == None or length == None:
+        return (None)
+
+    return (text[:max(length, 0)])
+
+def sqliteConcat(*values):
+#-------------------------------------------------------------------------------
+# Name:        Function - sqliteConcat
+# Purpose:  T-SQL concat, NULLs count as empty text. Use it rather than + to
+#           join strings, since + is always addition in SQLite.
+#-------------------------------------------------------------------------------
+
+    return (''.join(['{}'.format(value) for value in values if value != None]))
+
+class SQLiteConnection:
+#-------------------------------------------------------------------------------
+# Name:        Class - SQLiteConnection
+# Purpose:  Looks enough like a pyodbc connection for the scripts.
+#-------------------------------------------------------------------------------
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self):
+        return (SQLiteCursor(self.conn.cursor()))
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+class SQLiteCursor:
+#-------------------------------------------------------------------------------
+# Name:        Class - SQLiteCursor
+# Purpose:  Translates each statement and converts dates on the way out.
+#-------------------------------------------------------------------------------
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    @property
+    def rowcount(self):
+        return (self.cursor.rowcount)
+
+    @property
+    def description(self):
+        return (self.cursor.description)
+
+    def execute(self, sqlCommand, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self.cursor.execute(translateSQL(sqlCommand), params)
+        return (self)
+
+    def executemany(self, sqlCommand, rows):
+        self.cursor.executemany(translateSQL(sqlCommand), rows)
+        return (self)
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row == None:
+            return (None)
+        return (tuple(convertValue(value) for value in row))
+
+    def fetchmany(self, size):
+        return ([tuple(convertValue(value) for value in row) for row in self.cursor.fetchmany(size)])
+
+    def fetchall(self):
+        return ([tuple(convertValue(value) for value in row) for row in self.cursor.fetchall()])
+
+    def __iter__(self):
+        for row in self.cursor:
+            yield tuple(convertValue(value) for value in row)
+
+    def close(self):
+        self.cursor.close()
+
+class TimedConnection:
+#-------------------------------------------------------------------------------
+# Name:        Class - TimedConnection
+# Purpose:  Wraps a connection so every statement & commit gets timed.
+#-------------------------------------------------------------------------------
+
+    def __init__(self, conn, statementTimer):
+        self.conn = conn
+        self.statementTimer = statementTimer
+
+    def cursor(self):
+        return (TimedCursor(self.conn.cursor(), self.statementTimer))
+
+    def commit(self):
+        commitStart = time.time()
+        self.conn.commit()
+        self.statementTimer('commit', time.time() - commitStart, 0)
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+class TimedCursor:
+#-------------------------------------------------------------------------------
+# Name:        Class - TimedCursor
+# Purpose:  Times execute & executemany by statement class. Anything else is
+#           passed straight through to the real cursor.
+#-------------------------------------------------------------------------------
+
+    def __init__(self, cursor, statementTimer):
+        self.__dict__['cursor'] = cursor
+        self.__dict__['statementTimer'] = statementTimer
+
+    def __getattr__(self, name):
+        return (getattr(self.cursor, name))
+
+    def __setattr__(self, name, value):
+        setattr(self.cursor, name, value)
+
+    def __iter__(self):
+        return (iter(self.cursor))
+
+    def execute(self, sqlCommand, *params):
+        return (self.timeStatement(sqlCommand, self.cursor.execute, sqlCommand, *params))
+
+    def executemany(self, sqlCommand, rows):
+        return (self.timeStatement(sqlCommand, self.cursor.executemany, sqlCommand, rows))
+
+    def timeStatement(self, sqlCommand, statementFunction, *statementArgs):
+        statementStart = time.time()
+        try:
+            statementFunction(*statementArgs)
+        except Exception:
+            self.statementTimer(statementClass(sqlCommand), time.time() - statementStart, 1)
+            raise
+        self.statementTimer(statementClass(sqlCommand), time.time() - statementStart, 0)
+        return (self)